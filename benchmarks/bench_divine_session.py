@@ -0,0 +1,86 @@
+"""GR2 conversion: one divine launch per file vs. a conversion session.
+
+Runs the addon's conversion code against benchmarks/fake_divine.py, which
+emulates divine's command line and startup cost, and compares launching
+divine once per file with converting all files in one session, serially and
+with one divine process per CPU core.
+
+Usage: python benchmarks/bench_divine_session.py [file count] [workers]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_addon_module, script_args  # noqa: E402
+
+divine = load_addon_module("divine")
+helpers = load_addon_module("helpers")
+
+FAKE_DIVINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_divine.py")
+
+
+def make_jobs(directory, count, tag):
+    jobs = []
+    for i in range(count):
+        source = os.path.join(directory, "model{}.dae".format(i))
+        with open(source, "w") as f:
+            f.write("<COLLADA/>\n")
+        destination = os.path.join(directory, "model{}-{}.gr2".format(i, tag))
+        jobs.append(divine.ConversionJob(source, destination, "dae", "gr2", "dos2de", []))
+    return jobs
+
+
+def per_file(invoker, jobs):
+    launches = 0
+    for job in jobs:
+        session = divine.ConversionSession(invoker)
+        session.add(job)
+        session.run()
+        launches += session.launches
+    return launches
+
+
+def batched(invoker, jobs, workers=1):
+    session = divine.ConversionSession(invoker, workers)
+    for job in jobs:
+        session.add(job)
+    session.run()
+    return session.launches
+
+
+def main():
+    args = script_args()
+    count = int(args[0]) if args else 20
+    workers = int(args[1]) if len(args) > 1 else divine.default_conversion_workers()
+    helpers.IS_TRACING = False
+    invoker = divine.DivineInvoker(types.SimpleNamespace(lslib_path=FAKE_DIVINE), None)
+
+    print("{:>12} {:>9} {:>10} {:>9}".format("mode", "launches", "seconds", "speedup"))
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = None
+        modes = (("per-file", per_file),
+                 ("session", batched),
+                 ("session x{}".format(workers), lambda invoker, jobs: batched(invoker, jobs, workers)))
+        for name, fn in modes:
+            jobs = make_jobs(directory, count, name.replace(" ", ""))
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, "w")
+            try:
+                start = time.perf_counter()
+                launches = fn(invoker, jobs)
+                elapsed = time.perf_counter() - start
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            if not all(job.success and os.path.isfile(job.destination) for job in jobs):
+                raise AssertionError("{}: not every file was converted".format(name))
+            baseline = baseline or elapsed
+            print("{:>12} {:>9} {:>10.3f} {:>8.1f}x".format(name, launches, elapsed, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Whole-export benchmark on generated scenes.
+
+Builds synthetic scenes in a headless Blender session, exports each one
+through the Collada export operator and records how long every pipeline
+stage took. GR2 conversion goes through benchmarks/fake_divine.py, so no
+external tools are needed.
+
+    blender -b --factory-startup -P benchmarks/bench_export_pipeline.py -- \\
+        [--vertices 10000 100000] [--uv-layers 1 2] [--bones 64] [--frames 60] \\
+        [--gr2] [--repeat 3] [--output results.json]
+
+Every combination of the scene parameters is one case. A mesh with 0
+vertices, or an armature with 0 bones, leaves that object out; with 0
+frames no action is exported. The results of two runs (for example of two
+commits) can be compared with a plain Python interpreter:
+
+    python benchmarks/bench_export_pipeline.py --compare old.json new.json
+
+Stage times are the total of every call, outermost calls only. Stages nest
+(export_mesh runs inside export_scene, which runs inside save), so they
+don't add up to the total.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import bmesh
+    import bpy
+except ImportError:
+    # Only --compare works outside of Blender
+    bpy = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import REPO_DIR, script_args  # noqa: E402
+
+RESULTS_VERSION = 1
+FAKE_DIVINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_divine.py")
+
+
+class StageTimer:
+    """Wraps methods so the time spent in them is added up per stage."""
+
+    __slots__ = ("stages", "depth", "patched")
+
+    def __init__(self):
+        self.stages = {}
+        self.depth = {}
+        self.patched = []
+
+    def wrap(self, owner, attr, name=None):
+        name = name or attr
+        original = getattr(owner, attr)
+        timer = self
+
+        def timed(*args, **kwargs):
+            # Recursive calls are part of the outermost one
+            depth = timer.depth.get(name, 0)
+            timer.depth[name] = depth + 1
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timer.depth[name] = depth
+                if depth == 0:
+                    stage = timer.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+                    stage["seconds"] += time.perf_counter() - start
+                    stage["calls"] += 1
+
+        setattr(owner, attr, timed)
+        self.patched.append((owner, attr, original))
+
+    def reset(self):
+        self.stages = {}
+        self.depth = {}
+
+    def restore(self):
+        for owner, attr, original in reversed(self.patched):
+            setattr(owner, attr, original)
+        self.patched = []
+
+
+def instrument(timer):
+    from io_scene_dos2de import divine, export_dae, operators_dae, section_writer
+
+    operator = operators_dae.DIVINITYEXPORTER_OT_export_collada
+    timer.wrap(operators_dae.ExportTargetCollector, "collect", "collect_targets")
+    timer.wrap(operator, "make_copy_recursive", "copy_objects")
+    timer.wrap(operator, "update_hierarchy")
+    timer.wrap(operator, "apply_all_object_transforms", "apply_transforms")
+    timer.wrap(export_dae, "save", "save")
+    exporter = export_dae.DaeExporter
+    for attr in ("export_asset", "export_scene", "export_mesh", "export_armature_node",
+                 "purge_empty_nodes", "export_animations", "export_animation"):
+        timer.wrap(exporter, attr)
+    timer.wrap(section_writer.SectionWriter, "write_to", "write_file")
+    timer.wrap(divine.DivineInvoker, "convert", "divine_convert")
+
+
+def enable_addon():
+    import addon_utils
+
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    addon_utils.enable("io_scene_dos2de", default_set=False, persistent=True)
+    prefs = bpy.context.preferences.addons["io_scene_dos2de"].preferences
+    prefs.lslib_path = FAKE_DIVINE
+    # Every run has to pay for the conversion
+    prefs.conversion_cache_size = 0
+    prefs.geometry_cache_size = 0
+    os.environ.setdefault("FAKE_DIVINE_STARTUP", "0.1")
+    os.environ.setdefault("FAKE_DIVINE_FILE_TIME", "0.01")
+
+
+def clear_scene():
+    # Reloading the factory settings would unregister the addon
+    bpy.data.batch_remove(list(bpy.data.objects) + list(bpy.data.meshes)
+                          + list(bpy.data.armatures) + list(bpy.data.actions))
+
+
+def build_armature(bone_count):
+    """A fan of bone chains, four bones deep."""
+    data = bpy.data.armatures.new("BenchSkeleton")
+    armature = bpy.data.objects.new("BenchSkeleton", data)
+    bpy.context.scene.collection.objects.link(armature)
+    bpy.context.view_layer.objects.active = armature
+    bpy.ops.object.mode_set(mode="EDIT")
+    bones = []
+    for i in range(bone_count):
+        bone = data.edit_bones.new("Bone_{:03}".format(i))
+        chain, link = divmod(i, 4)
+        angle = chain * 2.0 * math.pi / max(math.ceil(bone_count / 4), 1)
+        if link == 0:
+            bone.head = (0.0, 0.0, 1.0)
+        else:
+            bone.head = bones[i - 1].tail
+            bone.parent = bones[i - 1]
+            bone.use_connect = True
+        bone.tail = (bone.head[0] + 0.25 * math.cos(angle), bone.head[1] + 0.25 * math.sin(angle), bone.head[2] + 0.1)
+        bones.append(bone)
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return armature
+
+
+def build_mesh(vertex_count, uv_layers, armature):
+    """A grid with about vertex_count vertices, each weighted to two bones."""
+    side = max(2, int(math.ceil(math.sqrt(vertex_count))))
+    mesh = bpy.data.meshes.new("BenchMesh")
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments=side - 1, y_segments=side - 1, size=2.0, calc_uvs=False)
+    bm.to_mesh(mesh)
+    bm.free()
+
+    loop_count = len(mesh.loops)
+    rng = np.random.default_rng(0)
+    for i in range(uv_layers):
+        layer = mesh.uv_layers.new(name="UVMap" if i == 0 else "UVMap.{:03}".format(i))
+        layer.data.foreach_set("uv", rng.random(loop_count * 2, dtype=np.float32))
+
+    obj = bpy.data.objects.new("BenchMesh", mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    if armature is None:
+        return obj
+
+    bones = armature.data.bones
+    obj.parent = armature
+    modifier = obj.modifiers.new("Armature", "ARMATURE")
+    modifier.object = armature
+    groups = [obj.vertex_groups.new(name=bone.name) for bone in bones]
+    vertex_total = len(mesh.vertices)
+    # Two neighbouring bones per band of vertices
+    band = max(1, vertex_total // len(groups))
+    for i, group in enumerate(groups):
+        first = i * band
+        last = vertex_total if i == len(groups) - 1 else min(vertex_total, first + band * 2)
+        group.add(list(range(first, last)), 0.5, "REPLACE")
+    return obj
+
+
+def build_action(armature, frame_count):
+    """Keys every bone's rotation and location on every frame."""
+    action = bpy.data.actions.new("BenchAction")
+    armature.animation_data_create().action = action
+    frames = np.arange(1, frame_count + 1, dtype=np.float32)
+    rng = np.random.default_rng(1)
+    for bone in armature.pose.bones:
+        bone.rotation_mode = "QUATERNION"
+        channels = [("rotation_quaternion", 4), ("location", 3)]
+        for path, size in channels:
+            data_path = 'pose.bones["{}"].{}'.format(bone.name, path)
+            for index in range(size):
+                fcurve = action.fcurves.new(data_path, index=index, action_group=bone.name)
+                fcurve.keyframe_points.add(frame_count)
+                values = rng.normal(1.0 if path == "rotation_quaternion" and index == 0 else 0.0, 0.1, frame_count)
+                co = np.empty(frame_count * 2, dtype=np.float32)
+                co[0::2] = frames
+                co[1::2] = values
+                fcurve.keyframe_points.foreach_set("co", co)
+                fcurve.update()
+    scene = bpy.context.scene
+    scene.frame_start = 1
+    scene.frame_end = frame_count
+    return action
+
+
+def build_scene(case):
+    clear_scene()
+    armature = build_armature(case["bones"]) if case["bones"] > 0 else None
+    if case["vertices"] > 0:
+        build_mesh(case["vertices"], case["uv_layers"], armature)
+    if armature is not None and case["frames"] > 0:
+        build_action(armature, case["frames"])
+
+
+def export(case, directory):
+    path = os.path.join(directory, "bench.gr2" if case["gr2"] else "bench.dae")
+    args = {
+        "filepath": path,
+        "object_types": {"ARMATURE", "MESH"},
+        "use_export_selected": False,
+        "use_export_visible": False,
+        "use_active_layers": False,
+        "use_normalize_vert_groups": True,
+        "use_triangles": True,
+        "use_anim": case["frames"] > 0 and case["bones"] > 0,
+        "yup_enabled": "ROTATE",
+    }
+    result = bpy.ops.export_scene.dos2de_collada("EXEC_DEFAULT", **args)
+    if result != {"FINISHED"} or not os.path.isfile(path):
+        raise RuntimeError("Export did not produce '{}'".format(path))
+    size = os.path.getsize(path)
+    os.unlink(path)
+    return size
+
+
+def run_case(case, repeat, timer, directory):
+    build_scene(case)
+    best = None
+    for _ in range(repeat):
+        timer.reset()
+        start = time.perf_counter()
+        size = export(case, directory)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best["total"]:
+            best = {"total": elapsed, "stages": timer.stages, "output_size": size}
+    return dict(params=case, **best)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    enable_addon()
+    from io_scene_dos2de import helpers
+    helpers.IS_TRACING = False
+
+    cases = [{"vertices": v, "uv_layers": k, "bones": b, "frames": f, "gr2": args.gr2}
+             for v, k, b, f in itertools.product(args.vertices, args.uv_layers, args.bones, args.frames)]
+    timer = StageTimer()
+    instrument(timer)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for case in cases:
+                result = run_case(case, args.repeat, timer, directory)
+                results.append(result)
+                print("{vertices:>8} verts {uv_layers} uv {bones:>4} bones {frames:>4} frames: {total:.3f}s".format(
+                    total=result["total"], **case))
+    finally:
+        timer.restore()
+
+    report = {
+        "version": RESULTS_VERSION,
+        "commit": git_commit(),
+        "blender": bpy.app.version_string,
+        "repeat": args.repeat,
+        "cases": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print_stages(results)
+
+
+def print_stages(results):
+    for result in results:
+        print("\n{vertices} vertices, {uv_layers} UV layers, {bones} bones, {frames} frames".format(**result["params"]))
+        for name, stage in sorted(result["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            print("  {:<24} {:>9.4f}s {:>6} calls".format(name, stage["seconds"], stage["calls"]))
+
+
+def case_key(params):
+    return tuple(sorted(params.items()))
+
+
+def compare(old_path, new_path):
+    """Prints the new times of every case and stage relative to the old ones."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    old_cases = {case_key(case["params"]): case for case in old["cases"]}
+    print("{} -> {}".format(old.get("commit"), new.get("commit")))
+    for case in new["cases"]:
+        before = old_cases.get(case_key(case["params"]))
+        if before is None:
+            continue
+        print("\n{vertices} vertices, {uv_layers} UV layers, {bones} bones, {frames} frames".format(**case["params"]))
+        rows = [("total", before["total"], case["total"])]
+        for name, stage in sorted(case["stages"].items()):
+            if name in before["stages"]:
+                rows.append((name, before["stages"][name]["seconds"], stage["seconds"]))
+        for name, old_time, new_time in rows:
+            print("  {:<24} {:>9.4f}s {:>9.4f}s {:>7.2f}x".format(
+                name, old_time, new_time, old_time / new_time if new_time > 0 else float("inf")))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="bench_export_pipeline.py", description=__doc__.splitlines()[0])
+    parser.add_argument("--vertices", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--uv-layers", type=int, nargs="+", default=[1])
+    parser.add_argument("--bones", type=int, nargs="+", default=[64])
+    parser.add_argument("--frames", type=int, nargs="+", default=[60])
+    parser.add_argument("--gr2", action="store_true", help="Export to GR2 through the stand-in divine")
+    parser.add_argument("--repeat", type=int, default=1, help="Keep the fastest of this many exports per case")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main(script_args())
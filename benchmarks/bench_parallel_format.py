@@ -0,0 +1,93 @@
+"""Section formatting: serial vs. the worker pool.
+
+Formats a set of synthetic meshes and animation channels into sections,
+once serially and once per worker count, and checks the output is identical.
+
+Usage: python benchmarks/bench_parallel_format.py [worker counts...]
+"""
+
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_addon_module, script_args  # noqa: E402
+
+fragments = load_addon_module("fragments")
+mesh_data = load_addon_module("mesh_data")
+section_writer = load_addon_module("section_writer")
+worker_pool = load_addon_module("worker_pool")
+
+MESH_COUNT = 12
+MESH_VERTICES = 60_000
+BONE_COUNT = 120
+FRAME_COUNT = 60
+
+S_GEOM = 4
+S_ANIM = 12
+
+
+def make_mesh(rng):
+    vertices = mesh_data.VertexBuffer()
+    vertices.source_loops = np.arange(MESH_VERTICES)
+    vertices.positions = rng.random((MESH_VERTICES, 3), dtype=np.float32)
+    vertices.normals = rng.random((MESH_VERTICES, 3), dtype=np.float32)
+    vertices.tangents = rng.random((MESH_VERTICES, 3), dtype=np.float32)
+    vertices.bitangents = rng.random((MESH_VERTICES, 3), dtype=np.float32)
+    vertices.uvs = [rng.random((MESH_VERTICES, 2), dtype=np.float32)]
+    indices = rng.integers(0, MESH_VERTICES, MESH_VERTICES * 3)
+    surfaces = [(0, np.full(MESH_VERTICES, 3), indices)]
+    return vertices, surfaces
+
+
+def make_channels(rng):
+    times = (np.arange(FRAME_COUNT) / 30.0).tolist()
+    return [("id-anim-{}".format(i), "bone-{}".format(i), times,
+             rng.random((FRAME_COUNT, 4, 4)), True) for i in range(BONE_COUNT)]
+
+
+def export(pool, meshes, channels):
+    sections = section_writer.SectionWriter()
+    for i, (vertices, surfaces) in enumerate(meshes):
+        value_count = vertices.value_count() + len(surfaces[0][2])
+        sections.write_task(S_GEOM, pool.submit(
+            value_count, fragments.geometry, "id-mesh-{}".format(i), "Mesh", vertices, surfaces, True))
+    sections.write_task(S_ANIM, pool.submit(
+        BONE_COUNT * FRAME_COUNT * 17, fragments.animation_channels, channels))
+
+    out = io.BytesIO()
+    sections.write_to(out)
+    sections.close()
+    return out.getvalue()
+
+
+def main():
+    worker_counts = [int(a) for a in script_args()] or [2, 4, worker_pool.default_worker_count()]
+    rng = np.random.default_rng(0)
+    meshes = [make_mesh(rng) for _ in range(MESH_COUNT)]
+    channels = make_channels(rng)
+
+    start = time.perf_counter()
+    serial = export(worker_pool.FormatPool(1), meshes, channels)
+    serial_time = time.perf_counter() - start
+    print("{:>8} {:>10} {:>9}".format("workers", "seconds", "speedup"))
+    print("{:>8} {:>10.3f} {:>8.1f}x".format(1, serial_time, 1.0))
+
+    for workers in worker_counts:
+        pool = worker_pool.FormatPool(workers)
+        # Start the workers outside of the measurement, like a second export would
+        pool.submit(worker_pool.MIN_PARALLEL_VALUES, len, "").result()
+        start = time.perf_counter()
+        parallel = export(pool, meshes, channels)
+        elapsed = time.perf_counter() - start
+        if parallel != serial:
+            raise AssertionError("Output with {} workers differs from serial output".format(workers))
+        print("{:>8} {:>10.3f} {:>8.1f}x".format(workers, elapsed, serial_time / elapsed))
+        worker_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
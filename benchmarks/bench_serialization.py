@@ -0,0 +1,82 @@
+"""Collada payload serialization: string concatenation vs. serialization module.
+
+Reports seconds per million values. Usage:
+    python benchmarks/bench_serialization.py [value counts...]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_addon_module, measure, script_args  # noqa: E402
+
+serialization = load_addon_module("serialization")
+
+
+def concat_floats(values):
+    """The previous pattern: float_values += " {} {} {}".format(...)"""
+    float_values = ""
+    for i in range(0, len(values), 3):
+        float_values += " {} {} {}".format(values[i], values[i + 1], values[i + 2])
+    return float_values
+
+
+def concat_ints(values):
+    int_values = ""
+    for i in values:
+        int_values += " {}".format(i)
+    return int_values
+
+
+def strmtx(mtx):
+    """The previous per-matrix writer, called once per bone and key."""
+    s = ""
+    for x in range(4):
+        for y in range(4):
+            s += "{} ".format(mtx[x][y])
+    s = " {} ".format(s)
+    return s
+
+
+def concat_matrices(matrices):
+    return " ".join(strmtx(m) for m in matrices)
+
+
+def main():
+    sizes = [int(a) for a in script_args()] or [300_000, 3_000_000]
+    rng = np.random.default_rng(0)
+    print("{:>10} {:>10} {:>14} {:>14} {:>9}".format(
+        "values", "kind", "concat s/M", "module s/M", "speedup"))
+
+    for count in sizes:
+        floats = rng.standard_normal(count).astype(np.float32)
+        ints = rng.integers(0, 100_000, count)
+
+        text, module_time, _ = measure(serialization.float_array, floats, trace_memory=False)
+        if not np.array_equal(np.array(text.split(), dtype=np.float32), floats):
+            raise AssertionError("float_array does not round-trip")
+        _, concat_time, _ = measure(concat_floats, floats.tolist(), trace_memory=False)
+        scale = 1e6 / count
+        print("{:>10} {:>10} {:>14.3f} {:>14.3f} {:>8.1f}x".format(
+            count, "float", concat_time * scale, module_time * scale, concat_time / module_time))
+
+        text, module_time, _ = measure(serialization.int_array, ints, trace_memory=False)
+        if text.split() != [str(i) for i in ints.tolist()]:
+            raise AssertionError("int_array mismatch")
+        _, concat_time, _ = measure(concat_ints, ints.tolist(), trace_memory=False)
+        print("{:>10} {:>10} {:>14.3f} {:>14.3f} {:>8.1f}x".format(
+            count, "int", concat_time * scale, module_time * scale, concat_time / module_time))
+
+        matrices = floats[:count // 16 * 16].reshape(-1, 4, 4)
+        text, module_time, _ = measure(serialization.matrix_array, matrices, trace_memory=False)
+        if not np.array_equal(np.array(text.split(), dtype=np.float32), matrices.ravel()):
+            raise AssertionError("matrix_array does not round-trip")
+        _, concat_time, _ = measure(concat_matrices, matrices.tolist(), trace_memory=False)
+        print("{:>10} {:>10} {:>14.3f} {:>14.3f} {:>8.1f}x".format(
+            count, "matrix", concat_time * scale, module_time * scale, concat_time / module_time))
+
+
+if __name__ == "__main__":
+    main()
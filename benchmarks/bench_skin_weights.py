@@ -0,0 +1,120 @@
+"""Skin weights: per-loop vertex group resolution vs. the per-vertex lookup table.
+
+Usage: python benchmarks/bench_skin_weights.py [vertex counts...]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_addon_module, measure, script_args  # noqa: E402
+
+mesh_data = load_addon_module("mesh_data")
+
+LOOPS_PER_VERTEX = 6
+GROUP_COUNT = 80
+BONE_COUNT = 64
+
+
+class VertexGroup:
+    __slots__ = ("index", "name")
+
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+
+
+class GroupElement:
+    __slots__ = ("group", "weight")
+
+    def __init__(self, group, weight):
+        self.group = group
+        self.weight = weight
+
+
+class MeshVertex:
+    __slots__ = ("index", "groups")
+
+    def __init__(self, index, groups):
+        self.index = index
+        self.groups = groups
+
+
+class Mesh:
+    def __init__(self, vertices):
+        self.vertices = vertices
+
+
+def make_skinned_mesh(vertex_count, seed=0):
+    """Vertices with 1-4 groups each; a few groups are not bones."""
+    rng = np.random.default_rng(seed)
+    vertex_groups = [VertexGroup(i, "group_{}".format(i)) for i in range(GROUP_COUNT)]
+    bone_index = {"group_{}".format(i): i for i in range(BONE_COUNT)}
+
+    vertices = []
+    for i in range(vertex_count):
+        groups = rng.choice(GROUP_COUNT, rng.integers(1, 5), replace=False).tolist()
+        weights = rng.random(len(groups)).tolist()
+        vertices.append(MeshVertex(i, [GroupElement(g, w) for g, w in zip(groups, weights)]))
+
+    loop_vertices = rng.integers(0, vertex_count, vertex_count * LOOPS_PER_VERTEX).tolist()
+    return vertex_groups, bone_index, Mesh(vertices), loop_vertices
+
+
+def per_loop_skin(vertex_groups, bone_index, mesh, loop_vertices):
+    """The previous algorithm: groups are resolved by name for every loop."""
+    skins = []
+    for v in loop_vertices:
+        mv = mesh.vertices[v]
+        bones = ()
+        weights = ()
+        for vg in mv.groups:
+            if vg.group >= len(vertex_groups):
+                continue
+            name = vertex_groups[vg.group].name
+            if name in bone_index and vg.weight > 0.001:
+                bones += (bone_index[name], )
+                weights += (vg.weight, )
+        if not bones:
+            bones = (0, )
+            weights = (1, )
+        skins.append((bones, weights))
+    return skins
+
+
+def dense_skin(vertex_groups, bone_index, mesh):
+    group_bones = mesh_data.group_bone_lookup(vertex_groups, bone_index)
+    vertices, groups, weights = mesh_data.extract_vertex_groups(mesh)
+    skin = mesh_data.build_skin_weights(len(mesh.vertices), vertices, groups, weights, group_bones)
+    unassigned = skin.counts == 0
+    skin.bones[unassigned, 0] = 0
+    skin.weights[unassigned, 0] = 1.0
+    skin.counts[unassigned] = 1
+    return skin
+
+
+def main():
+    sizes = [int(a) for a in script_args()] or [10_000, 100_000]
+    print("{:>10} {:>12} {:>12} {:>9}".format("vertices", "per loop s", "dense s", "speedup"))
+    for vertex_count in sizes:
+        vertex_groups, bone_index, mesh, loop_vertices = make_skinned_mesh(vertex_count)
+
+        skins, loop_time, _ = measure(
+            per_loop_skin, vertex_groups, bone_index, mesh, loop_vertices, trace_memory=False)
+        skin, dense_time, _ = measure(
+            dense_skin, vertex_groups, bone_index, mesh, trace_memory=False)
+
+        for v, (bones, weights) in zip(loop_vertices, skins):
+            count = skin.counts[v]
+            if (tuple(skin.bones[v, :count].tolist()) != bones
+                    or not np.allclose(skin.weights[v, :count], weights)):
+                raise AssertionError("Skin weights differ at vertex {}".format(v))
+
+        print("{:>10} {:>12.4f} {:>12.4f} {:>8.1f}x".format(
+            vertex_count, loop_time, dense_time, loop_time / dense_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Vertex deduplication: the previous Vertex/get_tup + dict loop vs. the packed array path.
+
+The baseline needs mathutils, which is there inside Blender and can be
+installed from PyPI for a plain interpreter; without it only the array path
+is measured.
+
+Usage: python benchmarks/bench_vertex_dedup.py [loop counts...]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_addon_module, script_args  # noqa: E402
+
+mesh_data = load_addon_module("mesh_data")
+
+try:
+    from mathutils import Vector
+except ImportError:
+    Vector = None
+
+UV_LAYERS = 2
+LOOPS_PER_VERTEX = 6
+
+
+def make_loop_attributes(loop_count, seed=0):
+    """A smooth-shaded mesh where each vertex is shared by ~6 loops."""
+    rng = np.random.default_rng(seed)
+    vertex_count = max(1, loop_count // LOOPS_PER_VERTEX)
+
+    attrs = mesh_data.LoopAttributes()
+    attrs.vertex_indices = rng.integers(0, vertex_count, loop_count)
+    attrs.polygon_sizes = np.full(loop_count // 3, 3)
+    attrs.material_indices = np.zeros(loop_count // 3, dtype=np.int64)
+
+    def per_vertex(width):
+        return rng.random((vertex_count, width), dtype=np.float32)[attrs.vertex_indices]
+
+    attrs.positions = per_vertex(3)
+    attrs.normals = per_vertex(3)
+    attrs.tangents = per_vertex(3)
+    attrs.bitangents = per_vertex(3)
+    attrs.uvs = [per_vertex(2) for _ in range(UV_LAYERS)]
+    attrs.color = per_vertex(3)
+
+    # A handful of distinct influence sets, shared by many vertices
+    influence_sets = max(1, vertex_count // 4)
+    counts = rng.integers(1, mesh_data.MAX_INFLUENCES + 1, influence_sets)
+    slots = np.arange(mesh_data.MAX_INFLUENCES) < counts[:, None]
+    bones = np.where(slots, rng.integers(0, 64, slots.shape), -1).astype(np.int32)
+    weights = np.where(slots, rng.random(slots.shape), 0).astype(np.float32)
+    ids = rng.integers(0, influence_sets, vertex_count)
+    skin = mesh_data.SkinWeights(bones[ids], weights[ids], counts[ids])
+    return attrs, skin
+
+
+class FakeMesh:
+    """Per-loop Python values standing in for the Blender mesh the previous
+    exporter read loop by loop; built before measuring, like mesh data that
+    lives in Blender's memory."""
+
+    def __init__(self, attrs, skin):
+        self.vertex_indices = attrs.vertex_indices.tolist()
+        self.positions = attrs.positions.tolist()
+        self.normals = attrs.normals.tolist()
+        self.tangents = attrs.tangents.tolist()
+        self.bitangents = attrs.bitangents.tolist()
+        self.uvs = [uv.tolist() for uv in attrs.uvs]
+        self.colors = [c + [1.0] for c in attrs.color.tolist()]
+        self.groups = [list(zip(skin.bones[v, :skin.counts[v]].tolist(), skin.weights[v, :skin.counts[v]].tolist()))
+                       for v in range(len(skin))]
+
+
+class Vertex:
+    """export_dae's Vertex before the array path replaced it."""
+
+    def get_tup(self):
+        tup = (self.vertex.x, self.vertex.y, self.vertex.z, self.normal.x,
+               self.normal.y, self.normal.z)
+        for t in self.uv:
+            tup = tup + (t.x, t.y)
+        if self.color is not None:
+            tup = tup + (self.color.x, self.color.y, self.color.z)
+        if self.tangent is not None:
+            tup = tup + (self.tangent.x, self.tangent.y, self.tangent.z)
+        if self.bitangent is not None:
+            tup = tup + (self.bitangent.x, self.bitangent.y,
+                         self.bitangent.z)
+        for t in self.bones:
+            tup = tup + (float(t), )
+        for t in self.weights:
+            tup = tup + (float(t), )
+
+        return tup
+
+    __slots__ = ("vertex", "normal", "tangent", "bitangent", "color", "uv",
+                 "uv2", "bones", "weights")
+
+    def __init__(self):
+        self.vertex = Vector((0.0, 0.0, 0.0))
+        self.normal = Vector((0.0, 0.0, 0.0))
+        self.tangent = None
+        self.bitangent = None
+        self.color = None
+        self.uv = []
+        self.uv2 = Vector((0.0, 0.0))
+        self.bones = []
+        self.weights = []
+
+
+def baseline_dedup(mesh):
+    """The per-loop body of the previous export_mesh, reading from a FakeMesh."""
+    vertices = []
+    vertex_map = {}
+    loop_vertices = []
+    for loop_index, vertex_index in enumerate(mesh.vertex_indices):
+        v = Vertex()
+        v.vertex = Vector(mesh.positions[loop_index])
+
+        for xt in mesh.uvs:
+            v.uv.append(Vector(xt[loop_index]))
+
+        v.color = Vector(mesh.colors[loop_index])
+        v.normal = Vector(mesh.normals[loop_index])
+        v.tangent = Vector(mesh.tangents[loop_index])
+        v.bitangent = Vector(mesh.bitangents[loop_index])
+
+        for bone, weight in mesh.groups[vertex_index]:
+            if (weight > 0.001):
+                v.bones.append(bone)
+                v.weights.append(weight)
+
+        tup = v.get_tup()
+        if tup in vertex_map:
+            idx = vertex_map[tup]
+        else:
+            idx = len(vertices)
+            vertices.append(v)
+            vertex_map[tup] = idx
+        loop_vertices.append(idx)
+    return vertices, loop_vertices
+
+
+def timed(fn, make_args):
+    """Runs fn on fresh arguments; returns (result, seconds, peak traced bytes).
+    The arguments are made again under tracemalloc, so the peak includes
+    them and what fn frees of them."""
+    args = make_args()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    del args
+
+    tracemalloc.start()
+    fn(*make_args())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    sizes = [int(a) for a in script_args()] or [10_000, 100_000, 1_000_000]
+    print("{:>10} {:>12} {:>12} {:>12} {:>12} {:>9}".format(
+        "loops", "baseline s", "array s", "base MiB", "array MiB", "speedup"))
+    for loop_count in sizes:
+        # The array path consumes its loop attributes, so it gets fresh ones
+        # per run; extracting them is part of its memory cost
+        buf, array_time, array_peak = timed(
+            mesh_data.build_vertex_buffer, lambda: make_loop_attributes(loop_count))
+        if Vector is None:
+            print("{:>10} {:>12} {:>12.4f} {:>12} {:>12.1f} {:>9}".format(
+                loop_count, "-", array_time, "-", array_peak / 2**20, "-"))
+            continue
+
+        mesh = FakeMesh(*make_loop_attributes(loop_count))
+        (vertices, loop_vertices), base_time, base_peak = timed(baseline_dedup, lambda: (mesh, ))
+        if len(vertices) != len(buf) or buf.loop_vertices.tolist() != loop_vertices:
+            raise AssertionError("Deduplication results differ at {} loops".format(loop_count))
+        del vertices, loop_vertices
+
+        print("{:>10} {:>12.4f} {:>12.4f} {:>12.1f} {:>12.1f} {:>8.1f}x".format(
+            loop_count, base_time, array_time, base_peak / 2**20, array_peak / 2**20,
+            base_time / array_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Influence limiting and normalization: per-vertex loops vs. the vectorized arrays.
+
+The per-vertex version follows what Blender's Limit Total and Normalize All
+operators do to each vertex; both results are compared before timing is
+reported.
+
+Usage: python benchmarks/bench_weight_limits.py [vertex counts...]
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import load_addon_module, measure, script_args  # noqa: E402
+
+mesh_data = load_addon_module("mesh_data")
+
+GROUP_COUNT = 80
+MAX_GROUPS_PER_VERTEX = 8
+
+
+def make_vertex_groups(vertex_count, seed=0):
+    """Vertices with 1-8 assignments each, so about half are over the limit."""
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, MAX_GROUPS_PER_VERTEX + 1, vertex_count)
+    vertices = np.repeat(np.arange(vertex_count), counts)
+    groups = np.concatenate([rng.choice(GROUP_COUNT, c, replace=False) for c in counts])
+    weights = rng.random(len(vertices)).astype(np.float32)
+    locked = np.zeros(GROUP_COUNT, dtype=bool)
+    locked[:2] = True
+    return vertices, groups.astype(np.int64), weights, locked
+
+
+def per_vertex(vertex_count, vertices, groups, weights, locked):
+    firsts = np.searchsorted(vertices, np.arange(vertex_count + 1))
+    out_vertices, out_groups, out_weights = [], [], []
+    for v in range(vertex_count):
+        assigned = list(zip(groups[firsts[v]:firsts[v + 1]].tolist(),
+                            weights[firsts[v]:firsts[v + 1]].tolist()))
+        if len(assigned) > mesh_data.MAX_INFLUENCES:
+            assigned = sorted(assigned, key=lambda a: -a[1])[:mesh_data.MAX_INFLUENCES]
+
+        if len(assigned) == 1:
+            if not locked[assigned[0][0]]:
+                assigned = [(assigned[0][0], 1.0)]
+        else:
+            free = sum(w for g, w in assigned if not locked[g])
+            fixed = sum(w for g, w in assigned if locked[g])
+            if free > 0:
+                scale = max(1.0 - fixed, 0.0) / free
+                assigned = [(g, w if locked[g] else min(max(w * scale, 0.0), 1.0))
+                            for g, w in assigned]
+
+        for g, w in assigned:
+            out_vertices.append(v)
+            out_groups.append(g)
+            out_weights.append(w)
+    return np.array(out_vertices), np.array(out_groups), np.array(out_weights, dtype=np.float32)
+
+
+def vectorized(vertex_count, vertices, groups, weights, locked):
+    limited = mesh_data.limit_vertex_groups(vertex_count, vertices, groups, weights)
+    return mesh_data.normalize_vertex_groups(vertex_count, *limited, locked)
+
+
+def main():
+    sizes = [int(a) for a in script_args()] or [10_000, 100_000]
+    print("{:>10} {:>13} {:>13} {:>9}".format("vertices", "per vertex s", "vectorized s", "speedup"))
+    for vertex_count in sizes:
+        arrays = make_vertex_groups(vertex_count)
+
+        expected, loop_time, _ = measure(per_vertex, vertex_count, *arrays, trace_memory=False)
+        result, vector_time, _ = measure(vectorized, vertex_count, *arrays, trace_memory=False)
+
+        if (not np.array_equal(expected[0], result[0]) or not np.array_equal(expected[1], result[1])
+                or not np.allclose(expected[2], result[2], atol=1e-6)):
+            raise AssertionError("Limited vertex groups differ")
+
+        print("{:>10} {:>13.4f} {:>13.4f} {:>8.1f}x".format(
+            vertex_count, loop_time, vector_time, loop_time / vector_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Shared helpers for the exporter benchmarks.
+
+The benchmarks can be run either from inside Blender
+(blender -b --factory-startup -P benchmarks/<script>.py) or, for the modules
+that don't depend on bpy, with a plain Python interpreter that has NumPy.
+"""
+
+import importlib
+import importlib.util
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_DIR = os.path.join(REPO_DIR, "io_scene_dos2de")
+
+
+def load_addon_module(name):
+    """Imports io_scene_dos2de.<name>. Outside Blender the package __init__,
+    which needs bpy, is skipped; this only works for modules that don't
+    import bpy themselves."""
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    if importlib.util.find_spec("bpy") is None and "io_scene_dos2de" not in sys.modules:
+        package = types.ModuleType("io_scene_dos2de")
+        package.__path__ = [ADDON_DIR]
+        sys.modules["io_scene_dos2de"] = package
+    return importlib.import_module("io_scene_dos2de." + name)
+
+
+def measure(fn, *args, repeat=1, trace_memory=True):
+    """Runs fn(*args) and returns (result, best time in seconds, peak traced bytes)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = 0
+    if trace_memory:
+        tracemalloc.start()
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def script_args():
+    """Returns the arguments after '--' when run through Blender, sys.argv[1:] otherwise."""
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--") + 1:]
+    return sys.argv[1:]
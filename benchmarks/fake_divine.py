@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Stand-in for divine.exe that emulates its command line and timing.
+
+Supports the convert-model and convert-models actions the addon uses. The
+"converted" file is a copy of the source. Sources that start with "BROKEN"
+fail like a bad model would.
+
+Timing is controlled with environment variables:
+    FAKE_DIVINE_STARTUP    seconds spent starting up (default 0.4)
+    FAKE_DIVINE_FILE_TIME  seconds spent per converted file (default 0.05)
+
+Point the LSLib path in the addon preferences at this script to use it.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+
+
+def convert(source, destination, file_time):
+    time.sleep(file_time)
+    with open(source, "rb") as f:
+        broken = f.read(6) == b"BROKEN"
+    if broken:
+        return "Failed to load model '{}': invalid data".format(source)
+    shutil.copyfile(source, destination)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-l", "--loglevel", default="info")
+    parser.add_argument("-g", "--game", required=True)
+    parser.add_argument("-s", "--source", required=True)
+    parser.add_argument("-d", "--destination", required=True)
+    parser.add_argument("-i", "--input-format")
+    parser.add_argument("-o", "--output-format")
+    parser.add_argument("-a", "--action", required=True)
+    parser.add_argument("-e", "--gr2-options", action="append", default=[])
+    args = parser.parse_args()
+
+    time.sleep(float(os.environ.get("FAKE_DIVINE_STARTUP", "0.4")))
+    file_time = float(os.environ.get("FAKE_DIVINE_FILE_TIME", "0.05"))
+
+    if args.action == "convert-model":
+        error = convert(args.source, args.destination, file_time)
+        if error is not None:
+            print("[FATAL] " + error)
+            return 1
+        print("[INFO] Converted '{}'".format(args.destination))
+        return 0
+
+    if args.action == "convert-models":
+        suffix = "." + args.input_format.lower()
+        for name in sorted(os.listdir(args.source)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() != suffix:
+                continue
+            destination = os.path.join(args.destination, stem + "." + args.output_format)
+            error = convert(os.path.join(args.source, name), destination, file_time)
+            if error is not None:
+                print("[ERROR] " + error)
+            else:
+                print("[INFO] Converted '{}'".format(destination))
+        return 0
+
+    print("[FATAL] Value {} is not allowed for action".format(args.action))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
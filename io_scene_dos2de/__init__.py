@@ -17,28 +17,54 @@
 
 if "bpy" in locals():
     import importlib
+    if "anim_sampling" in locals():
+        importlib.reload(anim_sampling) # noqa
+    if "batch" in locals():
+        importlib.reload(batch) # noqa
     if "collada" in locals():
         importlib.reload(collada) # noqa
+    if "conversion_cache" in locals():
+        importlib.reload(conversion_cache) # noqa
+    if "datablocks" in locals():
+        importlib.reload(datablocks) # noqa
     if "divine" in locals():
         importlib.reload(divine) # noqa
     if "export_dae" in locals():
         importlib.reload(export_dae) # noqa
+    if "fragments" in locals():
+        importlib.reload(fragments) # noqa
+    if "geometry_cache" in locals():
+        importlib.reload(geometry_cache) # noqa
     if "gltf" in locals():
         importlib.reload(gltf) # noqa
     if "helpers" in locals():
         importlib.reload(helpers) # noqa
+    if "keyframe_reduction" in locals():
+        importlib.reload(keyframe_reduction) # noqa
+    if "mesh_data" in locals():
+        importlib.reload(mesh_data) # noqa
     if "operators_dae" in locals():
         importlib.reload(operators_dae) # noqa
+    if "operators_divine" in locals():
+        importlib.reload(operators_divine) # noqa
     if "operators_gltf" in locals():
         importlib.reload(operators_gltf) # noqa
+    if "profiling" in locals():
+        importlib.reload(profiling) # noqa
     if "properties" in locals():
         importlib.reload(properties) # noqa
+    if "section_writer" in locals():
+        importlib.reload(section_writer) # noqa
+    if "serialization" in locals():
+        importlib.reload(serialization) # noqa
+    if "worker_pool" in locals():
+        importlib.reload(worker_pool) # noqa
 
 import bpy
 from bpy.types import Operator, AddonPreferences, PropertyGroup, UIList, Panel
 from bpy.props import StringProperty, BoolProperty, FloatProperty, EnumProperty, CollectionProperty, PointerProperty, IntProperty
 
-from . import export_dae, gltf, properties, helpers, operators_dae, operators_gltf
+from . import conversion_cache, export_dae, geometry_cache, gltf, properties, helpers, operators_dae, operators_divine, operators_gltf, worker_pool
 
 bl_info = {
     "name": "DOS2/BG3 Collada Exporter",
@@ -104,6 +130,24 @@ class DIVINITYEXPORTER_OT_remove_project(Operator):
 
         return {'FINISHED'}
 
+class DIVINITYEXPORTER_OT_clear_conversion_cache(Operator):
+    bl_idname = "divinityexporter.clear_conversion_cache"
+    bl_label = "Clear GR2 Cache"
+    bl_description = "Delete every cached GR2 conversion"
+
+    def execute(self, context):
+        conversion_cache.export_cache.clear()
+        return {'FINISHED'}
+
+class DIVINITYEXPORTER_OT_clear_import_cache(Operator):
+    bl_idname = "divinityexporter.clear_import_cache"
+    bl_label = "Clear Import Cache"
+    bl_description = "Delete every cached conversion of imported GR2 files"
+
+    def execute(self, context):
+        conversion_cache.import_cache.clear()
+        return {'FINISHED'}
+
 class DIVINITYEXPORTER_UL_project_list(UIList):
     def draw_item(self, context, layout, data, item, icon, active_data, active_propname):
         if self.layout_type in {'DEFAULT', 'COMPACT'}:
@@ -149,6 +193,65 @@ class DIVINITYEXPORTER_AddonPreferences(AddonPreferences):
         default=False
     )
 
+    geometry_cache_size: IntProperty(
+        name="Geometry Cache Size (MB)",
+        description="Exported geometry is kept in memory up to this size and reused by later exports of unchanged meshes. 0 disables the cache",
+        default=256,
+        min=0
+    )
+
+    format_workers: IntProperty(
+        name="Export Worker Processes",
+        description="Number of processes used to write out large meshes and animations. 0 picks one based on the number of CPU cores, 1 does all the work in Blender itself",
+        default=1,
+        min=0
+    )
+
+    background_conversion: BoolProperty(
+        name="Convert to GR2 in Background",
+        description="Keep Blender responsive while divine converts exported files. Progress is shown in the status bar, Esc cancels",
+        default=False
+    )
+
+    conversion_workers: IntProperty(
+        name="Parallel GR2 Conversions",
+        description="Number of divine processes run at the same time when converting several files. 0 uses one per CPU core",
+        default=0,
+        min=0
+    )
+
+    conversion_cache_size: IntProperty(
+        name="GR2 Cache Size (MB)",
+        description="Converted GR2 files are kept on disk up to this size and reused when the same file is exported with the same settings again. 0 disables the cache",
+        default=1024,
+        min=0
+    )
+
+    import_cache_size: IntProperty(
+        name="Import Cache Size (MB)",
+        description="GR2 files converted for importing are kept on disk up to this size and reused when the same file is imported with the same settings again. 0 disables the cache",
+        default=1024,
+        min=0
+    )
+
+    report_export_timings: BoolProperty(
+        name="Report Export Timings",
+        description="Show how long each stage of a Collada export took in the export report. They are always printed to the console when tracing",
+        default=False
+    )
+
+    track_export_memory: BoolProperty(
+        name="Track Export Memory",
+        description="Record the memory peak, the growth of Blender's memory use and the size of the largest structures for each stage of a Collada export, and show them in the export report. Makes exports slower",
+        default=False
+    )
+
+    profile_exports: BoolProperty(
+        name="Profile Exports",
+        description="Write a cProfile statistics file (.pstats) of every Collada export to the temporary folder",
+        default=False
+    )
+
     projects: PointerProperty(
         type=ProjectEntry,
         name="Projects",
@@ -162,6 +265,28 @@ class DIVINITYEXPORTER_AddonPreferences(AddonPreferences):
         layout.prop(self, "gr2_default_enabled")
         layout.prop(self, "default_preset")
         layout.prop(self, "auto_export_subfolder")
+        layout.prop(self, "geometry_cache_size")
+        stats = geometry_cache.cache.stats()
+        layout.label(text="Geometry cache: {} meshes, {:.1f} MB, {} hits, {} misses".format(
+            stats["entries"], stats["size"] / (1024 * 1024), stats["hits"], stats["misses"]))
+        layout.prop(self, "format_workers")
+        layout.prop(self, "conversion_workers")
+        layout.prop(self, "background_conversion")
+        layout.prop(self, "conversion_cache_size")
+        stats = conversion_cache.export_cache.stats()
+        row = layout.row()
+        row.label(text="GR2 cache: {} files, {:.1f} MB, {} hits, {} misses".format(
+            stats["entries"], stats["size"] / (1024 * 1024), stats["hits"], stats["misses"]))
+        row.operator("divinityexporter.clear_conversion_cache")
+        layout.prop(self, "import_cache_size")
+        stats = conversion_cache.import_cache.stats()
+        row = layout.row()
+        row.label(text="Import cache: {} files, {:.1f} MB, {} hits, {} misses".format(
+            stats["entries"], stats["size"] / (1024 * 1024), stats["hits"], stats["misses"]))
+        row.operator("divinityexporter.clear_import_cache")
+        layout.prop(self, "report_export_timings")
+        layout.prop(self, "track_export_memory")
+        layout.prop(self, "profile_exports")
 
         layout.separator()
         layout.label(text="Projects")
@@ -191,6 +316,8 @@ classes = (
     ProjectEntry,
     DIVINITYEXPORTER_OT_add_project,
     DIVINITYEXPORTER_OT_remove_project,
+    DIVINITYEXPORTER_OT_clear_conversion_cache,
+    DIVINITYEXPORTER_OT_clear_import_cache,
     DIVINITYEXPORTER_UL_project_list,
     DIVINITYEXPORTER_AddonPreferences
 )
@@ -204,6 +331,7 @@ def register():
 
     properties.register()
     operators_dae.register()
+    operators_divine.register()
     operators_gltf.register()
 
     wm = bpy.context.window_manager
@@ -224,7 +352,9 @@ def unregister():
 
     properties.unregister()
     operators_dae.unregister()
+    operators_divine.unregister()
     operators_gltf.unregister()
+    worker_pool.shutdown()
 
     wm = bpy.context.window_manager
     kc = wm.keyconfigs.addon
@@ -0,0 +1,244 @@
+import re
+
+import numpy as np
+from . import mesh_data
+
+# Pose bone transform channels, by data path suffix
+POSE_CHANNELS = {
+    "location": 3,
+    "rotation_quaternion": 4,
+    "rotation_euler": 3,
+    "rotation_axis_angle": 4,
+    "scale": 3,
+}
+
+POSE_BONE_PATH = re.compile(r'^pose\.bones\["((?:[^"\\]|\\.)*)"\]\.(\w+)$')
+
+# Interpolation modes np.interp can reproduce
+SIMPLE_INTERPOLATION = {"CONSTANT", "LINEAR"}
+
+
+def parse_pose_bone_path(data_path):
+    """Returns (bone name, property) of a pose bone transform channel, or None."""
+    match = POSE_BONE_PATH.match(data_path)
+    if match is None or match.group(2) not in POSE_CHANNELS:
+        return None
+    name = re.sub(r'\\(.)', r'\1', match.group(1))
+    return name, match.group(2)
+
+
+def direct_sampling_blocker(obj):
+    """Returns why the pose of an armature object can't be computed from its
+    action alone, or None if it can.
+
+    Only the action, the pose bone properties and the rest pose are used
+    when sampling directly, so anything else that moves bones rules it out."""
+    if obj.data.pose_position != "POSE":
+        return "armature is in rest position"
+
+    anim = obj.animation_data
+    if anim is not None:
+        if len(anim.drivers):
+            return "drivers"
+        if anim.use_tweak_mode or any(not track.mute for track in anim.nla_tracks):
+            return "NLA tracks"
+        if anim.action_influence != 1.0 or anim.action_blend_type != "REPLACE":
+            return "action blending"
+
+    location_paths = set()
+    if anim is not None and anim.action is not None:
+        for fcurve in anim.action.fcurves:
+            channel = parse_pose_bone_path(fcurve.data_path)
+            if channel is not None and channel[1] == "location" and not fcurve.mute:
+                location_paths.add(channel[0])
+
+    for pose_bone in obj.pose.bones:
+        bone = pose_bone.bone
+        if len(pose_bone.constraints):
+            return "constraints on bone \"{}\"".format(bone.name)
+        if (not bone.use_inherit_rotation or bone.inherit_scale != "FULL"
+                or not bone.use_local_location or bone.use_relative_parent):
+            return "custom parent inheritance on bone \"{}\"".format(bone.name)
+        if bone.use_connect and (bone.name in location_paths or any(pose_bone.location)):
+            return "location on connected bone \"{}\"".format(bone.name)
+
+    return None
+
+
+def sample_fcurve(fcurve, frames):
+    """Evaluates an F-Curve at each frame.
+
+    Curves that only use constant or linear keys and constant extrapolation
+    are sampled with NumPy; anything else goes through fcurve.evaluate()."""
+    keys = fcurve.keyframe_points
+    if (len(keys) and not len(fcurve.modifiers) and fcurve.extrapolation == "CONSTANT"
+            and all(key.interpolation in SIMPLE_INTERPOLATION for key in keys)):
+        co = mesh_data.foreach_get_array(keys, "co", np.float32, 2).astype(np.float64)
+        key_frames = co[:, 0]
+        key_values = co[:, 1]
+        # A segment is interpolated according to its left key
+        segment = np.clip(np.searchsorted(key_frames, frames, side="right") - 1, 0, len(keys) - 1)
+        constant = np.array([key.interpolation == "CONSTANT" for key in keys])
+        return np.where(constant[segment], key_values[segment],
+                        np.interp(frames, key_frames, key_values))
+
+    return np.array([fcurve.evaluate(frame) for frame in frames], dtype=np.float64)
+
+
+def quaternion_to_matrix(q):
+    """(N, 4) w, x, y, z quaternions to (N, 3, 3) rotations; normalizes like Blender."""
+    length = np.linalg.norm(q, axis=1)
+    q = np.where(length[:, None] > 0, q / np.where(length > 0, length, 1)[:, None], [1, 0, 0, 0])
+    w, x, y, z = q.T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=-1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=-1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=1)
+
+
+def axis_rotation(axis, angle):
+    c = np.cos(angle)
+    s = np.sin(angle)
+    one = np.ones_like(angle)
+    zero = np.zeros_like(angle)
+    if axis == "X":
+        rows = [[one, zero, zero], [zero, c, -s], [zero, s, c]]
+    elif axis == "Y":
+        rows = [[c, zero, s], [zero, one, zero], [-s, zero, c]]
+    else:
+        rows = [[c, -s, zero], [s, c, zero], [zero, zero, one]]
+    return np.stack([np.stack(row, axis=-1) for row in rows], axis=1)
+
+
+def euler_to_matrix(euler, order):
+    """(N, 3) Euler angles to (N, 3, 3) rotations; the first axis in order
+    is applied first."""
+    matrix = None
+    for axis in order:
+        rotation = axis_rotation(axis, euler[:, "XYZ".index(axis)])
+        matrix = rotation if matrix is None else rotation @ matrix
+    return matrix
+
+
+def axis_angle_to_matrix(axis_angle):
+    """(N, 4) angle, x, y, z to (N, 3, 3) rotations."""
+    angle = axis_angle[:, 0]
+    axis = axis_angle[:, 1:]
+    length = np.linalg.norm(axis, axis=1)
+    valid = length > 0
+    axis = np.where(valid[:, None], axis / np.where(valid, length, 1)[:, None], [0, 0, 1])
+    angle = np.where(valid, angle, 0)
+
+    x, y, z = axis.T
+    c = np.cos(angle)
+    s = np.sin(angle)
+    t = 1 - c
+    return np.stack([
+        np.stack([t * x * x + c, t * x * y - s * z, t * x * z + s * y], axis=-1),
+        np.stack([t * x * y + s * z, t * y * y + c, t * y * z - s * x], axis=-1),
+        np.stack([t * x * z - s * y, t * y * z + s * x, t * z * z + c], axis=-1),
+    ], axis=1)
+
+
+def basis_matrices(location, rotation, scale):
+    """Builds (N, 4, 4) location @ rotation @ scale matrices."""
+    basis = np.zeros((len(location), 4, 4))
+    basis[:, :3, :3] = rotation * scale[:, None, :]
+    basis[:, :3, 3] = location
+    basis[:, 3, 3] = 1.0
+    return basis
+
+
+class PoseSampler:
+    """Samples pose bone transforms of one armature object from its action."""
+
+    __slots__ = ("obj", "frames", "curves")
+
+    def __init__(self, obj, frames):
+        self.obj = obj
+        self.frames = np.asarray(frames, dtype=np.float64)
+        self.curves = {}
+
+        anim = obj.animation_data
+        if anim is not None and anim.action is not None:
+            for fcurve in anim.action.fcurves:
+                channel = parse_pose_bone_path(fcurve.data_path)
+                if channel is not None and not fcurve.mute:
+                    self.curves[channel + (fcurve.array_index, )] = fcurve
+
+    def channel(self, pose_bone, prop):
+        """(frames, components) values of a transform property; components
+        without an F-Curve keep their current value."""
+        current = np.array(getattr(pose_bone, prop), dtype=np.float64)
+        values = np.repeat(current[None, :], len(self.frames), axis=0)
+        for index in range(POSE_CHANNELS[prop]):
+            fcurve = self.curves.get((pose_bone.name, prop, index))
+            if fcurve is not None:
+                values[:, index] = sample_fcurve(fcurve, self.frames)
+        return values
+
+    def basis(self, pose_bone):
+        """Returns the (frames, 4, 4) matrix_basis of a pose bone and its scale."""
+        mode = pose_bone.rotation_mode
+        if mode == "QUATERNION":
+            rotation = quaternion_to_matrix(self.channel(pose_bone, "rotation_quaternion"))
+        elif mode == "AXIS_ANGLE":
+            rotation = axis_angle_to_matrix(self.channel(pose_bone, "rotation_axis_angle"))
+        else:
+            rotation = euler_to_matrix(self.channel(pose_bone, "rotation_euler"), mode)
+
+        scale = self.channel(pose_bone, "scale")
+        return basis_matrices(self.channel(pose_bone, "location"), rotation, scale), scale
+
+    def bone_matrices(self, exported_parent, armature_xform=None):
+        """Computes the matrices export_animation writes for each bone.
+
+        exported_parent maps bone names to the name of the bone their
+        transform is relative to, None for roots. Transforms in armature
+        space are premultiplied by armature_xform if given. Returns a
+        {bone name: (frames, 4, 4)} dict with the same keys."""
+        bones = self.obj.data.bones
+        pose = {}
+        scales = {}
+        relative = {}
+
+        def visit(bone):
+            pose_bone = self.obj.pose.bones[bone.name]
+            basis, scales[bone.name] = self.basis(pose_bone)
+            rest = np.array(bone.matrix_local, dtype=np.float64)
+            if bone.parent is None:
+                relative[bone.name] = rest @ basis
+                pose[bone.name] = relative[bone.name]
+                if armature_xform is not None:
+                    pose[bone.name] = armature_xform @ pose[bone.name]
+            else:
+                parent_rest = np.array(bone.parent.matrix_local, dtype=np.float64)
+                relative[bone.name] = (np.linalg.inv(parent_rest) @ rest) @ basis
+                pose[bone.name] = pose[bone.parent.name] @ relative[bone.name]
+            for child in bone.children:
+                visit(child)
+
+        for bone in bones:
+            if bone.parent is None:
+                visit(bone)
+
+        matrices = {}
+        for name, parent in exported_parent.items():
+            if parent is None:
+                matrices[name] = pose[name]
+                continue
+
+            # Relative to the exported parent; the product of the local
+            # transforms in between equals parent.inverted() @ pose
+            local = relative[name]
+            ancestor = bones[name].parent
+            while ancestor.name != parent:
+                local = relative[ancestor.name] @ local
+                ancestor = ancestor.parent
+
+            # Children of a bone scaled to zero are written in armature space
+            invisible = (scales[parent] == 0.0).any(axis=1)
+            matrices[name] = np.where(invisible[:, None, None], pose[name], local)
+
+        return matrices
@@ -0,0 +1,205 @@
+"""Headless batch export.
+
+Exports every job of a JSON manifest in a single Blender session:
+
+    blender -b -P io_scene_dos2de/batch.py -- manifest.json [--report report.json] [--restart]
+
+Manifest format; relative paths are relative to the manifest:
+
+    {
+        "defaults": {"preset": "MODEL", "options": {"use_mesh_modifiers": true}},
+        "jobs": [
+            {
+                "id": "body",                   # optional, defaults to the output path
+                "blend": "models/body.blend",
+                "collection": "Body",           # optional filter ...
+                "objects": ["Body_Mesh"],       # ... or a list of object names
+                "preset": "MODEL",              # NONE, MODEL, ANIMATION or MESHPROXY
+                "output": "out/body.GR2",       # .dae, or .gr2 to convert with divine
+                "options": {}                   # other export operator properties
+            }
+        ]
+    }
+
+Jobs go through the regular Collada export operator, so they get the same
+object collection, copying and export_dae.save pipeline as interactive
+exports. The report is rewritten after every job. When the runner is started
+again with an existing report, jobs that already succeeded and whose output
+is newer than their blend file are skipped, unless --restart is given.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import traceback
+
+import bpy
+
+if __name__ == "__main__":
+    # Run as a script: make the addon importable and enable it so the export
+    # operator and its preferences are registered
+    import addon_utils
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    addon_utils.enable("io_scene_dos2de", default_set=False, persistent=True)
+    from io_scene_dos2de import operators_dae, helpers
+else:
+    from . import operators_dae, helpers
+
+REPORT_VERSION = 1
+
+
+class BatchJob:
+    __slots__ = ("id", "blend", "collection", "objects", "preset", "output", "options")
+
+    def __init__(self, spec, defaults, base_dir):
+        def path(value):
+            return os.path.normpath(os.path.join(base_dir, value))
+
+        self.blend = path(spec["blend"])
+        self.output = path(spec["output"])
+        self.id = spec.get("id", self.output)
+        self.collection = spec.get("collection")
+        self.objects = spec.get("objects")
+        self.preset = spec.get("preset", defaults.get("preset", "NONE"))
+        self.options = dict(defaults.get("options", {}))
+        self.options.update(spec.get("options", {}))
+
+    def is_up_to_date(self, result):
+        """Whether a previous run already produced this job's output."""
+        if result is None or result.get("status") != "ok":
+            return False
+        try:
+            return os.path.getmtime(self.output) >= os.path.getmtime(self.blend)
+        except OSError:
+            return False
+
+    def operator_args(self):
+        args = {}
+        for prop, value in operators_dae.EXPORT_PRESETS.get(self.preset, {}).items():
+            args[prop] = value
+        if self.preset != "NONE":
+            args["yup_enabled"] = "ROTATE"
+
+        divine_settings = {"game": bpy.context.scene.ls_properties.game}
+        if self.preset in operators_dae.PRESET_EXTRAS:
+            divine_settings["gr2_settings"] = {"extras": operators_dae.PRESET_EXTRAS[self.preset]}
+        args["divine_settings"] = divine_settings
+
+        args["use_export_selected"] = self.collection is not None or self.objects is not None
+        args.update(self.options)
+        args["filepath"] = self.output
+        return args
+
+
+def load_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get("defaults", {})
+    return [BatchJob(spec, defaults, base_dir) for spec in manifest["jobs"]]
+
+
+def load_report(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if report.get("version") != REPORT_VERSION:
+        return {}
+    return {result["id"]: result for result in report.get("jobs", [])}
+
+
+def write_report(path, manifest_path, results, started):
+    report = {
+        "version": REPORT_VERSION,
+        "manifest": os.path.abspath(manifest_path),
+        "blender": bpy.app.version_string,
+        "elapsed": time.perf_counter() - started,
+        "succeeded": sum(1 for result in results if result["status"] == "ok"),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "jobs": results,
+    }
+    # Written to a temporary file first so an interrupted run keeps the last report
+    temp = path + ".tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp, path)
+
+
+def select_objects(job):
+    if job.collection is None and job.objects is None:
+        return
+    bpy.ops.object.select_all(action='DESELECT')
+    if job.collection is not None:
+        if job.collection not in bpy.data.collections:
+            raise ValueError("Collection '{}' does not exist".format(job.collection))
+        targets = list(bpy.data.collections[job.collection].all_objects)
+    else:
+        missing = [name for name in job.objects if name not in bpy.data.objects]
+        if missing:
+            raise ValueError("Objects do not exist: {}".format(", ".join(missing)))
+        targets = [bpy.data.objects[name] for name in job.objects]
+    for obj in targets:
+        obj.select_set(True)
+
+
+def run_job(job):
+    if os.path.normcase(bpy.data.filepath) != os.path.normcase(job.blend):
+        bpy.ops.wm.open_mainfile(filepath=job.blend)
+    select_objects(job)
+    os.makedirs(os.path.dirname(job.output), exist_ok=True)
+    result = bpy.ops.export_scene.dos2de_collada('EXEC_DEFAULT', **job.operator_args())
+    if result != {"FINISHED"} or not os.path.isfile(job.output):
+        raise RuntimeError("Export did not produce '{}'".format(job.output))
+
+
+def run(manifest_path, report_path, restart=False):
+    """Exports every job; returns the number of failed jobs."""
+    started = time.perf_counter()
+    jobs = load_manifest(manifest_path)
+    previous = {} if restart else load_report(report_path)
+
+    # Jobs are grouped by blend file so each file is only opened once
+    order = sorted(range(len(jobs)), key=lambda i: (jobs[i].blend, i))
+    results = [None] * len(jobs)
+    for i in order:
+        job = jobs[i]
+        if job.is_up_to_date(previous.get(job.id)):
+            helpers.trace("[DOS2DE-Batch] Skipping '{}', already exported.".format(job.id))
+            results[i] = dict(previous[job.id], resumed=True)
+            continue
+
+        helpers.trace("[DOS2DE-Batch] Exporting '{}'.".format(job.id))
+        start = time.perf_counter()
+        result = {"id": job.id, "blend": job.blend, "output": job.output, "preset": job.preset}
+        try:
+            run_job(job)
+            result["status"] = "ok"
+            result["size"] = os.path.getsize(job.output)
+        except Exception as e:
+            traceback.print_exc()
+            result["status"] = "failed"
+            result["error"] = str(e)
+        result["elapsed"] = time.perf_counter() - start
+        results[i] = result
+        write_report(report_path, manifest_path, [r for r in results if r is not None], started)
+
+    write_report(report_path, manifest_path, results, started)
+    return sum(1 for result in results if result["status"] == "failed")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="batch.py", description="Export a manifest of DOS2/BG3 models.")
+    parser.add_argument("manifest")
+    parser.add_argument("--report", help="Report path; defaults to <manifest>.report.json")
+    parser.add_argument("--restart", action="store_true", help="Export every job, ignoring a previous report")
+    args = parser.parse_args(argv)
+    report = args.report or os.path.splitext(args.manifest)[0] + ".report.json"
+    return 1 if run(args.manifest, report, args.restart) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []))
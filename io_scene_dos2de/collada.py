@@ -1,10 +1,20 @@
 from . import helpers
+import time
 import xml.etree.ElementTree as et
 import bpy
 
+def local_name(tag):
+    _, _, name = tag.rpartition('}')
+    return name
+
+
 class ColladaMetadataLoader:
-    root = None
     armature = None
+    root_profile = None
+    anim_settings = None
+    # Number of profiles applied and seconds spent by the last load
+    applied = 0
+    elapsed = 0.0
     SCHEMA = "{http://www.collada.org/2005/11/COLLADASchema}"
     LSLIB_METADATA_VERSION = 3
 
@@ -18,8 +28,66 @@ class ColladaMetadataLoader:
         "Unset": "unset",
     }
 
+    MODEL_TYPE_PROPERTIES = {
+        "Rigid": "rigid",
+        "Cloth": "cloth",
+        "MeshProxy": "mesh_proxy",
+        "ProxyGeometry": "proxy",
+        "Spring": "spring",
+        "Occluder": "occluder",
+        "ClothPhysics": "cloth_physics",
+        "Cloth01": "cloth_flag1",
+        "Cloth02": "cloth_flag2",
+        "Cloth04": "cloth_flag4",
+    }
+
+    def parse(self, collada_path):
+        """Collects the LSTools profiles of a Collada file. Everything else is
+        dropped as soon as it has been parsed, so memory use is bounded by
+        the largest profile instead of the file size."""
+        self.root_profile = None
+        self.anim_settings = None
+        self.mesh_profiles = []
+        self.bone_profiles = []
+
+        # (tag, element) of every open element
+        path = []
+        profile_depth = None
+        for event, ele in et.iterparse(collada_path, events=("start", "end")):
+            if event == "start":
+                path.append((local_name(ele.tag), ele))
+                if profile_depth is None and path[-1][0] == "technique" and ele.get("profile") == "LSTools":
+                    profile_depth = len(path)
+                continue
+
+            path.pop()
+            if profile_depth is not None:
+                # Children of a profile stay attached to it
+                if len(path) >= profile_depth:
+                    continue
+                profile_depth = None
+                self.collect_profile(path, ele)
+
+            if path:
+                path[-1][1].remove(ele)
+
+    def collect_profile(self, path, settings):
+        tags = [tag for tag, _ in path]
+        if tags == ["COLLADA", "extra"]:
+            self.root_profile = settings
+        elif tags == ["COLLADA", "library_animations", "animation", "extra"]:
+            if self.anim_settings is None:
+                self.anim_settings = settings
+        elif tags == ["COLLADA", "library_geometries", "geometry", "mesh", "extra"]:
+            self.mesh_profiles.append((path[2][1].get("name", ""), settings))
+        elif (len(tags) > 4 and tags[:3] == ["COLLADA", "library_visual_scenes", "visual_scene"]
+                and tags[-1] == "extra" and all(tag == "node" for tag in tags[3:-1])):
+            node = path[-2][1]
+            if node.get("type") == "JOINT":
+                self.bone_profiles.append((node.get("name", ""), settings))
+
     def load_root_profile(self, context):
-        profile = self.root.find(f"./{self.SCHEMA}extra/{self.SCHEMA}technique[@profile='LSTools']")
+        profile = self.root_profile
         if profile is None:
             helpers.report("LSLib profile data not found in Collada export; make sure you're using LSLib v1.16 or later!", "ERROR")
             return
@@ -41,93 +109,69 @@ class ColladaMetadataLoader:
             helpers.report("The Blender exporter plugin is too old for this LSLib version, please upgrade your exporter plugin!", "ERROR")
 
 
-    def find_anim_settings(self):
-        for anim in self.root.findall(f"./{self.SCHEMA}library_animations/{self.SCHEMA}animation"):
-            settings = anim.find(f"{self.SCHEMA}extra/{self.SCHEMA}technique[@profile='LSTools']")
-            if settings is not None:
-                return settings
-
-        return None
-    
-    def load_mesh_profile(self, geom, settings):
-        if geom.attrib['name'] not in bpy.data.objects:
-            helpers.report("Couldnt load metadata on geometry '" + geom.attrib['name'] + "' (object not found)", "ERROR")
-            return
-        
-        mesh = bpy.data.objects[geom.attrib['name']].data
-        props = mesh.ls_properties
+    def mesh_profile_values(self, settings):
+        """Mesh ls_properties values set by a geometry profile."""
+        values = {}
         for ele in list(settings):
-            _, _, tag = ele.tag.rpartition('}')
+            tag = local_name(ele.tag)
             if tag == 'DivModelType':
-                if ele.text == 'Rigid':
-                    props.rigid = True
-                elif ele.text == 'Cloth':
-                    props.cloth = True
-                elif ele.text == 'MeshProxy':
-                    props.mesh_proxy = True
-                elif ele.text == 'ProxyGeometry':
-                    props.proxy = True
-                elif ele.text == 'Spring':
-                    props.spring = True
-                elif ele.text == 'Occluder':
-                    props.occluder = True
-                elif ele.text == 'ClothPhysics':
-                    props.cloth_physics = True
-                elif ele.text == 'Cloth01':
-                    props.cloth_flag1 = True
-                elif ele.text == 'Cloth02':
-                    props.cloth_flag2 = True
-                elif ele.text == 'Cloth04':
-                    props.cloth_flag4 = True
+                prop = self.MODEL_TYPE_PROPERTIES.get(ele.text)
+                if prop is not None:
+                    values[prop] = True
                 else:
                     helpers.report("Unrecognized DivModelType in mesh profile: " + ele.text)
             elif tag == 'IsImpostor' and ele.text == '1':
-                props.impostor = True
+                values['impostor'] = True
             elif tag == 'ExportOrder':
-                props.export_order = int(ele.text) + 1
+                values['export_order'] = int(ele.text) + 1
             elif tag == 'LOD':
-                props.lod = int(ele.text)
+                values['lod'] = int(ele.text)
             elif tag == 'LODDistance':
-                props.lod_distance = float(ele.text)
+                values['lod_distance'] = float(ele.text)
             else:
                 helpers.report("Unrecognized attribute in mesh profile: " + tag)
+        return values
     
-    def load_mesh_profiles(self):
-        for geom in self.root.findall(f"./{self.SCHEMA}library_geometries/{self.SCHEMA}geometry"):
-            settings = geom.find(f"{self.SCHEMA}mesh/{self.SCHEMA}extra/{self.SCHEMA}technique[@profile='LSTools']")
-            if settings is not None:
-                self.load_mesh_profile(geom, settings)
-    
-    def load_bone_profile(self, bone, settings):
-        bones = [b for b in self.armature.data.bones if b.name == bone.attrib['name']] 
-        if len(bones) == 0:
-            helpers.report("Couldnt load metadata on bone '" + bone.attrib['name'] + "' (object not found)", "ERROR")
-            return
-        
-        bone = bones[0]
-        props = bone.ls_properties
+    def bone_profile_values(self, settings):
+        """Bone ls_properties values set by a joint profile."""
+        values = {}
         for ele in list(settings):
-            _, _, tag = ele.tag.rpartition('}')
+            tag = local_name(ele.tag)
             if tag == 'BoneIndex':
-                props.export_order = int(ele.text) + 1
+                values['export_order'] = int(ele.text) + 1
             else:
                 helpers.report("Unrecognized attribute in bone profile: " + tag)
-    
-    def load_bone_profiles(self, bone):
-        for child in bone:
-            if child.tag == f"{self.SCHEMA}node":
-                self.load_bone_profiles(child)
-
-        if 'type' in bone.attrib and bone.attrib['type'] == 'JOINT':
-            settings = bone.find(f"{self.SCHEMA}extra/{self.SCHEMA}technique[@profile='LSTools']")
-            if settings is not None:
-                self.load_bone_profile(bone, settings)
-    
-    def load_armature_profiles(self):
-        for scene in self.root.findall(f"./{self.SCHEMA}library_visual_scenes/{self.SCHEMA}visual_scene"):
-            for ele in scene:
-                if ele.tag == f"{self.SCHEMA}node":
-                    self.load_bone_profiles(ele)
+        return values
+
+    def profile_updates(self):
+        """Resolves the collected profiles to (ls_properties, values) pairs.
+        Objects and bones are indexed by name once per load."""
+        updates = []
+
+        objects = {obj.name: obj for obj in bpy.data.objects}
+        for name, settings in self.mesh_profiles:
+            obj = objects.get(name)
+            if obj is None:
+                helpers.report("Couldnt load metadata on geometry '" + name + "' (object not found)", "ERROR")
+                continue
+            updates.append((obj.data.ls_properties, self.mesh_profile_values(settings)))
+
+        bones = {b.name: b for b in self.armature.data.bones} if self.armature is not None else {}
+        for name, settings in self.bone_profiles:
+            bone = bones.get(name)
+            if bone is None:
+                helpers.report("Couldnt load metadata on bone '" + name + "' (object not found)", "ERROR")
+                continue
+            updates.append((bone.ls_properties, self.bone_profile_values(settings)))
+
+        return updates
+
+    def apply_profiles(self):
+        updates = self.profile_updates()
+        for props, values in updates:
+            for prop, value in values.items():
+                setattr(props, prop, value)
+        return len(updates)
 
     def load_anim_profile(self, context, anim_settings):
         skel = anim_settings.find('SkeletonResourceID')
@@ -146,10 +190,10 @@ class ColladaMetadataLoader:
                 self.armature = obj
                 break
 
-        self.root = et.parse(collada_path).getroot()
+        start = time.perf_counter()
+        self.parse(collada_path)
         self.load_root_profile(context)
-        anim_settings = self.find_anim_settings()
-        self.load_mesh_profiles()
-        self.load_armature_profiles()
-        if anim_settings is not None:
-            self.load_anim_profile(context, anim_settings)
+        self.applied = self.apply_profiles()
+        if self.anim_settings is not None:
+            self.load_anim_profile(context, self.anim_settings)
+        self.elapsed = time.perf_counter() - start
@@ -0,0 +1,187 @@
+from pathlib import Path
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+# Bump whenever the way keys are computed changes
+KEY_VERSION = 2
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+READ_CHUNK = 1024 * 1024
+# Exported DAE files start with an <asset> element holding the export time
+ASSET_END = b"</asset>"
+ASSET_TIMESTAMPS = re.compile(rb"<(created|modified)>[^<]*</\1>")
+
+
+def file_identity(path):
+    """Identifies a divine build by its location, size and modification time."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return (str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def strip_asset_timestamps(data):
+    """Drops the creation and modification times from the <asset> element at
+    the start of a DAE file, so exports of the same scene hash the same."""
+    end = data.find(ASSET_END)
+    if end < 0:
+        return data
+    end += len(ASSET_END)
+    return ASSET_TIMESTAMPS.sub(b"", data[:end]) + data[end:]
+
+
+class ConversionCache:
+    """Directory of converted files, keyed by everything the conversion
+    depends on. Entries are evicted least recently used first once the
+    directory grows past max_bytes.
+
+    The directory is only listed the first time its size is needed, and
+    again when entries have to be evicted; in between, store, evict and
+    clear keep a running total."""
+
+    __slots__ = ("directory", "max_bytes", "hits", "misses", "evictions", "sizes", "size", "lock")
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Entry name -> size in bytes, and their total; None until listed
+        self.sizes = None
+        self.size = 0
+        # Entries are stored from the conversion threads
+        self.lock = threading.Lock()
+
+    def key(self, job, divine_path):
+        """Hashes the source file, the conversion settings and the divine build."""
+        hasher = hashlib.blake2b(digest_size=32)
+        settings = (KEY_VERSION, job.game, job.input_format, job.output_format,
+                    tuple(job.options), file_identity(divine_path))
+        hasher.update(repr(settings).encode("utf-8"))
+        with open(job.source, "rb") as f:
+            first = f.read(READ_CHUNK)
+            if job.input_format == "dae":
+                first = strip_asset_timestamps(first)
+            hasher.update(first)
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def entry_path(self, key):
+        return self.directory / key
+
+    def fetch(self, key, destination):
+        """Copies the cached output to destination; returns False on a miss."""
+        path = self.entry_path(key)
+        try:
+            shutil.copyfile(path, destination)
+            # The modification time doubles as the last use for eviction
+            os.utime(path)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, output):
+        if self.max_bytes <= 0:
+            return
+        size = os.path.getsize(output)
+        if size > self.max_bytes:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Copy under a temporary name first so a concurrent fetch never sees
+        # a partial file
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(output, temp)
+            os.replace(temp, self.entry_path(key))
+        except OSError:
+            Path(temp).unlink(missing_ok=True)
+            raise
+        with self.lock:
+            sizes = self.entry_sizes()
+            self.size += size - sizes.get(key, 0)
+            sizes[key] = size
+        self.evict(self.max_bytes)
+
+    def entries(self):
+        """(path, size, last use) of every entry, least recently used first."""
+        if not self.directory.is_dir():
+            return []
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime_ns))
+        entries.sort(key=lambda entry: entry[2])
+        return entries
+
+    def entry_sizes(self):
+        # Callers hold the lock
+        if self.sizes is None:
+            self.sizes = {path.name: size for path, size, _ in self.entries()}
+            self.size = sum(self.sizes.values())
+        return self.sizes
+
+    def evict(self, max_bytes):
+        with self.lock:
+            self.entry_sizes()
+            if self.size <= max_bytes:
+                return
+            # Listed again for the last use times, which also picks up
+            # changes made by other Blender instances
+            entries = self.entries()
+            self.sizes = {path.name: size for path, size, _ in entries}
+            self.size = sum(self.sizes.values())
+            for path, entry_size, _ in entries:
+                if self.size <= max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                del self.sizes[path.name]
+                self.size -= entry_size
+                self.evictions += 1
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict(max_bytes)
+
+    def clear(self):
+        with self.lock:
+            for path, _, _ in self.entries():
+                path.unlink(missing_ok=True)
+            self.sizes = {}
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            entries = len(self.entry_sizes())
+        return {
+            "entries": entries,
+            "size": self.size,
+            "max_size": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def configure(cache, max_bytes):
+    """Returns the cache resized to max_bytes, or None if caching is disabled."""
+    if max_bytes <= 0:
+        return None
+    cache.resize(max_bytes)
+    return cache
+
+
+export_cache = ConversionCache(os.path.join(tempfile.gettempdir(), "dos2de-gr2-cache"))
+# GR2 files converted to DAE/GLB for importing
+import_cache = ConversionCache(os.path.join(tempfile.gettempdir(), "dos2de-import-cache"))
@@ -0,0 +1,118 @@
+import bpy
+
+# Rough in-memory sizes used for the release report
+OBJECT_BYTES = 1536
+BONE_BYTES = 448
+ATTRIBUTE_ITEM_BYTES = {
+    "FLOAT": 4, "INT": 4, "FLOAT_VECTOR": 12, "FLOAT_COLOR": 16, "BYTE_COLOR": 4,
+    "STRING": 8, "BOOLEAN": 1, "FLOAT2": 8, "INT8": 1, "INT32_2D": 8, "QUATERNION": 16,
+}
+
+
+def mesh_bytes(mesh):
+    size = len(mesh.vertices) * 12 + len(mesh.edges) * 8 + len(mesh.loops) * 8 + len(mesh.polygons) * 4
+    for attr in mesh.attributes:
+        domain = {"POINT": mesh.vertices, "EDGE": mesh.edges, "CORNER": mesh.loops,
+                  "FACE": mesh.polygons}.get(attr.domain, ())
+        size += len(domain) * ATTRIBUTE_ITEM_BYTES.get(attr.data_type, 4)
+    return size
+
+
+def estimate_bytes(block):
+    if isinstance(block, bpy.types.Mesh):
+        return mesh_bytes(block)
+    if isinstance(block, bpy.types.Armature):
+        return len(block.bones) * BONE_BYTES
+    if isinstance(block, bpy.types.Key):
+        return sum(len(kb.data) * 12 for kb in block.key_blocks)
+    if isinstance(block, bpy.types.Object):
+        return OBJECT_BYTES
+    return 0
+
+
+class DatablockArena:
+    """Keeps track of the datablocks an export creates so exactly those are
+    freed once it is over, whether it succeeded or not. Evaluated meshes
+    from Object.to_mesh are tracked by their owner and cleared the same way."""
+
+    __slots__ = ("blocks", "evaluated", "released_blocks", "released_bytes")
+
+    def __init__(self):
+        # Keyed by block.as_pointer(), so one can be dropped without a scan
+        self.blocks = {}
+        self.evaluated = []
+        self.released_blocks = 0
+        self.released_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.free()
+
+    def add(self, block):
+        """Records a datablock this export created; returns it."""
+        self.blocks[block.as_pointer()] = block
+        # Copied meshes get their own copy of the shape keys
+        shape_keys = getattr(block, "shape_keys", None)
+        if shape_keys is not None:
+            self.blocks[shape_keys.as_pointer()] = shape_keys
+        return block
+
+    def add_evaluated(self, obj, mesh):
+        """Records a mesh returned by obj.to_mesh()."""
+        self.evaluated.append((obj, mesh_bytes(mesh)))
+
+    def held_bytes(self):
+        """Estimated size of the datablocks that are still tracked."""
+        size = 0
+        for block in self.blocks.values():
+            try:
+                size += estimate_bytes(block)
+            except ReferenceError:
+                continue
+        return size
+
+    def evaluated_bytes(self):
+        return sum(size for _, size in self.evaluated)
+
+    def remove(self, block):
+        """Frees one recorded datablock right away."""
+        shape_keys = getattr(block, "shape_keys", None)
+        if shape_keys is not None:
+            self.blocks.pop(shape_keys.as_pointer(), None)
+        self.blocks.pop(block.as_pointer(), None)
+        self.free_blocks([block])
+
+    def keep(self):
+        """Stops tracking the datablocks, leaving them in the file."""
+        self.blocks = {}
+
+    def free_blocks(self, blocks):
+        alive = []
+        for block in blocks:
+            try:
+                self.released_bytes += estimate_bytes(block)
+            except ReferenceError:
+                # Already removed by someone else
+                continue
+            alive.append(block)
+        bpy.data.batch_remove(alive)
+        self.released_blocks += len(alive)
+
+    def free(self):
+        for obj, size in self.evaluated:
+            try:
+                obj.to_mesh_clear()
+            except ReferenceError:
+                continue
+            self.released_blocks += 1
+            self.released_bytes += size
+        self.evaluated = []
+
+        blocks, self.blocks = self.blocks, {}
+        self.free_blocks(list(blocks.values()))
+
+    def summary(self):
+        return "Released {} datablock(s) (~{:.1f} MB)".format(
+            self.released_blocks, self.released_bytes / (1024 * 1024))
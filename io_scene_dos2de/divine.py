@@ -1,27 +1,352 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import os
+import queue
+import shutil
 import subprocess
-import bpy
+import tempfile
+import threading
+import time
 from . import helpers
 
+class ConversionJob:
+    """A single file conversion, and its outcome once the session has run."""
+
+    __slots__ = ("source", "destination", "input_format", "output_format", "game",
+                 "options", "success", "error", "elapsed", "cache_key", "cached", "finished")
+
+    def __init__(self, source, destination, input_format, output_format, game, options):
+        self.source = str(source)
+        self.destination = str(destination)
+        self.input_format = input_format
+        self.output_format = output_format
+        self.game = game
+        self.options = list(options)
+        self.success = None
+        self.error = None
+        self.elapsed = 0.0
+        self.cache_key = None
+        self.cached = False
+        # Set once the job won't be retried anymore
+        self.finished = threading.Event()
+
+    def wait(self):
+        self.finished.wait()
+        return self.success
+
+    def batch_key(self):
+        """Jobs with the same key can be converted by one divine run."""
+        return (self.game, self.input_format, self.output_format, tuple(self.options))
+
+    def args(self, action, source, destination):
+        return (["--loglevel", "all", "-g", self.game, "-s", source, "-d", destination,
+                 "-i", self.input_format, "-o", self.output_format, "-a", action]
+                + self.options)
+
+
+# Batches per worker when files are imported while the rest convert
+IMPORT_BATCHES_PER_WORKER = 2
+# Conversions listed with their time next to the summary of a session
+SLOWEST_REPORTED = 3
+
+
+def default_conversion_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+class ConversionSession:
+    """Collects conversion jobs and runs them with as few divine launches as
+    possible.
+
+    Starting divine costs more than converting a typical model, so jobs that
+    share their settings are staged into a directory and converted by one
+    convert-models run. With several workers, the jobs are split into one
+    batch per worker and the divine processes run side by side. Jobs that a
+    batch run didn't produce are retried on their own, which gets their
+    actual error message.
+
+    Batches are converted in the order the jobs were added, and each job is
+    marked finished as soon as its output is there. Setting batch_size
+    makes the first jobs finish earlier, at the cost of more launches.
+
+    With a messages queue, the session queues its (type, message) pairs
+    there instead of printing them, so it can run off the main thread."""
+
+    __slots__ = ("invoker", "workers", "jobs", "launches", "elapsed", "batch_size", "messages")
+
+    def __init__(self, invoker, workers=1, batch_size=None, messages=None):
+        self.invoker = invoker
+        self.workers = workers if workers > 0 else default_conversion_workers()
+        self.jobs = []
+        self.launches = 0
+        self.elapsed = 0.0
+        self.batch_size = batch_size
+        self.messages = messages
+
+    def add(self, job):
+        self.jobs.append(job)
+        return job
+
+    def run(self, lslib_checked=False):
+        """Converts every pending job; returns True if all of them succeeded.
+        Off the main thread, lslib has to be checked beforehand."""
+        try:
+            return self.run_jobs(lslib_checked)
+        finally:
+            for job in self.jobs:
+                job.finished.set()
+
+    def trace(self, msg):
+        if self.messages is not None:
+            self.messages.put(("TRACE", msg))
+        else:
+            helpers.trace(msg)
+
+    def run_jobs(self, lslib_checked):
+        if not lslib_checked and not self.invoker.check_lslib():
+            for job in self.jobs:
+                if job.success is None:
+                    # check_lslib already reported why
+                    job.success = False
+            return False
+
+        start = time.perf_counter()
+        cache = self.invoker.cache
+        if cache is not None:
+            self.fetch_cached(cache)
+
+        groups = {}
+        for job in self.jobs:
+            if job.success is None:
+                groups.setdefault(job.batch_key(), []).append(job)
+
+        chunks = []
+        for jobs in groups.values():
+            size = self.batch_size or -(-len(jobs) // self.workers)
+            chunks += [jobs[i:i + size] for i in range(0, len(jobs), size)]
+        self.run_parallel(self.convert_chunk, chunks)
+
+        retries = [job for job in self.jobs if job.success is None]
+        self.run_parallel(self.convert_single, retries)
+
+        self.launches += len(chunks) + len(retries)
+        self.elapsed += time.perf_counter() - start
+        return all(job.success for job in self.jobs)
+
+    def fetch_cached(self, cache):
+        for job in self.jobs:
+            if job.success is not None:
+                continue
+            start = time.perf_counter()
+            try:
+                job.cache_key = cache.key(job, self.invoker.lslib_path)
+            except OSError as e:
+                self.trace("[DOS2DE-Collada] Can't look up '{}' in the conversion cache: {}".format(job.source, e))
+                continue
+            if cache.fetch(job.cache_key, job.destination):
+                job.success = True
+                job.cached = True
+                job.elapsed = time.perf_counter() - start
+                job.finished.set()
+
+    def store_converted_job(self, job):
+        # Stored before the job is marked finished, as its output may be
+        # moved or deleted right after
+        cache = self.invoker.cache
+        if cache is not None and job.success and not job.cached and job.cache_key is not None:
+            try:
+                cache.store(job.cache_key, job.destination)
+            except OSError as e:
+                self.trace("[DOS2DE-Collada] Can't store '{}' in the conversion cache: {}".format(job.destination, e))
+
+    def run_parallel(self, fn, items):
+        # divine does the work in its own process; the threads only wait on it
+        if self.workers <= 1 or len(items) <= 1:
+            for item in items:
+                fn(item)
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(items))) as pool:
+                list(pool.map(fn, items))
+
+    def failed(self):
+        return [job for job in self.jobs if not job.success]
+
+    def slowest(self, count=SLOWEST_REPORTED):
+        """The names and times of the slowest files divine converted, as text.
+        Files converted in one batch share its time evenly."""
+        converted = sorted((job for job in self.jobs if job.success and not job.cached),
+                           key=lambda job: job.elapsed, reverse=True)
+        if not converted:
+            return ""
+        return " Slowest: {}.".format(", ".join(
+            "{} {:.2f}s".format(Path(job.source).name, job.elapsed) for job in converted[:count]))
+
+    def summary(self):
+        return "Converted {} of {} files in {:.2f}s ({} from cache).{}".format(
+            len(self.jobs) - len(self.failed()), len(self.jobs), self.elapsed,
+            sum(1 for job in self.jobs if job.cached), self.slowest())
+
+    def convert_chunk(self, jobs):
+        if len(jobs) > 1:
+            self.convert_batch(jobs)
+        else:
+            self.convert_single(jobs[0])
+
+    def convert_single(self, job):
+        start = time.perf_counter()
+        ok, error = self.invoker.run_divine(job.args("convert-model", job.source, job.destination))
+        job.elapsed = time.perf_counter() - start
+        job.success = ok
+        job.error = error
+        self.store_converted_job(job)
+        job.finished.set()
+
+    def convert_batch(self, jobs):
+        start = time.perf_counter()
+        stage = Path(tempfile.mkdtemp(prefix="dos2de-convert-"))
+        try:
+            input_dir = stage / "in"
+            output_dir = stage / "out"
+            input_dir.mkdir()
+            output_dir.mkdir()
+
+            # Staged names are unique even if the sources share a file name
+            for i, job in enumerate(jobs):
+                staged = input_dir / "job{}.{}".format(i, job.input_format)
+                try:
+                    os.link(job.source, staged)
+                except OSError:
+                    shutil.copyfile(job.source, staged)
+
+            ok, _ = self.invoker.run_divine(jobs[0].args("convert-models", str(input_dir), str(output_dir)))
+            if not ok and self.invoker.cancelled:
+                return
+            if not ok:
+                self.trace("[DOS2DE-Collada] Batch conversion failed, converting files one by one.")
+                return
+
+            outputs = {path.stem: path for path in output_dir.iterdir()
+                       if path.suffix.lower() == "." + jobs[0].output_format.lower()}
+            converted = [job for i, job in enumerate(jobs) if "job{}".format(i) in outputs]
+            elapsed = (time.perf_counter() - start) / max(len(converted), 1)
+            for i, job in enumerate(jobs):
+                output = outputs.get("job{}".format(i))
+                if output is not None:
+                    shutil.move(str(output), job.destination)
+                    job.success = True
+                    job.elapsed = elapsed
+                    self.store_converted_job(job)
+                    job.finished.set()
+        finally:
+            shutil.rmtree(stage, ignore_errors=True)
+
+
+def report_message(type, msg):
+    """Reports a message queued by a background session."""
+    if type == "TRACE":
+        helpers.trace(msg)
+    else:
+        helpers.report(msg, type)
+
+
+class BackgroundConversion:
+    """Runs a conversion session on a background thread, so Blender stays
+    responsive while divine works. The cleanup files are deleted once the
+    session is over, whether it succeeded, failed or was cancelled.
+
+    The thread doesn't touch the operator or Blender: lslib has to be
+    checked on the main thread before starting, and the session's messages
+    are queued for the main thread to pick up with pending_messages."""
+
+    __slots__ = ("session", "cleanup", "thread", "status", "messages", "previous_output")
+
+    def __init__(self, invoker, jobs, workers=1, cleanup=(), batch_size=None):
+        self.messages = queue.SimpleQueue()
+        self.session = ConversionSession(invoker, workers, batch_size, self.messages)
+        for job in jobs:
+            self.session.add(job)
+        self.cleanup = [Path(path) for path in cleanup]
+        self.status = "Starting divine"
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.previous_output = invoker.on_output
+        invoker.on_output = self.on_output
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.session.run(lslib_checked=True)
+        finally:
+            for path in self.cleanup:
+                path.unlink(missing_ok=True)
+
+    def on_output(self, line):
+        if line:
+            self.status = line
+        if self.previous_output is not None:
+            self.previous_output(line)
+
+    def pending_messages(self):
+        """Takes the (type, message) pairs the session queued so far."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    @property
+    def cancelled(self):
+        return self.session.invoker.cancelled
+
+    def cancel(self):
+        self.session.invoker.cancel()
+
+    def progress(self):
+        """Fraction of the jobs that are finished."""
+        finished = sum(1 for job in self.session.jobs if job.success is not None)
+        return finished / max(len(self.session.jobs), 1)
+
+
 class DivineInvoker:
     def __init__(self, addon_prefs, divine_prefs):
-        self.addon_prefs = addon_prefs
+        # Copied, as the preferences may only be read on the main thread
+        # and divine runs from worker threads
+        self.lslib_path = str(addon_prefs.lslib_path or "")
         self.divine_prefs = divine_prefs
+        # Called with each line divine prints, from the thread running it
+        self.on_output = None
+        # conversion_cache.ConversionCache consulted before running divine
+        self.cache = None
+        self.cancelled = False
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        """Stops the running divine processes and any that would be started."""
+        with self.lock:
+            self.cancelled = True
+            for process in self.processes:
+                process.terminate()
 
     def check_lslib(self):
-        if self.addon_prefs.lslib_path is None or self.addon_prefs.lslib_path == "":
+        if self.lslib_path == "":
             helpers.report("LSLib path was not set up in addon preferences. Cannot convert to GR2.", "ERROR")
             return False
-            
-        lslib_path = Path(self.addon_prefs.lslib_path)
+
+        lslib_path = Path(self.lslib_path)
         if not lslib_path.is_file():
             helpers.report("The LSLib path set in addon preferences is invalid. Cannot convert to GR2.", "ERROR")
             return False
-        
+
         return True
 
     def build_export_options(self):
-        export_str = ""
+        export_args = []
         # Possible args:
         #"export-normals;export-tangents;export-uvs;export-colors;deduplicate-vertices;
         # deduplicate-uvs;recalculate-normals;recalculate-tangents;recalculate-iwt;flip-uvs;
@@ -41,19 +366,19 @@ class DivineInvoker:
         for prop,arg in divine_args.items():
             val = getattr(self.divine_prefs, prop, False)
             if val == True:
-                export_str += "-e " + arg + " "
+                export_args += ["-e", arg]
 
         gr2_settings = self.divine_prefs.gr2_settings
 
         for prop,arg in gr2_args.items():
             val = getattr(gr2_settings, prop, False)
             if val == True:
-                export_str += "-e " + arg + " "
+                export_args += ["-e", arg]
 
-        return export_str
+        return export_args
 
     def build_import_options(self):
-        args = ""
+        args = ["-e", "flip-uvs"]
         divine_args = {
             "x_flip_meshes": "x-flip-meshes",
             "mirror_skeletons": "mirror-skeletons"
@@ -62,58 +387,129 @@ class DivineInvoker:
         for prop,arg in divine_args.items():
             val = getattr(self.divine_prefs, prop, False)
             if val == True:
-                args += "-e " + arg + " "
+                args += ["-e", arg]
 
         return args
-    
-    def invoke_lslib(self, args):
+
+    def run_divine(self, args):
+        """Runs divine with the given arguments; returns (success, error message)."""
+        args = [self.lslib_path] + args
         print("[DOS2DE-Collada] Starting GR2 conversion using divine.exe.")
-        print("[DOS2DE-Collada] Sending command: {}".format(args))
+        print("[DOS2DE-Collada] Sending command: {}".format(subprocess.list2cmdline(args)))
 
-        try:
-            process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        except OSError as e:
-            helpers.report("Failed to launch lslib: " + str(e), "ERROR")
-            return False
+        with self.lock:
+            if self.cancelled:
+                return False, "Conversion was cancelled"
+            try:
+                process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            except OSError as e:
+                return False, "Failed to launch lslib: " + str(e)
+            self.processes.add(process)
 
-        print("STDERR: ", process.stderr)
-        print("STDOUT: ", process.stdout)
+        # stderr is drained separately so neither pipe can fill up and stall divine
+        stderr = []
+        stderr_reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        stderr_reader.start()
+        stdout = []
+        for line in process.stdout:
+            stdout.append(line)
+            if self.on_output is not None:
+                self.on_output(line.rstrip())
+        process.wait()
+        stderr_reader.join()
+        with self.lock:
+            self.processes.discard(process)
 
-        err = process.stderr
+        stdout = "".join(stdout)
+        stderr = "".join(stderr)
+        print("STDERR: ", stderr)
+        print("STDOUT: ", stdout)
+
+        if self.cancelled:
+            return False, "Conversion was cancelled"
+
+        err = stderr
         if (len(err)):
             err += '\n'
-        err += '\n'.join(process.stdout.splitlines()[-1:])
-        
-        if process.returncode != 0 or process.stdout.startswith('[FATAL] '):
-            if process.stdout.startswith('[FATAL] Value glb is not allowed'):
-                error_message = "LSLib v1.20 or later is required for glTF support"
-            else:
-                error_message = "Failed to convert GR2 (see the message log for more details). " + err
-            helpers.report(error_message, "ERROR")
-            return False
-        else:
-            return True
+        err += '\n'.join(stdout.splitlines()[-1:])
+
+        if process.returncode != 0 or stdout.startswith('[FATAL] '):
+            if stdout.startswith('[FATAL] Value glb is not allowed'):
+                return False, "LSLib v1.20 or later is required for glTF support"
+            return False, "Failed to convert GR2 (see the message log for more details). " + err
+        return True, None
 
+    def invoke_lslib(self, args):
+        ok, error = self.run_divine(args)
+        if not ok:
+            helpers.report(error, "ERROR")
+        return ok
+
+    def export_job(self, collada_path, gr2_path, format, game):
+        return ConversionJob(collada_path, gr2_path, format, "gr2", game, self.build_export_options())
+
+    def import_job(self, gr2_path, collada_path, format):
+        return ConversionJob(gr2_path, collada_path, "gr2", format, "bg3", self.build_import_options())
 
-    def export_gr2(self, collada_path, gr2_path, format):
+    def convert(self, jobs, workers=1):
+        """Converts the jobs in one session and reports the ones that failed."""
+        session = ConversionSession(self, workers)
+        for job in jobs:
+            session.add(job)
+        ok = session.run()
+        for job in session.jobs:
+            if job.success:
+                helpers.trace("[DOS2DE-Collada] {} '{}' in {:.2f}s.".format(
+                    "Copied cached" if job.cached else "Converted", job.destination, job.elapsed))
+            elif job.error is not None:
+                helpers.report("{}: {}".format(Path(job.source).name, job.error), "ERROR")
+        if len(jobs) > 1:
+            helpers.report(session.summary(), "INFO")
+        return ok
+
+    def convert_in_order(self, jobs, workers=1):
+        """Converts the jobs in the background and yields each one, in order,
+        as soon as it is finished, so the caller can import a file while the
+        next ones are still converting. Failed jobs are reported and yielded
+        too."""
         if not self.check_lslib():
-            return False
-        gr2_options_str = self.build_export_options()
-        divine_exe = '"{}"'.format(self.addon_prefs.lslib_path)
-        game_ver = bpy.context.scene.ls_properties.game
-        process_args = "{} --loglevel all -g {} -s {} -d {} -i {} -o gr2 -a convert-model {}".format(
-            divine_exe, game_ver, '"{}"'.format(collada_path), '"{}"'.format(gr2_path), format, gr2_options_str
-        )
+            for job in jobs:
+                job.success = False
+                yield job
+            return
 
-        return self.invoke_lslib(process_args)
+        workers = workers if workers > 0 else default_conversion_workers()
+        # Small batches let the first files finish early; each worker still
+        # gets a couple of batches so divine isn't started for every file
+        batch_size = max(1, -(-len(jobs) // (workers * IMPORT_BATCHES_PER_WORKER)))
+        conversion = BackgroundConversion(self, jobs, workers, batch_size=batch_size)
+        conversion.start()
+        try:
+            for job in jobs:
+                success = job.wait()
+                for type, msg in conversion.pending_messages():
+                    report_message(type, msg)
+                if success:
+                    helpers.trace("[DOS2DE-Collada] {} '{}' in {:.2f}s.".format(
+                        "Copied cached" if job.cached else "Converted", job.destination, job.elapsed))
+                elif job.error is not None:
+                    helpers.report("{}: {}".format(Path(job.source).name, job.error), "ERROR")
+                yield job
+        finally:
+            # Stops the remaining conversions if the caller gave up early;
+            # the thread may still be wrapping up after the last job
+            if not all(job.finished.is_set() for job in jobs):
+                conversion.cancel()
+            conversion.thread.join()
+            for type, msg in conversion.pending_messages():
+                report_message(type, msg)
+
+        session = conversion.session
+        if len(jobs) > 1:
+            helpers.report(session.summary(), "INFO")
+
+    def export_gr2(self, collada_path, gr2_path, format, game):
+        return self.convert([self.export_job(collada_path, gr2_path, format, game)])
 
     def import_gr2(self, gr2_path, collada_path, format):
-        if not self.check_lslib():
-            return False
-        gr2_options_str = self.build_import_options()
-        divine_exe = '"{}"'.format(self.addon_prefs.lslib_path)
-        process_args = "{} --loglevel all -g bg3 -s {} -d {} -i gr2 -o {} -a convert-model -e flip-uvs {}".format(
-            divine_exe, '"{}"'.format(gr2_path), '"{}"'.format(collada_path), format, gr2_options_str
-        )
-        
-        return self.invoke_lslib(process_args)
+        return self.convert([self.import_job(gr2_path, collada_path, format)])
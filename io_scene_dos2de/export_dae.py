@@ -29,7 +29,12 @@ import math
 import re
 import bpy
 import bmesh
-from mathutils import Vector, Matrix
+import numpy as np
+from mathutils import Matrix
+from . import anim_sampling, datablocks, fragments, geometry_cache, helpers, keyframe_reduction, mesh_data, profiling, section_writer, serialization, worker_pool
+
+# Rough size of a sampled mathutils.Matrix, for the memory report
+MATRIX_BYTES = 16 * 8 + 64
 
 # According to collada spec, order matters
 S_ASSET = 0
@@ -48,8 +53,6 @@ S_ANIM = 12
 S_SCENE = 13
 S_EXTRA = 14
 
-CMP_EPSILON = 0.0001
-
 
 def snap_tup(tup):
     ret = ()
@@ -59,15 +62,6 @@ def snap_tup(tup):
     return tup
 
 
-def strmtx(mtx):
-    s = ""
-    for x in range(4):
-        for y in range(4):
-            s += "{} ".format(mtx[x][y])
-    s = " {} ".format(s)
-    return s
-
-
 def numarr(a, mult=1.0):
     s = " "
     for x in a:
@@ -104,110 +98,132 @@ class DaeExporter:
     def make_name(self, d):
         return re.sub("\\.0[0-9][0-9]$", "", d)
 
+    def node_parent(self, node):
+        """Parent a node is exported under. Baked exports only keep meshes
+        under their armature, like the object copies do."""
+        if self.baked_transforms is None:
+            return node.parent
+        parent = node.parent
+        if (node.type == "MESH" and parent is not None and
+                parent.type == "ARMATURE" and parent in self.baked_transforms):
+            return parent
+        return None
+
+    def node_children(self, node):
+        if self.baked_transforms is None:
+            return node.children
+        return [c for c in node.children if self.node_parent(c) == node]
+
+    def node_matrix(self, node, world=False):
+        """Transform written for a node; baked exports move the geometry
+        and bones instead, leaving every node at the origin."""
+        if self.baked_transforms is not None:
+            return Matrix()
+        return node.matrix_world if world else node.matrix_local
+
+    def limit_vertex_groups(self, node, vertex_count, vertex_groups):
+        """Limits each vertex to MAX_INFLUENCES assignments and normalizes
+        them if requested, with the results of Blender's Limit Total and
+        Normalize All operators."""
+        vertex_groups = mesh_data.limit_vertex_groups(
+            vertex_count, *vertex_groups, mesh_data.MAX_INFLUENCES)
+        if not self.config["use_normalize_vert_groups"]:
+            return vertex_groups
+
+        locked = np.array([vg.lock_weight for vg in node.vertex_groups], dtype=bool)
+        # The active group is only kept as is when some group is locked
+        active = node.vertex_groups.active_index
+        if locked.any() and 0 <= active < len(locked):
+            locked[active] = True
+        return mesh_data.normalize_vertex_groups(vertex_count, *vertex_groups, locked)
+
     def new_id(self, t):
         self.last_id += 1
         return "id-{}-{}".format(t, self.last_id)
 
-    class Vertex:
-
-        def close_to(self, v):
-            if self.vertex - v.vertex.length() > CMP_EPSILON:
-                return False
-            if self.normal - v.normal.length() > CMP_EPSILON:
-                return False
-            if self.uv - v.uv.length() > CMP_EPSILON:
-                return False
-            if self.uv2 - v.uv2.length() > CMP_EPSILON:
-                return False
-
-            return True
-
-        def get_tup(self):
-            tup = (self.vertex.x, self.vertex.y, self.vertex.z, self.normal.x,
-                   self.normal.y, self.normal.z)
-            for t in self.uv:
-                tup = tup + (t.x, t.y)
-            if self.color is not None:
-                tup = tup + (self.color.x, self.color.y, self.color.z)
-            if self.tangent is not None:
-                tup = tup + (self.tangent.x, self.tangent.y, self.tangent.z)
-            if self.bitangent is not None:
-                tup = tup + (self.bitangent.x, self.bitangent.y,
-                             self.bitangent.z)
-            for t in self.bones:
-                tup = tup + (float(t), )
-            for t in self.weights:
-                tup = tup + (float(t), )
-
-            return tup
-
-        __slots__ = ("vertex", "normal", "tangent", "bitangent", "color", "uv",
-                     "uv2", "bones", "weights")
-
-        def __init__(self):
-            self.vertex = Vector((0.0, 0.0, 0.0))
-            self.normal = Vector((0.0, 0.0, 0.0))
-            self.tangent = None
-            self.bitangent = None
-            self.color = None
-            self.uv = []
-            self.uv2 = Vector((0.0, 0.0))
-            self.bones = []
-            self.weights = []
-
     def writel(self, section, indent, text):
-        if (not (section in self.sections)):
-            self.sections[section] = []
-        line = "{}{}".format(indent * "\t", text)
-        self.sections[section].append(line)
+        self.sections.writel(section, "{}{}".format(indent * "\t", text))
 
     def purge_empty_nodes(self):
-        sections = {}
-        for k, v in self.sections.items():
-            if not (len(v) == 2 and v[0][1:] == v[1][2:]):
-                sections[k] = v
-        self.sections = sections
-
-    def export_mesh(self, node, armature=None, skel_source=None, custom_name=None):
-        mesh = node.data
-        
-        if (node.data in self.mesh_cache):
-            return self.mesh_cache[mesh]
-
-        armature_modifier = None
-        armature_poses = None
-        armature_modifier_state = None
-        
-        if(self.config["use_apply_pose_to_armature"]):
-            armature_modifiers = [i for i in node.modifiers if i.type == "ARMATURE"]
-            if len(armature_modifiers) > 0:
-                armature_modifier = armature_modifiers[0]#node.modifiers.get("Armature")
+        for section in self.sections.keys():
+            if self.sections.is_empty_element(section):
+                self.sections.remove(section)
 
-        # Set armature in rest pose
-        if(armature_modifier):  
-            # the armature modifier must be disabled too
-            armature_modifier_state = armature_modifier.show_viewport
-            armature_modifier.show_viewport = False         
-            #doing this per object is inefficient, should be improved, maybe?
-            armature_poses = [arm.pose_position for arm in bpy.data.armatures]
-            for arm in bpy.data.armatures:
-                arm.pose_position = "REST"
-
-        name_to_use = self.make_name(mesh.name)
-        if (custom_name is not None and custom_name != ""):
-            name_to_use = custom_name
-
-        mesh = node.to_mesh(preserve_all_data_layers=False, depsgraph=bpy.context.evaluated_depsgraph_get()) 
-        # 2.8 update: warning, Blender does not support anymore the "RENDER" argument to apply modifier
-        # with render state, only current state
-        
-        # Restore armature and modifier state
-        if(armature_modifier):          
-            armature_modifier.show_viewport = armature_modifier_state           
-            for i,arm in enumerate(bpy.data.armatures):
-                arm.pose_position = armature_poses[i]
-
-        self.temp_meshes.add(mesh)
+    def report_unassigned_weights(self, node):
+        if not self.wrongvtx_report:
+            self.operator.report(
+                {"WARNING"},
+                "Mesh for object \"{}\" has unassigned "
+                "weights. This may look wrong in exported "
+                "model.".format(node.name))
+            self.wrongvtx_report = True
+
+    def extract_skin(self, vertex_count, group_bones, vertex_groups):
+        # Vertex groups are resolved to bones once per mesh and influences
+        # are read once per vertex; loops share the dense per-vertex arrays.
+        skin = mesh_data.build_skin_weights(vertex_count, *vertex_groups, group_bones)
+
+        unassigned = skin.counts == 0
+        # TODO: Explore how to deal with zero-weight bones,
+        #       which remain local
+        skin.bones[unassigned, 0] = 0
+        skin.weights[unassigned, 0] = 1.0
+        skin.counts[unassigned] = 1
+
+        return skin, bool(unassigned.any())
+
+    def model_extras(self, node):
+        """LSTools technique lines of a mesh; None if extra data is disabled."""
+        if self.config["extra_data_disabled"] != False:
+            return None
+
+        extras = []
+        obj_check = bpy.data.objects[node.name]
+
+        extra_settings = self.config["divine_settings"].gr2_settings.extras
+
+        ls_props = obj_check.data.ls_properties
+        if ls_props.rigid or extra_settings == "RIGID":
+            extras.append("<DivModelType>Rigid</DivModelType>")
+        if ls_props.cloth or extra_settings == "CLOTH":
+            extras.append("<DivModelType>Cloth</DivModelType>")
+        if ls_props.mesh_proxy or extra_settings == "MESHPROXY":
+            extras.append("<DivModelType>MeshProxy</DivModelType>")
+        if ls_props.proxy:
+            extras.append("<DivModelType>ProxyGeometry</DivModelType>")
+        if ls_props.spring:
+            extras.append("<DivModelType>Spring</DivModelType>")
+        if ls_props.occluder:
+            extras.append("<DivModelType>Occluder</DivModelType>")
+        if ls_props.cloth_physics:
+            extras.append("<DivModelType>ClothPhysics</DivModelType>")
+        if ls_props.cloth_flag1:
+            extras.append("<DivModelType>Cloth01</DivModelType>")
+        if ls_props.cloth_flag2:
+            extras.append("<DivModelType>Cloth02</DivModelType>")
+        if ls_props.cloth_flag4:
+            extras.append("<DivModelType>Cloth04</DivModelType>")
+        if ls_props.impostor:
+            extras.append("<IsImpostor>1</IsImpostor>")
+
+        if ls_props.export_order != 0:
+            extras.append("<ExportOrder>" + str(ls_props.export_order - 1) + "</ExportOrder>")
+
+        if ls_props.lod != 0:
+            extras.append("<LOD>" + str(ls_props.lod) + "</LOD>")
+
+        if ls_props.lod_distance != 0:
+            extras.append("<LODDistance>" + str(ls_props.lod_distance) + "</LODDistance>")
+
+        return extras
+
+    def build_geometry(self, mesh, name, extras, skin_info):
+        """Triangulates, deduplicates and serializes an evaluated mesh.
+
+        skin_info is None for unskinned meshes, otherwise a tuple of
+        (skeleton info, group -> bone lookup, vertex groups, bind shape matrix,
+        bind poses)."""
+        warnings = []
         triangulate = self.config["use_triangles"]
         if (triangulate):
             bm = bmesh.new()
@@ -217,26 +233,17 @@ class DaeExporter:
             bm.free()
 
         mesh.update(calc_edges=False, calc_edges_loose=False)
-        vertices = []
-        vertex_map = {}
-        surface_indices = {}
-
-        si = None
-        if armature is not None:
-            si = self.skeleton_info[armature]
 
         # TODO: Implement automatic tangent detection
         has_tangents = self.config["use_tangent"]
 
         has_colors = len(mesh.vertex_colors)
 
-        uv_layer_count = len(mesh.uv_layers)
         if has_tangents and len(mesh.uv_layers):
             try:
                 mesh.calc_tangents()
             except:
-                self.operator.report(
-                    {"WARNING"},
+                warnings.append(
                     "CalcTangets failed for mesh \"{}\", no tangets will be "
                     "exported.".format(mesh.name))
                 mesh.calc_normals_split()
@@ -246,453 +253,130 @@ class DaeExporter:
             mesh.calc_normals_split()
             has_tangents = False
 
-        for fi in range(len(mesh.polygons)):
-            f = mesh.polygons[fi]
-
-            if not (f.material_index in surface_indices):
-                surface_indices[f.material_index] = []
-
-            indices = surface_indices[f.material_index]
-            vi = []
-
-            for lt in range(f.loop_total):
-                loop_index = f.loop_start + lt
-                ml = mesh.loops[loop_index]
-                mv = mesh.vertices[ml.vertex_index]
-
-                v = self.Vertex()
-                v.vertex = Vector(mv.co)
-
-                for xt in mesh.uv_layers:
-                    v.uv.append(Vector(xt.data[loop_index].uv))
-
-                if (has_colors):
-                    v.color = Vector(
-                        mesh.vertex_colors[0].data[loop_index].color)
-
-                v.normal = Vector(ml.normal)
-
-                if (has_tangents):
-                    v.tangent = Vector(ml.tangent)
-                    v.bitangent = Vector(ml.bitangent)
-
-                if armature is not None:
-                    wsum = 0.0
-
-                    for vg in mv.groups:
-                        if vg.group >= len(node.vertex_groups):
-                            continue
-                        name = node.vertex_groups[vg.group].name
-
-                        if (name in si["bone_index"]):
-                            # TODO: Try using 0.0001 since Blender uses
-                            #       zero weight
-                            if (vg.weight > 0.001):
-                                v.bones.append(si["bone_index"][name])
-                                v.weights.append(vg.weight)
-                                wsum += vg.weight
-                    if (wsum == 0.0):
-                        if not self.wrongvtx_report:
-                            self.operator.report(
-                                {"WARNING"},
-                                "Mesh for object \"{}\" has unassigned "
-                                "weights. This may look wrong in exported "
-                                "model.".format(node.name))
-                            self.wrongvtx_report = True
-
-                        # TODO: Explore how to deal with zero-weight bones,
-                        #       which remain local
-                        v.bones.append(0)
-                        v.weights.append(1)
-
-                tup = v.get_tup()
-                idx = 0
-                # Do not optmize if using shapekeys
-                if tup in vertex_map:
-                    idx = vertex_map[tup]
-                else:
-                    idx = len(vertices)
-                    vertices.append(v)
-                    vertex_map[tup] = idx
+        loop_attrs = mesh_data.extract_loop_attributes(mesh, has_tangents, has_colors)
 
-                vi.append(idx)
+        skin = None
+        unassigned = False
+        if skin_info is not None:
+            si, group_bones, vertex_groups, bind_shape_matrix, bind_poses = skin_info
+            skin, unassigned = self.extract_skin(len(mesh.vertices), group_bones, vertex_groups)
 
-            if (len(vi) > 2):  # Only triangles and above
-                indices.append(vi)
+        vertices = mesh_data.build_vertex_buffer(loop_attrs, skin)
+        surfaces = mesh_data.build_surfaces(loop_attrs, vertices.loop_vertices)
 
-        meshid = self.new_id("mesh")
-        self.writel(
-            S_GEOM, 1, "<geometry id=\"{}\" name=\"{}\">".format(
-                meshid, name_to_use))
-
-        self.writel(S_GEOM, 2, "<mesh>")
+        # Formatting only needs the arrays and may run in a worker process
+        geometry = self.pool.submit(
+            vertices.value_count() + len(loop_attrs.vertex_indices), fragments.geometry,
+            geometry_cache.MESH_ID, name, vertices, surfaces, triangulate, extras)
 
-        # Vertex Array
-        self.writel(S_GEOM, 3, "<source id=\"{}-positions\">".format(meshid))
-        float_values = ""
-        for v in vertices:
-            float_values += " {} {} {}".format(
-                v.vertex.x, v.vertex.y, v.vertex.z)
-        self.writel(
-            S_GEOM, 4, "<float_array id=\"{}-positions-array\" "
-            "count=\"{}\">{}</float_array>".format(
-                meshid, len(vertices) * 3, float_values))
-        self.writel(S_GEOM, 4, "<technique_common>")
-        self.writel(
-            S_GEOM, 4, "<accessor source=\"#{}-positions-array\" "
-            "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
-        self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
-        self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
-        self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
-        self.writel(S_GEOM, 4, "</accessor>")
-        self.writel(S_GEOM, 4, "</technique_common>")
-        self.writel(S_GEOM, 3, "</source>")
+        skin_controller = None
+        if skin_info is not None:
+            skin_controller = self.pool.submit(
+                len(vertices) * mesh_data.MAX_INFLUENCES * 3, fragments.skin_controller,
+                geometry_cache.CONTROLLER_ID, geometry_cache.SKIN_SOURCE_ID,
+                bind_shape_matrix, si["bone_names"], bind_poses, vertices.skin)
 
-        # Normals Array
-        self.writel(S_GEOM, 3, "<source id=\"{}-normals\">".format(meshid))
-        float_values = ""
-        for v in vertices:
-            float_values += " {} {} {}".format(
-                v.normal.x, v.normal.y, v.normal.z)
-        self.writel(
-            S_GEOM, 4, "<float_array id=\"{}-normals-array\" "
-            "count=\"{}\">{}</float_array>".format(
-                meshid, len(vertices) * 3, float_values))
-        self.writel(S_GEOM, 4, "<technique_common>")
-        self.writel(
-            S_GEOM, 4, "<accessor source=\"#{}-normals-array\" count=\"{}\" "
-            "stride=\"3\">".format(meshid, len(vertices)))
-        self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
-        self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
-        self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
-        self.writel(S_GEOM, 4, "</accessor>")
-        self.writel(S_GEOM, 4, "</technique_common>")
-        self.writel(S_GEOM, 3, "</source>")
+        return geometry_cache.CachedGeometry(geometry, skin_controller, warnings, unassigned)
 
-        if (has_tangents):
-            # Tangents
-            self.writel(
-                S_GEOM, 3, "<source id=\"{}-tangents\">".format(meshid))
-            float_values = ""
-            for v in vertices:
-                float_values += " {} {} {}".format(
-                    v.tangent.x, v.tangent.y, v.tangent.z)
-            self.writel(
-                S_GEOM, 4, "<float_array id=\"{}-tangents-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    meshid, len(vertices) * 3, float_values))
-            self.writel(S_GEOM, 4, "<technique_common>")
-            self.writel(
-                S_GEOM, 4, "<accessor source=\"#{}-tangents-array\" "
-                "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
-            self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
-            self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
-            self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
-            self.writel(S_GEOM, 4, "</accessor>")
-            self.writel(S_GEOM, 4, "</technique_common>")
-            self.writel(S_GEOM, 3, "</source>")
-
-            # Bitangents
-            self.writel(S_GEOM, 3, "<source id=\"{}-bitangents\">".format(
-                meshid))
-            float_values = ""
-            for v in vertices:
-                float_values += " {} {} {}".format(
-                    v.bitangent.x, v.bitangent.y, v.bitangent.z)
-            self.writel(
-                S_GEOM, 4, "<float_array id=\"{}-bitangents-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    meshid, len(vertices) * 3, float_values))
-            self.writel(S_GEOM, 4, "<technique_common>")
-            self.writel(
-                S_GEOM, 4, "<accessor source=\"#{}-bitangents-array\" "
-                "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
-            self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
-            self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
-            self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
-            self.writel(S_GEOM, 4, "</accessor>")
-            self.writel(S_GEOM, 4, "</technique_common>")
-            self.writel(S_GEOM, 3, "</source>")
-
-        # UV Arrays
-        for uvi in range(uv_layer_count):
-            self.writel(S_GEOM, 3, "<source id=\"{}-texcoord-{}\">".format(
-                meshid, uvi))
-            float_values = ""
-            for v in vertices:
-                try:
-                    float_values += " {} {}".format(v.uv[uvi].x, v.uv[uvi].y)
-                except:
-                    # TODO: Review, understand better the multi-uv-layer API
-                    float_values += " 0 0 "
+    def export_mesh(self, node, armature=None, skel_source=None, custom_name=None):
+        mesh = node.data
 
-            self.writel(
-                S_GEOM, 4, "<float_array id=\"{}-texcoord-{}-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    meshid, uvi, len(vertices) * 2, float_values))
-            self.writel(S_GEOM, 4, "<technique_common>")
-            self.writel(
-                S_GEOM, 4, "<accessor source=\"#{}-texcoord-{}-array\" "
-                "count=\"{}\" stride=\"2\">".format(
-                    meshid, uvi, len(vertices)))
-            self.writel(S_GEOM, 5, "<param name=\"S\" type=\"float\"/>")
-            self.writel(S_GEOM, 5, "<param name=\"T\" type=\"float\"/>")
-            self.writel(S_GEOM, 4, "</accessor>")
-            self.writel(S_GEOM, 4, "</technique_common>")
-            self.writel(S_GEOM, 3, "</source>")
-
-        # Color Arrays
-        if (has_colors):
-            self.writel(S_GEOM, 3, "<source id=\"{}-colors\">".format(meshid))
-            float_values = ""
-            for v in vertices:
-                float_values += " {} {} {}".format(
-                    v.color.x, v.color.y, v.color.z)
-            self.writel(
-                S_GEOM, 4, "<float_array id=\"{}-colors-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    meshid, len(vertices) * 3, float_values))
-            self.writel(S_GEOM, 4, "<technique_common>")
-            self.writel(
-                S_GEOM, 4, "<accessor source=\"#{}-colors-array\" "
-                "count=\"{}\" stride=\"3\">".format(meshid, len(vertices)))
-            self.writel(S_GEOM, 5, "<param name=\"X\" type=\"float\"/>")
-            self.writel(S_GEOM, 5, "<param name=\"Y\" type=\"float\"/>")
-            self.writel(S_GEOM, 5, "<param name=\"Z\" type=\"float\"/>")
-            self.writel(S_GEOM, 4, "</accessor>")
-            self.writel(S_GEOM, 4, "</technique_common>")
-            self.writel(S_GEOM, 3, "</source>")
-
-        # Triangle Lists
-        self.writel(S_GEOM, 3, "<vertices id=\"{}-vertices\">".format(meshid))
-        self.writel(
-            S_GEOM, 4,
-            "<input semantic=\"POSITION\" source=\"#{}-positions\"/>".format(
-                meshid))
-        self.writel(S_GEOM, 3, "</vertices>")
+        armature_modifier = None
+        armature_poses = None
+        armature_modifier_state = None
+        
+        if(self.config["use_apply_pose_to_armature"]):
+            armature_modifiers = [i for i in node.modifiers if i.type == "ARMATURE"]
+            if len(armature_modifiers) > 0:
+                armature_modifier = armature_modifiers[0]#node.modifiers.get("Armature")
 
-        prim_type = ""
-        if (triangulate):
-            prim_type = "triangles"
-        else:
-            prim_type = "polygons"
+        # Set armature in rest pose
+        if(armature_modifier):  
+            # the armature modifier must be disabled too
+            armature_modifier_state = armature_modifier.show_viewport
+            armature_modifier.show_viewport = False         
+            #doing this per object is inefficient, should be improved, maybe?
+            armature_poses = [arm.pose_position for arm in bpy.data.armatures]
+            for arm in bpy.data.armatures:
+                arm.pose_position = "REST"
 
-        for m in surface_indices:
-            indices = surface_indices[m]
+        name_to_use = self.make_name(mesh.name)
+        if (custom_name is not None and custom_name != ""):
+            name_to_use = custom_name
 
-            self.writel(S_GEOM, 3, "<{} count=\"{}\">".format(
-                prim_type, int(len(indices))))
+        mesh = node.to_mesh(preserve_all_data_layers=False, depsgraph=bpy.context.evaluated_depsgraph_get()) 
+        if self.baked_transforms is not None:
+            mesh.transform(self.baked_transforms[node])
+        # 2.8 update: warning, Blender does not support anymore the "RENDER" argument to apply modifier
+        # with render state, only current state
+        
+        # Restore armature and modifier state
+        if(armature_modifier):          
+            armature_modifier.show_viewport = armature_modifier_state           
+            for i,arm in enumerate(bpy.data.armatures):
+                arm.pose_position = armature_poses[i]
 
-            self.writel(
-                S_GEOM, 4, "<input semantic=\"VERTEX\" "
-                "source=\"#{}-vertices\" offset=\"0\"/>".format(meshid))
-            self.writel(
-                S_GEOM, 4, "<input semantic=\"NORMAL\" "
-                "source=\"#{}-normals\" offset=\"0\"/>".format(meshid))
+        self.arena.add_evaluated(node, mesh)
+        extras = self.model_extras(node)
 
-            for uvi in range(uv_layer_count):
-                self.writel(
-                    S_GEOM, 4,
-                    "<input semantic=\"TEXCOORD\" source=\"#{}-texcoord-{}\" "
-                    "offset=\"0\" set=\"{}\"/>".format(meshid, uvi, uvi))
+        # Geometry is looked up by content, both within this export (so meshes
+        # with identical results share one element) and across exports
+        mesh.calc_normals_split()
+        key = geometry_cache.ContentKey()
+        key.add_value((self.config["use_triangles"], self.config["use_tangent"],
+                       name_to_use, extras))
+        key.add_mesh(mesh)
 
-            if (has_colors):
-                self.writel(
-                    S_GEOM, 4, "<input semantic=\"COLOR\" "
-                    "source=\"#{}-colors\" offset=\"0\"/>".format(meshid))
-            if (has_tangents):
-                self.writel(
-                    S_GEOM, 4, "<input semantic=\"TEXTANGENT\" "
-                    "source=\"#{}-tangents\" offset=\"0\"/>".format(meshid))
-                self.writel(
-                    S_GEOM, 4, "<input semantic=\"TEXBINORMAL\" "
-                    "source=\"#{}-bitangents\" offset=\"0\"/>".format(meshid))
-
-            if (triangulate):
-                int_values = "<p>"
-                for p in indices:
-                    for i in p:
-                        int_values += " {}".format(i)
-                int_values += " </p>"
-                self.writel(S_GEOM, 4, int_values)
+        skin_info = None
+        if armature is not None:
+            si = self.skeleton_info[armature]
+            group_bones = mesh_data.group_bone_lookup(node.vertex_groups, si["bone_index"])
+            vertex_groups = self.limit_vertex_groups(
+                node, len(mesh.vertices), mesh_data.extract_vertex_groups(mesh))
+            parent = self.node_parent(node)
+            if parent is not None and armature.name == parent.name:
+                bind_shape_matrix = np.array(self.node_matrix(node), dtype=np.float64)
             else:
-                for p in indices:
-                    int_values = "<p>"
-                    for i in p:
-                        int_values += " {}".format(i)
-                    int_values += " </p>"
-                    self.writel(S_GEOM, 4, int_values)
+                bind_shape_matrix = np.array(self.node_matrix(node, world=True), dtype=np.float64)
+            bind_poses = np.array(si["bone_bind_poses"], dtype=np.float64).reshape(-1, 4, 4)
+            skin_info = (si, group_bones, vertex_groups, bind_shape_matrix, bind_poses)
+
+            key.add_value(si["bone_names"])
+            key.add_array(bind_shape_matrix)
+            key.add_array(bind_poses)
+            key.add_array(group_bones)
+            for arr in vertex_groups:
+                key.add_array(arr)
+
+        key = (key.digest(), skel_source)
+        meshdata = self.mesh_cache.get(key)
+        if meshdata is not None:
+            return meshdata
+
+        entry = self.new_geometry.get(key[0])
+        if entry is None:
+            entry = geometry_cache.cache.get(key[0])
+        if entry is None:
+            entry = self.build_geometry(mesh, name_to_use, extras, skin_info)
+            self.new_geometry[key[0]] = entry
+
+        for msg in entry.warnings:
+            self.operator.report({"WARNING"}, msg)
+        if entry.unassigned_weights:
+            self.report_unassigned_weights(node)
 
-            self.writel(S_GEOM, 3, "</{}>".format(prim_type))
-
-        # LSLib model type / extra data
-        if self.config["extra_data_disabled"] == False:
-            self.writel(S_GEOM, 3, "<extra>")
-            self.writel(S_GEOM, 4, "<technique profile=\"LSTools\">")
-            
-            obj_check = bpy.data.objects[node.name]
-
-            extra_settings = self.config["divine_settings"].gr2_settings.extras
-
-            ls_props = obj_check.data.ls_properties
-            if ls_props.rigid or extra_settings == "RIGID":
-                self.writel(S_GEOM, 5, "<DivModelType>Rigid</DivModelType>")
-            if ls_props.cloth or extra_settings == "CLOTH":
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth</DivModelType>")
-            if ls_props.mesh_proxy or extra_settings == "MESHPROXY":
-                self.writel(S_GEOM, 5, "<DivModelType>MeshProxy</DivModelType>")
-            if ls_props.proxy:
-                self.writel(S_GEOM, 5, "<DivModelType>ProxyGeometry</DivModelType>")
-            if ls_props.spring:
-                self.writel(S_GEOM, 5, "<DivModelType>Spring</DivModelType>")
-            if ls_props.occluder:
-                self.writel(S_GEOM, 5, "<DivModelType>Occluder</DivModelType>")
-            if ls_props.cloth_physics:
-                self.writel(S_GEOM, 5, "<DivModelType>ClothPhysics</DivModelType>")
-            if ls_props.cloth_flag1:
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth01</DivModelType>")
-            if ls_props.cloth_flag2:
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth02</DivModelType>")
-            if ls_props.cloth_flag4:
-                self.writel(S_GEOM, 5, "<DivModelType>Cloth04</DivModelType>")
-            if ls_props.impostor:
-                self.writel(S_GEOM, 5, "<IsImpostor>1</IsImpostor>")
-
-            if ls_props.export_order != 0:
-                self.writel(S_GEOM, 5, "<ExportOrder>" + str(ls_props.export_order - 1) + "</ExportOrder>")
-
-            if ls_props.lod != 0:
-                self.writel(S_GEOM, 5, "<LOD>" + str(ls_props.lod) + "</LOD>")
-
-            if ls_props.lod_distance != 0:
-                self.writel(S_GEOM, 5, "<LODDistance>" + str(ls_props.lod_distance) + "</LODDistance>")
-
-            self.writel(S_GEOM, 4, "</technique>")
-            self.writel(S_GEOM, 3, "</extra>")
-
-        self.writel(S_GEOM, 2, "</mesh>")
-        self.writel(S_GEOM, 1, "</geometry>")
+        meshid = self.new_id("mesh")
+        self.sections.write_task(S_GEOM, entry.geometry_lines(meshid))
 
         meshdata = {}
         meshdata["id"] = meshid
-        self.mesh_cache[node.data] = meshdata
+        self.mesh_cache[key] = meshdata
 
         # Export armature data (if armature exists)
         if armature is not None:
             contid = self.new_id("controller")
-
-            self.writel(S_SKIN, 1, "<controller id=\"{}\">".format(contid))
-            if (skel_source is not None):
-                self.writel(S_SKIN, 2, "<skin source=\"#{}\">".format(
-                    skel_source))
-            else:
-                self.writel(S_SKIN, 2, "<skin source=\"#{}\">".format(meshid))
-
-            if node.parent is not None and armature.name == node.parent.name:
-                self.writel(
-                    S_SKIN, 3, "<bind_shape_matrix>{}</bind_shape_matrix>".format(
-                        strmtx(node.matrix_local)))
-            else:
-                self.writel(
-                    S_SKIN, 3, "<bind_shape_matrix>{}</bind_shape_matrix>".format(
-                        strmtx(node.matrix_world)))
-                
-            # Joint Names
-            self.writel(S_SKIN, 3, "<source id=\"{}-joints\">".format(contid))
-            name_values = ""
-            for v in si["bone_names"]:
-                name_values += " {}".format(v)
-
-            self.writel(
-                S_SKIN, 4, "<Name_array id=\"{}-joints-array\" "
-                "count=\"{}\">{}</Name_array>".format(
-                    contid, len(si["bone_names"]), name_values))
-            self.writel(S_SKIN, 4, "<technique_common>")
-            self.writel(
-                S_SKIN, 4, "<accessor source=\"#{}-joints-array\" "
-                "count=\"{}\" stride=\"1\">".format(
-                    contid, len(si["bone_names"])))
-            self.writel(S_SKIN, 5, "<param name=\"JOINT\" type=\"Name\"/>")
-            self.writel(S_SKIN, 4, "</accessor>")
-            self.writel(S_SKIN, 4, "</technique_common>")
-            self.writel(S_SKIN, 3, "</source>")
-            # Pose Matrices!
-            self.writel(S_SKIN, 3, "<source id=\"{}-bind_poses\">".format(
-                contid))
-            pose_values = ""
-            for v in si["bone_bind_poses"]:
-                pose_values += " {}".format(strmtx(v))
-
-            self.writel(
-                S_SKIN, 4, "<float_array id=\"{}-bind_poses-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    contid, len(si["bone_bind_poses"]) * 16, pose_values))
-            self.writel(S_SKIN, 4, "<technique_common>")
-            self.writel(
-                S_SKIN, 4, "<accessor source=\"#{}-bind_poses-array\" "
-                "count=\"{}\" stride=\"16\">".format(
-                    contid, len(si["bone_bind_poses"])))
-            self.writel(
-                S_SKIN, 5, "<param name=\"TRANSFORM\" type=\"float4x4\"/>")
-            self.writel(S_SKIN, 4, "</accessor>")
-            self.writel(S_SKIN, 4, "</technique_common>")
-            self.writel(S_SKIN, 3, "</source>")
-            # Skin Weights!
-            self.writel(S_SKIN, 3, "<source id=\"{}-skin_weights\">".format(
-                contid))
-            skin_weights = ""
-            skin_weights_total = 0
-            for v in vertices:
-                skin_weights_total += len(v.weights)
-                for w in v.weights:
-                    skin_weights += " {}".format(w)
-
-            self.writel(
-                S_SKIN, 4, "<float_array id=\"{}-skin_weights-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    contid, skin_weights_total, skin_weights))
-            self.writel(S_SKIN, 4, "<technique_common>")
-            self.writel(
-                S_SKIN, 4, "<accessor source=\"#{}-skin_weights-array\" "
-                "count=\"{}\" stride=\"1\">".format(
-                    contid, skin_weights_total))
-            self.writel(S_SKIN, 5, "<param name=\"WEIGHT\" type=\"float\"/>")
-            self.writel(S_SKIN, 4, "</accessor>")
-            self.writel(S_SKIN, 4, "</technique_common>")
-            self.writel(S_SKIN, 3, "</source>")
-
-            self.writel(S_SKIN, 3, "<joints>")
-            self.writel(
-                S_SKIN, 4,
-                "<input semantic=\"JOINT\" source=\"#{}-joints\"/>".format(
-                    contid))
-            self.writel(
-                S_SKIN, 4, "<input semantic=\"INV_BIND_MATRIX\" "
-                "source=\"#{}-bind_poses\"/>".format(contid))
-            self.writel(S_SKIN, 3, "</joints>")
-            self.writel(
-                S_SKIN, 3, "<vertex_weights count=\"{}\">".format(
-                    len(vertices)))
-            self.writel(
-                S_SKIN, 4, "<input semantic=\"JOINT\" "
-                "source=\"#{}-joints\" offset=\"0\"/>".format(contid))
-            self.writel(
-                S_SKIN, 4, "<input semantic=\"WEIGHT\" "
-                "source=\"#{}-skin_weights\" offset=\"1\"/>".format(contid))
-            vcounts = ""
-            vs = ""
-            vcount = 0
-            for v in vertices:
-                vcounts += " {}".format(len(v.weights))
-                for b in v.bones:
-                    vs += " {} {}".format(b, vcount)
-                    vcount += 1
-            self.writel(S_SKIN, 4, "<vcount>{}</vcount>".format(vcounts))
-            self.writel(S_SKIN, 4, "<v>{}</v>".format(vs))
-            self.writel(S_SKIN, 3, "</vertex_weights>")
-
-            self.writel(S_SKIN, 2, "</skin>")
-            self.writel(S_SKIN, 1, "</controller>")
+            source_id = skel_source if skel_source is not None else meshid
+            self.sections.write_task(S_SKIN, entry.skin_lines(contid, source_id))
             meshdata["skin_id"] = contid
 
         return meshdata
@@ -708,9 +392,10 @@ class DaeExporter:
                 if n.object:# make sure the armature modifier is not null
                     armcount += 1
 
-        if (node.parent is not None):
-            if (node.parent.type == "ARMATURE"):
-                armature = node.parent
+        parent = self.node_parent(node)
+        if (parent is not None):
+            if (parent.type == "ARMATURE"):
+                armature = parent
                 if (armcount > 1):
                     self.operator.report(
                         {"WARNING"}, "Object \"{}\" refers "
@@ -722,13 +407,15 @@ class DaeExporter:
                         "of an armature, but has no armature modifier.".format(
                             node.name))
 
-        if (armcount > 0 and not armature):
+        # Copies of objects whose parent does not export lose their armature modifier
+        if (armcount > 0 and not armature and parent == node.parent):
             self.operator.report(
                 {"WARNING"},
                 "Object \"{}\" has armature modifier, but is not a child of "
                 "an armature. This is unsupported.".format(node.name))
     
-        meshdata = self.export_mesh(node, armature)
+        with self.timings.stage("mesh '{}'".format(node.name)):
+            meshdata = self.export_mesh(node, armature)
         close_controller = False
 
         if ("skin_id" in meshdata):
@@ -786,20 +473,20 @@ class DaeExporter:
         if (is_ctrl_bone is False):
             il += 1
 
-        xform = bone.matrix_local
+        xform = si["bone_xform"] @ bone.matrix_local
         if (is_ctrl_bone is False):
             si["bone_bind_poses"].append(
                     (si["armature_xform"] @ xform).inverted_safe())
 
         if (bone.parent is not None):
-            xform = bone.parent.matrix_local.inverted_safe() @ xform
+            xform = (si["bone_xform"] @ bone.parent.matrix_local).inverted_safe() @ xform
         else:
             si["skeleton_nodes"].append(boneid)
 
         if (is_ctrl_bone is False):
             self.writel(
                 S_NODES, il, "<matrix sid=\"transform\">{}</matrix>".format(
-                    strmtx(xform)))
+                    serialization.matrix(xform)))
 
         for c in bone.children:
             self.export_armature_bone(c, il, si)
@@ -833,7 +520,9 @@ class DaeExporter:
             "bone_names": [],
             "bone_bind_poses": [],
             "skeleton_nodes": [],
-            "armature_xform": node.matrix_world
+            "armature_xform": self.node_matrix(node, world=True),
+            # Baked exports move the bones instead of the armature
+            "bone_xform": self.baked_transforms[node] if self.baked_transforms is not None else Matrix()
         }
 
         for b in armature.bones:
@@ -896,9 +585,7 @@ class DaeExporter:
                     interps.append("LINEAR")
 
         self.writel(S_GEOM, 3, "<source id=\"{}-positions\">".format(splineid))
-        position_values = ""
-        for x in points:
-            position_values += " {}".format(x)
+        position_values = serialization.float_array(points)
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-positions-array\" "
             "count=\"{}\">{}</float_array>".format(
@@ -916,9 +603,7 @@ class DaeExporter:
 
         self.writel(
             S_GEOM, 3, "<source id=\"{}-intangents\">".format(splineid))
-        intangent_values = ""
-        for x in handles_in:
-            intangent_values += " {}".format(x)
+        intangent_values = serialization.float_array(handles_in)
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-intangents-array\" "
             "count=\"{}\">{}</float_array>".format(
@@ -936,9 +621,7 @@ class DaeExporter:
 
         self.writel(S_GEOM, 3, "<source id=\"{}-outtangents\">".format(
             splineid))
-        outtangent_values = ""
-        for x in handles_out:
-            outtangent_values += " {}".format(x)
+        outtangent_values = serialization.float_array(handles_out)
         self.writel(
             S_GEOM, 4, "<float_array id=\"{}-outtangents-array\" "
             "count=\"{}\">{}</float_array>".format(
@@ -956,9 +639,7 @@ class DaeExporter:
 
         self.writel(
             S_GEOM, 3, "<source id=\"{}-interpolations\">".format(splineid))
-        interpolation_values = ""
-        for x in interps:
-            interpolation_values += " {}".format(x)
+        interpolation_values = serialization.name_array(interps)
         self.writel(
             S_GEOM, 4, "<Name_array id=\"{}-interpolations-array\" "
             "count=\"{}\">{}</Name_array>"
@@ -973,9 +654,7 @@ class DaeExporter:
         self.writel(S_GEOM, 3, "</source>")
 
         self.writel(S_GEOM, 3, "<source id=\"{}-tilts\">".format(splineid))
-        tilt_values = ""
-        for x in tilts:
-            tilt_values += " {}".format(x)
+        tilt_values = serialization.float_array(tilts)
         self.writel(
             S_GEOM, 4,
             "<float_array id=\"{}-tilts-array\" count=\"{}\">{}</float_array>"
@@ -1038,7 +717,7 @@ class DaeExporter:
 
         self.writel(
             S_NODES, il, "<matrix sid=\"transform\">{}</matrix>".format(
-                strmtx(node.matrix_local)))
+                serialization.matrix(self.node_matrix(node))))
         if (node.type == "MESH"):
             self.export_mesh_node(node, il)
         elif (node.type == "CURVE"):
@@ -1046,7 +725,7 @@ class DaeExporter:
         elif (node.type == "ARMATURE"):
             self.export_armature_node(node, il)
 
-        for x in sorted(node.children, key=lambda x: x.name):
+        for x in sorted(self.node_children(node), key=lambda x: x.name):
             self.export_node(x, il)
 
         il -= 1
@@ -1084,10 +763,10 @@ class DaeExporter:
                 while (n is not None):
                     if (n not in self.valid_nodes):
                         self.valid_nodes.append(n)
-                    n = n.parent
+                    n = self.node_parent(n)
 
         for obj in sorted(self.objects, key=lambda x: x.name):
-            if (obj in self.valid_nodes and obj.parent is None):
+            if (obj in self.valid_nodes and self.node_parent(obj) is None):
                 self.export_node(obj, 2)
 
         self.writel(S_NODES, 1, "</visual_scene>")
@@ -1112,116 +791,35 @@ class DaeExporter:
             self.writel(S_ASSET, 1, "<up_axis>Z_UP</up_axis>")
         self.writel(S_ASSET, 0, "</asset>")
 
-    def export_animation_transform_channel(self, target, keys, matrices=True):
-        frame_total = len(keys)
-        anim_id = self.new_id("anim")
-        self.writel(S_ANIM, 1, "<animation id=\"{}\">".format(anim_id))
-        source_frames = ""
-        source_transforms = ""
-        source_interps = ""
-
-        for k in keys:
-            source_frames += " {}".format(k[0])
-            if (matrices):
-                source_transforms += " {}".format(strmtx(k[1]))
-            else:
-                source_transforms += " {}".format(k[1])
-
-            source_interps += " LINEAR"
-
-        # Time Source
-        self.writel(S_ANIM, 2, "<source id=\"{}-input\">".format(anim_id))
-        self.writel(
-            S_ANIM, 3, "<float_array id=\"{}-input-array\" "
-            "count=\"{}\">{}</float_array>".format(
-                anim_id, frame_total, source_frames))
-        self.writel(S_ANIM, 3, "<technique_common>")
-        self.writel(
-            S_ANIM, 4, "<accessor source=\"#{}-input-array\" "
-            "count=\"{}\" stride=\"1\">".format(anim_id, frame_total))
-        self.writel(S_ANIM, 5, "<param name=\"TIME\" type=\"float\"/>")
-        self.writel(S_ANIM, 4, "</accessor>")
-        self.writel(S_ANIM, 3, "</technique_common>")
-        self.writel(S_ANIM, 2, "</source>")
-
-        if (matrices):
-            # Transform Source
-            self.writel(
-                S_ANIM, 2, "<source id=\"{}-transform-output\">".format(
-                    anim_id))
-            self.writel(
-                S_ANIM, 3, "<float_array id=\"{}-transform-output-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    anim_id, frame_total * 16, source_transforms))
-            self.writel(S_ANIM, 3, "<technique_common>")
-            self.writel(
-                S_ANIM, 4,
-                "<accessor source=\"#{}-transform-output-array\" count=\"{}\" "
-                "stride=\"16\">".format(anim_id, frame_total))
-            self.writel(
-                S_ANIM, 5, "<param name=\"TRANSFORM\" type=\"float4x4\"/>")
-            self.writel(S_ANIM, 4, "</accessor>")
-            self.writel(S_ANIM, 3, "</technique_common>")
-            self.writel(S_ANIM, 2, "</source>")
-        else:
-            # Value Source
-            self.writel(
-                S_ANIM, 2,
-                "<source id=\"{}-transform-output\">".format(anim_id))
-            self.writel(
-                S_ANIM, 3, "<float_array id=\"{}-transform-output-array\" "
-                "count=\"{}\">{}</float_array>".format(
-                    anim_id, frame_total, source_transforms))
-            self.writel(S_ANIM, 3, "<technique_common>")
-            self.writel(
-                S_ANIM, 4, "<accessor source=\"#{}-transform-output-array\" "
-                "count=\"{}\" stride=\"1\">".format(anim_id, frame_total))
-            self.writel(S_ANIM, 5, "<param name=\"X\" type=\"float\"/>")
-            self.writel(S_ANIM, 4, "</accessor>")
-            self.writel(S_ANIM, 3, "</technique_common>")
-            self.writel(S_ANIM, 2, "</source>")
-
-        # Interpolation Source
-        self.writel(
-            S_ANIM, 2, "<source id=\"{}-interpolation-output\">".format(
-                anim_id))
-        self.writel(
-            S_ANIM, 3, "<Name_array id=\"{}-interpolation-output-array\" "
-            "count=\"{}\">{}</Name_array>".format(
-                anim_id, frame_total, source_interps))
-        self.writel(S_ANIM, 3, "<technique_common>")
-        self.writel(
-            S_ANIM, 4, "<accessor source=\"#{}-interpolation-output-array\" "
-            "count=\"{}\" stride=\"1\">".format(anim_id, frame_total))
-        self.writel(S_ANIM, 5, "<param name=\"INTERPOLATION\" type=\"Name\"/>")
-        self.writel(S_ANIM, 4, "</accessor>")
-        self.writel(S_ANIM, 3, "</technique_common>")
-        self.writel(S_ANIM, 2, "</source>")
-
-        self.writel(S_ANIM, 2, "<sampler id=\"{}-sampler\">".format(anim_id))
-        self.writel(
-            S_ANIM, 3,
-            "<input semantic=\"INPUT\" source=\"#{}-input\"/>".format(anim_id))
-        self.writel(
-            S_ANIM, 3, "<input semantic=\"OUTPUT\" "
-            "source=\"#{}-transform-output\"/>".format(anim_id))
-        self.writel(
-            S_ANIM, 3, "<input semantic=\"INTERPOLATION\" "
-            "source=\"#{}-interpolation-output\"/>".format(anim_id))
-        self.writel(S_ANIM, 2, "</sampler>")
-        if (matrices):
-            self.writel(
-                S_ANIM, 2, "<channel source=\"#{}-sampler\" "
-                "target=\"{}/transform\"/>".format(anim_id, target))
-        else:
-            self.writel(
-                S_ANIM, 2, "<channel source=\"#{}-sampler\" "
-                "target=\"{}\"/>".format(anim_id, target))
-        self.writel(S_ANIM, 1, "</animation>")
+    def exported_bone_parents(self, node):
+        """Maps the exported bones of an armature to the name of the bone
+        their animation is relative to (None for roots)."""
+        exclude_ctrl = self.config["use_exclude_ctrl_bones"]
+        parents = {}
+        for bone in node.data.bones:
+            if((bone.name.startswith("ctrl") or
+                bone.use_deform == False) and exclude_ctrl):
+                continue
 
-        return [anim_id]
+            parent = bone.parent
+            if (parent and exclude_ctrl):
+                while ((parent.name.startswith("ctrl") or
+                        parent.use_deform == False) and parent.parent):
+                    parent = parent.parent
+            parents[bone.name] = parent.name if parent else None
+        return parents
 
-    def export_animation(self, start, end, allowed=None):
+    def report_sampling_modes(self, label, direct, fallbacks):
+        if not direct and not fallbacks:
+            return
+        msg = "Animation \"{}\": {} skeleton(s) sampled from F-Curves".format(
+            label, len(direct))
+        if fallbacks:
+            msg += "; frame by frame for {}".format(", ".join(
+                "\"{}\" ({})".format(name, reason) for name, reason in fallbacks))
+        self.operator.report({"INFO"}, msg)
+
+    def export_animation(self, start, end, allowed=None, label=None):
         # TODO: Blender -> Collada frames needs a little work
         #       Collada starts from 0, blender usually from 1.
         #       The last frame must be included also
@@ -1233,70 +831,84 @@ class DaeExporter:
         if (start > 0):
             frame_sub = start * frame_len
 
-        tcn = []
-        xform_cache = {}
+        frames = list(range(start, end + 1))
+        keys = [t * frame_len - frame_sub for t in frames]
 
-        # Change frames first, export objects last, boosts performance
-        for t in range(start, end + 1):
-            self.scene.frame_set(t)
-            key = t * frame_len - frame_sub
+        animated = []
+        for node in self.objects:
+            if (node not in self.valid_nodes):
+                continue
+            if (allowed is not None and not (node in allowed)):
+                continue
 
-            for node in self.objects:
-                if (node not in self.valid_nodes):
-                    continue
-                if (allowed is not None and not (node in allowed)):
-                    continue
-                    
-                if (node.type == "MESH" and node.parent and
-                        node.parent.type == "ARMATURE"):
-                    # In Collada, nodes that have skin modifier must not export
-                    # animation, animate the skin instead
-                    continue
+            parent = self.node_parent(node)
+            if (node.type == "MESH" and parent and
+                    parent.type == "ARMATURE"):
+                # In Collada, nodes that have skin modifier must not export
+                # animation, animate the skin instead
+                continue
 
-                # Skip adding animation tracks for armature objects themselves
-                if (node.type != "ARMATURE" and (len(node.constraints) > 0 or node.animation_data is not None)):
-                    name = self.validate_id(node.name)
-                    if (not (name in xform_cache)):
-                        xform_cache[name] = []
+            # Skip adding animation tracks for armature objects themselves
+            if (node.type == "ARMATURE" or len(node.constraints) > 0 or
+                    node.animation_data is not None):
+                animated.append(node)
+
+        # Skeletons that only depend on their action are evaluated straight
+        # from the F-Curves; everything else needs the scene stepped through
+        # each frame
+        direct = []
+        fallbacks = []
+        for node in animated:
+            if (node.type != "ARMATURE"):
+                continue
+            if not self.config.get("use_anim_direct_sampling", True):
+                reason = "disabled"
+            else:
+                reason = anim_sampling.direct_sampling_blocker(node)
+            if reason is None:
+                direct.append(node)
+            else:
+                fallbacks.append((node.name, reason))
 
-                    mtx = node.matrix_world.copy()
-                    if (node.parent):
-                        mtx = node.parent.matrix_world.inverted_safe() @ mtx
+        self.report_sampling_modes(label or self.scene.name, direct, fallbacks)
 
-                    xform_cache[name].append((key, mtx))
+        # Channels are written in object order, bones in armature order
+        xform_cache = {}
+        bone_parents = {}
+        for node in animated:
+            if (node.type == "ARMATURE"):
+                bone_parents[node] = self.exported_bone_parents(node)
+                for bone_name in bone_parents[node]:
+                    bone = node.data.bones[bone_name]
+                    xform_cache[self.skeleton_info[node]["bone_ids"][bone]] = []
+            else:
+                xform_cache[self.validate_id(node.name)] = []
 
-                if (node.type == "ARMATURE"):
-                    # All bones exported for now
-                    for bone in node.data.bones:
-                        if((bone.name.startswith("ctrl") or
-                            bone.use_deform == False) and
-                                self.config["use_exclude_ctrl_bones"]):
-                            continue
+        stepped = [node for node in animated if node not in direct]
 
-                        bone_name = self.skeleton_info[node]["bone_ids"][bone]
+        # Change frames first, export objects last, boosts performance
+        if stepped:
+            for t in frames:
+                self.scene.frame_set(t)
+
+                for node in stepped:
+                    if (node.type != "ARMATURE"):
+                        mtx = node.matrix_world.copy()
+                        if (self.node_parent(node)):
+                            mtx = node.parent.matrix_world.inverted_safe() @ mtx
 
-                        if (not (bone_name in xform_cache)):
-                            xform_cache[bone_name] = []
+                        xform_cache[self.validate_id(node.name)].append(mtx)
+                        continue
 
-                        posebone = node.pose.bones[bone.name]
-                        parent_posebone = None
+                    # All bones exported for now
+                    bone_xform = self.skeleton_info[node]["bone_xform"]
+                    for bone_name, parent_name in bone_parents[node].items():
+                        bone = node.data.bones[bone_name]
+                        posebone = node.pose.bones[bone_name]
 
                         mtx = posebone.matrix.copy()
-                        if (bone.parent):
-                            if (self.config["use_exclude_ctrl_bones"]):
-                                current_parent_posebone = bone.parent
-                                while ((current_parent_posebone.name
-                                        .startswith("ctrl") or
-                                        current_parent_posebone.use_deform
-                                        == False) and
-                                        current_parent_posebone.parent):
-                                    current_parent_posebone = (
-                                        current_parent_posebone.parent)
-                                parent_posebone = node.pose.bones[
-                                    current_parent_posebone.name]
-                            else:
-                                parent_posebone = node.pose.bones[
-                                    bone.parent.name]
+                        if (parent_name is not None):
+                            parent_posebone = node.pose.bones[parent_name]
                             parent_invisible = False
 
                             for i in range(3):
@@ -1307,15 +919,60 @@ class DaeExporter:
                                 mtx = (
                                     parent_posebone.matrix
                                     .inverted_safe() @ mtx)
-
-                        xform_cache[bone_name].append((key, mtx))
-
-        self.scene.frame_set(frame_orig)
+                            else:
+                                mtx = bone_xform @ mtx
+                        else:
+                            mtx = bone_xform @ mtx
+
+                        bone_id = self.skeleton_info[node]["bone_ids"][bone]
+                        xform_cache[bone_id].append(mtx)
+
+            self.scene.frame_set(frame_orig)
+
+        for node in direct:
+            sampler = anim_sampling.PoseSampler(node, frames)
+            bone_xform = np.array(self.skeleton_info[node]["bone_xform"], dtype=np.float64)
+            for bone_name, matrices in sampler.bone_matrices(bone_parents[node], bone_xform).items():
+                bone = node.data.bones[bone_name]
+                xform_cache[self.skeleton_info[node]["bone_ids"][bone]] = matrices
+
+        if self.timings.track_memory:
+            self.timings.record_size("animation cache", sum(
+                matrices.nbytes if isinstance(matrices, np.ndarray) else len(matrices) * MATRIX_BYTES
+                for matrices in xform_cache.values()))
+
+        tolerance = None
+        if self.config.get("use_anim_reduce_keys", False):
+            tolerance = keyframe_reduction.Tolerance(
+                self.config.get("anim_reduce_translation", keyframe_reduction.DEFAULT_TRANSLATION_TOLERANCE),
+                self.config.get("anim_reduce_rotation", keyframe_reduction.DEFAULT_ROTATION_TOLERANCE),
+                self.config.get("anim_reduce_scale", keyframe_reduction.DEFAULT_SCALE_TOLERANCE))
 
         # Export animation XML
-        for nid in xform_cache:
-            tcn += self.export_animation_transform_channel(
-                nid, xform_cache[nid], True)
+        tcn = []
+        channels = []
+        value_count = 0
+        baked_keys = 0
+        for nid, matrices in xform_cache.items():
+            anim_id = self.new_id("anim")
+            times = keys
+            matrices = np.array(matrices, dtype=np.float64).reshape(-1, 4, 4)
+            baked_keys += len(times)
+            if tolerance is not None:
+                kept = keyframe_reduction.reduce_keys(times, matrices, tolerance)
+                times = [keys[i] for i in kept]
+                matrices = matrices[kept]
+            channels.append((anim_id, nid, times, matrices, True))
+            value_count += len(times) * 17
+            tcn.append(anim_id)
+
+        if tolerance is not None and baked_keys > 0:
+            kept_keys = value_count // 17
+            self.operator.report({"INFO"}, "Animation \"{}\": kept {} of {} keys ({:.1%})".format(
+                label or self.scene.name, kept_keys, baked_keys, kept_keys / baked_keys))
+
+        self.sections.write_task(
+            S_ANIM, self.pool.submit(value_count, fragments.animation_channels, channels))
 
         return tcn
 
@@ -1370,8 +1027,9 @@ class DaeExporter:
                         for j, bone in enumerate(s.pose.bones):
                             bone.matrix_basis = Matrix()
 
-                tcn = self.export_animation(int(x.frame_range[0]), int(
-                    x.frame_range[1] + 0.5), allowed_skeletons)
+                with self.timings.stage("action '{}'".format(x.name)):
+                    tcn = self.export_animation(int(x.frame_range[0]), int(
+                        x.frame_range[1] + 0.5), allowed_skeletons, x.name)
                 framelen = (1.0 / self.scene.render.fps)
                 start = x.frame_range[0] * framelen
                 end = x.frame_range[1] * framelen
@@ -1401,7 +1059,17 @@ class DaeExporter:
                         bone.matrix_basis = tmp_mat[i][1][j]
 
         else:
-            self.export_animation(self.scene.frame_start, self.scene.frame_end)
+            actions = sorted({s.animation_data.action.name for s in self.skeletons
+                              if s.animation_data and s.animation_data.action})
+            label = "action '{}'".format("', '".join(actions)) if actions else "scene frames"
+            with self.timings.stage(label):
+                self.export_animation(self.scene.frame_start, self.scene.frame_end)
+
+        # Leave the skeletons posed as they were
+        for s, (matrix, bone_matrices) in zip(self.skeletons, tmp_mat):
+            s.matrix_local = matrix
+            for bone, bone_matrix in zip(s.pose.bones, bone_matrices):
+                bone.matrix_basis = bone_matrix
 
         self.writel(S_ANIM, 0, "</library_animations>")
 
@@ -1409,28 +1077,28 @@ class DaeExporter:
         self.writel(S_GEOM, 0, "<library_geometries>")
         self.writel(S_CONT, 0, "<library_controllers>")
 
-        self.export_asset()
-        self.export_scene()
+        with self.timings.stage("scene"):
+            self.export_asset()
+            self.export_scene()
+            self.record_sizes()
 
         self.writel(S_GEOM, 0, "</library_geometries>")
 
         # Morphs always go before skin controllers
         if S_MORPH in self.sections:
-            for l in self.sections[S_MORPH]:
-                self.writel(S_CONT, 0, l)
-            del self.sections[S_MORPH]
+            self.sections.move_section(S_CONT, S_MORPH)
 
         if S_SKIN in self.sections:
-            for l in self.sections[S_SKIN]:
-                self.writel(S_CONT, 0, l)
-            del self.sections[S_SKIN]
+            self.sections.move_section(S_CONT, S_SKIN)
 
         self.writel(S_CONT, 0, "</library_controllers>")
 
         self.purge_empty_nodes()
 
         if (self.config["use_anim"]):
-            self.export_animations()
+            with self.timings.stage("animations"):
+                self.export_animations()
+                self.record_sizes()
 
         # LSLib model type / extra data
         if self.config["extra_data_disabled"] == False:
@@ -1455,26 +1123,34 @@ class DaeExporter:
         except:
             return False
 
-        f.write(bytes("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n", "UTF-8"))
-        f.write(bytes(
-            "<COLLADA xmlns=\"http://www.collada.org/2005/11/COLLADASchema\" "
-            "version=\"1.4.1\">\n", "UTF-8"))
-
-        s = []
-        for x in self.sections.keys():
-            s.append(x)
-        s.sort()
-        for x in s:
-            for l in self.sections[x]:
-                f.write(bytes(l + "\n", "UTF-8"))
-        f.write(bytes("</COLLADA>\n", "UTF-8"))
+        with f, self.timings.stage("write file"):
+            f.write(bytes("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n", "UTF-8"))
+            f.write(bytes(
+                "<COLLADA xmlns=\"http://www.collada.org/2005/11/COLLADASchema\" "
+                "version=\"1.4.1\">\n", "UTF-8"))
+            self.sections.write_to(f)
+            f.write(bytes("</COLLADA>\n", "UTF-8"))
+            self.record_sizes()
+
+        # Only keep geometry of exports that went through
+        for key, entry in self.new_geometry.items():
+            entry.finish()
+            geometry_cache.cache.put(key, entry)
+        if self.timings.track_memory:
+            self.timings.record_size("geometry", sum(entry.size for entry in self.new_geometry.values()))
         return True
 
+    def record_sizes(self):
+        """Adds the size of the export's largest structures to the memory report."""
+        if self.timings.track_memory:
+            self.timings.record_size("sections", self.sections.memory_size())
+            self.timings.record_size("evaluated meshes", self.arena.evaluated_bytes())
+
     __slots__ = ("operator", "scene", "last_id", "scene_name", "objects", "sections",
-                 "path", "mesh_cache", "curve_cache",
+                 "path", "pool", "mesh_cache", "new_geometry", "curve_cache",
                  "skeleton_info", "config", "valid_nodes",
                  "used_bones", "wrongvtx_report",
-                 "skeletons", "action_constraints", "temp_meshes")
+                 "skeletons", "action_constraints", "arena", "baked_transforms", "timings")
 
     def __init__(self, path, context, objects, kwargs, operator):
         self.operator = operator
@@ -1482,10 +1158,15 @@ class DaeExporter:
         self.last_id = 0
         self.scene_name = self.new_id("scene")
         self.objects = objects
-        self.sections = {}
+        self.sections = section_writer.SectionWriter(
+            kwargs.get("section_spool_threshold", section_writer.DEFAULT_SPOOL_THRESHOLD))
         self.path = path
+        geometry_cache.cache.resize(
+            kwargs.get("geometry_cache_size", geometry_cache.cache.max_bytes))
+        self.pool = worker_pool.FormatPool(kwargs.get("format_workers", 1))
         self.mesh_cache = {}
-        self.temp_meshes = set()
+        self.new_geometry = {}
+        self.arena = datablocks.DatablockArena()
         self.curve_cache = {}
         self.skeleton_info = {}
         self.config = kwargs
@@ -1494,16 +1175,18 @@ class DaeExporter:
         self.wrongvtx_report = False
         self.skeletons = []
         self.action_constraints = []
+        # {object: world matrix} when exporting the original objects directly
+        self.baked_transforms = kwargs.get("baked_transforms")
+        # Stages are added under whatever stage the caller is in
+        self.timings = kwargs.get("timings") or profiling.StageTimings("save")
 
     def __enter__(self):
         return self
 
     def __exit__(self, *exc):
-        pass
-        """    
-        for mesh in self.temp_meshes:
-            bpy.data.meshes.remove(mesh)
-        """
+        self.sections.close()
+        self.arena.free()
+        helpers.trace("[DOS2DE-Exporter] {} of evaluated meshes.".format(self.arena.summary()))
 
 def save(operator, context, objects, filepath="", **kwargs):
     with DaeExporter(filepath, context, objects, kwargs, operator) as exp:
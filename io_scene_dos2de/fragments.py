@@ -0,0 +1,302 @@
+import numpy as np
+from . import serialization
+
+
+class Fragment:
+    """Indented lines of a self-contained part of a Collada section."""
+
+    __slots__ = ("lines", )
+
+    def __init__(self):
+        self.lines = []
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def add(self, indent, text):
+        self.lines.append("{}{}".format(indent * "\t", text))
+
+    def size(self):
+        return sum(len(line) + 1 for line in self.lines)
+
+
+def float_source(frag, owner_id, name, values, params):
+    """A <source> holding a float array with one param per component."""
+    count = len(values)
+    frag.add(3, "<source id=\"{}-{}\">".format(owner_id, name))
+    frag.add(
+        4, "<float_array id=\"{}-{}-array\" "
+        "count=\"{}\">{}</float_array>".format(
+            owner_id, name, count * len(params), serialization.float_array(values)))
+    frag.add(4, "<technique_common>")
+    frag.add(
+        4, "<accessor source=\"#{}-{}-array\" "
+        "count=\"{}\" stride=\"{}\">".format(owner_id, name, count, len(params)))
+    for param in params:
+        frag.add(5, "<param name=\"{}\" type=\"float\"/>".format(param))
+    frag.add(4, "</accessor>")
+    frag.add(4, "</technique_common>")
+    frag.add(3, "</source>")
+
+
+def geometry(meshid, name, vertices, surfaces, triangulate, extras=None):
+    """The <geometry> element of a mesh.
+
+    extras holds the LSTools technique lines; None omits the <extra> element."""
+    frag = Fragment()
+    frag.add(1, "<geometry id=\"{}\" name=\"{}\">".format(meshid, name))
+    frag.add(2, "<mesh>")
+
+    float_source(frag, meshid, "positions", vertices.positions, "XYZ")
+    float_source(frag, meshid, "normals", vertices.normals, "XYZ")
+    if vertices.tangents is not None:
+        float_source(frag, meshid, "tangents", vertices.tangents, "XYZ")
+        float_source(frag, meshid, "bitangents", vertices.bitangents, "XYZ")
+    for uvi, uvs in enumerate(vertices.uvs):
+        float_source(frag, meshid, "texcoord-{}".format(uvi), uvs, "ST")
+    if vertices.color is not None:
+        float_source(frag, meshid, "colors", vertices.color, "XYZ")
+
+    # Triangle Lists
+    frag.add(3, "<vertices id=\"{}-vertices\">".format(meshid))
+    frag.add(4, "<input semantic=\"POSITION\" source=\"#{}-positions\"/>".format(meshid))
+    frag.add(3, "</vertices>")
+
+    prim_type = "triangles" if triangulate else "polygons"
+
+    for m, polygon_sizes, indices in surfaces:
+        frag.add(3, "<{} count=\"{}\">".format(prim_type, len(polygon_sizes)))
+        frag.add(
+            4, "<input semantic=\"VERTEX\" "
+            "source=\"#{}-vertices\" offset=\"0\"/>".format(meshid))
+        frag.add(
+            4, "<input semantic=\"NORMAL\" "
+            "source=\"#{}-normals\" offset=\"0\"/>".format(meshid))
+
+        for uvi in range(len(vertices.uvs)):
+            frag.add(
+                4, "<input semantic=\"TEXCOORD\" source=\"#{}-texcoord-{}\" "
+                "offset=\"0\" set=\"{}\"/>".format(meshid, uvi, uvi))
+
+        if vertices.color is not None:
+            frag.add(
+                4, "<input semantic=\"COLOR\" "
+                "source=\"#{}-colors\" offset=\"0\"/>".format(meshid))
+        if vertices.tangents is not None:
+            frag.add(
+                4, "<input semantic=\"TEXTANGENT\" "
+                "source=\"#{}-tangents\" offset=\"0\"/>".format(meshid))
+            frag.add(
+                4, "<input semantic=\"TEXBINORMAL\" "
+                "source=\"#{}-bitangents\" offset=\"0\"/>".format(meshid))
+
+        if triangulate:
+            frag.add(4, "<p>{}</p>".format(serialization.int_array(indices)))
+        else:
+            p_start = 0
+            for p_end in np.cumsum(polygon_sizes).tolist():
+                frag.add(4, "<p>{}</p>".format(
+                    serialization.int_array(indices[p_start:p_end])))
+                p_start = p_end
+
+        frag.add(3, "</{}>".format(prim_type))
+
+    # LSLib model type / extra data
+    if extras is not None:
+        frag.add(3, "<extra>")
+        frag.add(4, "<technique profile=\"LSTools\">")
+        for line in extras:
+            frag.add(5, line)
+        frag.add(4, "</technique>")
+        frag.add(3, "</extra>")
+
+    frag.add(2, "</mesh>")
+    frag.add(1, "</geometry>")
+    return frag
+
+
+def skin_controller(contid, source_id, bind_shape_matrix, bone_names, bind_poses, skin):
+    """The <controller> element binding a mesh to its skeleton.
+
+    bind_shape_matrix is a 4x4 matrix, bind_poses holds one per bone."""
+    frag = Fragment()
+    frag.add(1, "<controller id=\"{}\">".format(contid))
+    frag.add(2, "<skin source=\"#{}\">".format(source_id))
+    frag.add(3, "<bind_shape_matrix>{}</bind_shape_matrix>".format(
+        serialization.matrix(bind_shape_matrix)))
+
+    # Joint Names
+    frag.add(3, "<source id=\"{}-joints\">".format(contid))
+    frag.add(
+        4, "<Name_array id=\"{}-joints-array\" "
+        "count=\"{}\">{}</Name_array>".format(
+            contid, len(bone_names), serialization.name_array(bone_names)))
+    frag.add(4, "<technique_common>")
+    frag.add(
+        4, "<accessor source=\"#{}-joints-array\" "
+        "count=\"{}\" stride=\"1\">".format(contid, len(bone_names)))
+    frag.add(5, "<param name=\"JOINT\" type=\"Name\"/>")
+    frag.add(4, "</accessor>")
+    frag.add(4, "</technique_common>")
+    frag.add(3, "</source>")
+
+    # Pose Matrices!
+    frag.add(3, "<source id=\"{}-bind_poses\">".format(contid))
+    frag.add(
+        4, "<float_array id=\"{}-bind_poses-array\" "
+        "count=\"{}\">{}</float_array>".format(
+            contid, len(bone_names) * 16, serialization.matrix_array(bind_poses)))
+    frag.add(4, "<technique_common>")
+    frag.add(
+        4, "<accessor source=\"#{}-bind_poses-array\" "
+        "count=\"{}\" stride=\"16\">".format(contid, len(bone_names)))
+    frag.add(5, "<param name=\"TRANSFORM\" type=\"float4x4\"/>")
+    frag.add(4, "</accessor>")
+    frag.add(4, "</technique_common>")
+    frag.add(3, "</source>")
+
+    # Skin Weights!
+    vertex_bones, vertex_weights = skin.flatten()
+    weight_count = len(vertex_weights)
+    frag.add(3, "<source id=\"{}-skin_weights\">".format(contid))
+    frag.add(
+        4, "<float_array id=\"{}-skin_weights-array\" "
+        "count=\"{}\">{}</float_array>".format(
+            contid, weight_count, serialization.float_array(vertex_weights)))
+    frag.add(4, "<technique_common>")
+    frag.add(
+        4, "<accessor source=\"#{}-skin_weights-array\" "
+        "count=\"{}\" stride=\"1\">".format(contid, weight_count))
+    frag.add(5, "<param name=\"WEIGHT\" type=\"float\"/>")
+    frag.add(4, "</accessor>")
+    frag.add(4, "</technique_common>")
+    frag.add(3, "</source>")
+
+    frag.add(3, "<joints>")
+    frag.add(4, "<input semantic=\"JOINT\" source=\"#{}-joints\"/>".format(contid))
+    frag.add(
+        4, "<input semantic=\"INV_BIND_MATRIX\" "
+        "source=\"#{}-bind_poses\"/>".format(contid))
+    frag.add(3, "</joints>")
+    frag.add(3, "<vertex_weights count=\"{}\">".format(len(skin)))
+    frag.add(
+        4, "<input semantic=\"JOINT\" "
+        "source=\"#{}-joints\" offset=\"0\"/>".format(contid))
+    frag.add(
+        4, "<input semantic=\"WEIGHT\" "
+        "source=\"#{}-skin_weights\" offset=\"1\"/>".format(contid))
+
+    # Each influence refers to its joint and to its own weight
+    v_pairs = np.empty((weight_count, 2), dtype=np.int64)
+    v_pairs[:, 0] = vertex_bones
+    v_pairs[:, 1] = np.arange(weight_count)
+    frag.add(4, "<vcount>{}</vcount>".format(serialization.int_array(skin.counts)))
+    frag.add(4, "<v>{}</v>".format(serialization.int_array(v_pairs)))
+    frag.add(3, "</vertex_weights>")
+
+    frag.add(2, "</skin>")
+    frag.add(1, "</controller>")
+    return frag
+
+
+def animation_channel(frag, anim_id, target, times, values, matrices=True):
+    """Adds an <animation> element sampling target at the given times.
+
+    values is an (N, 4, 4) array of transforms if matrices is set, otherwise
+    N floats."""
+    frame_total = len(times)
+    source_frames = serialization.float_array(times, serialization.FLOAT64_DIGITS)
+    if matrices:
+        source_transforms = serialization.matrix_array(values)
+    else:
+        source_transforms = serialization.float_array(values)
+    source_interps = serialization.repeated_name("LINEAR", frame_total)
+
+    frag.add(1, "<animation id=\"{}\">".format(anim_id))
+
+    # Time Source
+    frag.add(2, "<source id=\"{}-input\">".format(anim_id))
+    frag.add(
+        3, "<float_array id=\"{}-input-array\" "
+        "count=\"{}\">{}</float_array>".format(anim_id, frame_total, source_frames))
+    frag.add(3, "<technique_common>")
+    frag.add(
+        4, "<accessor source=\"#{}-input-array\" "
+        "count=\"{}\" stride=\"1\">".format(anim_id, frame_total))
+    frag.add(5, "<param name=\"TIME\" type=\"float\"/>")
+    frag.add(4, "</accessor>")
+    frag.add(3, "</technique_common>")
+    frag.add(2, "</source>")
+
+    if matrices:
+        # Transform Source
+        frag.add(2, "<source id=\"{}-transform-output\">".format(anim_id))
+        frag.add(
+            3, "<float_array id=\"{}-transform-output-array\" "
+            "count=\"{}\">{}</float_array>".format(
+                anim_id, frame_total * 16, source_transforms))
+        frag.add(3, "<technique_common>")
+        frag.add(
+            4, "<accessor source=\"#{}-transform-output-array\" count=\"{}\" "
+            "stride=\"16\">".format(anim_id, frame_total))
+        frag.add(5, "<param name=\"TRANSFORM\" type=\"float4x4\"/>")
+        frag.add(4, "</accessor>")
+        frag.add(3, "</technique_common>")
+        frag.add(2, "</source>")
+    else:
+        # Value Source
+        frag.add(2, "<source id=\"{}-transform-output\">".format(anim_id))
+        frag.add(
+            3, "<float_array id=\"{}-transform-output-array\" "
+            "count=\"{}\">{}</float_array>".format(
+                anim_id, frame_total, source_transforms))
+        frag.add(3, "<technique_common>")
+        frag.add(
+            4, "<accessor source=\"#{}-transform-output-array\" "
+            "count=\"{}\" stride=\"1\">".format(anim_id, frame_total))
+        frag.add(5, "<param name=\"X\" type=\"float\"/>")
+        frag.add(4, "</accessor>")
+        frag.add(3, "</technique_common>")
+        frag.add(2, "</source>")
+
+    # Interpolation Source
+    frag.add(2, "<source id=\"{}-interpolation-output\">".format(anim_id))
+    frag.add(
+        3, "<Name_array id=\"{}-interpolation-output-array\" "
+        "count=\"{}\">{}</Name_array>".format(anim_id, frame_total, source_interps))
+    frag.add(3, "<technique_common>")
+    frag.add(
+        4, "<accessor source=\"#{}-interpolation-output-array\" "
+        "count=\"{}\" stride=\"1\">".format(anim_id, frame_total))
+    frag.add(5, "<param name=\"INTERPOLATION\" type=\"Name\"/>")
+    frag.add(4, "</accessor>")
+    frag.add(3, "</technique_common>")
+    frag.add(2, "</source>")
+
+    frag.add(2, "<sampler id=\"{}-sampler\">".format(anim_id))
+    frag.add(3, "<input semantic=\"INPUT\" source=\"#{}-input\"/>".format(anim_id))
+    frag.add(
+        3, "<input semantic=\"OUTPUT\" "
+        "source=\"#{}-transform-output\"/>".format(anim_id))
+    frag.add(
+        3, "<input semantic=\"INTERPOLATION\" "
+        "source=\"#{}-interpolation-output\"/>".format(anim_id))
+    frag.add(2, "</sampler>")
+    if matrices:
+        frag.add(
+            2, "<channel source=\"#{}-sampler\" "
+            "target=\"{}/transform\"/>".format(anim_id, target))
+    else:
+        frag.add(
+            2, "<channel source=\"#{}-sampler\" "
+            "target=\"{}\"/>".format(anim_id, target))
+    frag.add(1, "</animation>")
+
+
+def animation_channels(channels):
+    """<animation> elements of a list of (anim_id, target, times, values,
+    matrices) tuples, in order."""
+    frag = Fragment()
+    for channel in channels:
+        animation_channel(frag, *channel)
+    return frag
@@ -0,0 +1,152 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from . import mesh_data, worker_pool
+
+# Bump whenever the contents of cached fragments change
+FRAGMENT_VERSION = 2
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Element ids are assigned per export; cached lines hold these placeholders
+# instead and get the real ids substituted when they are written.
+MESH_ID = "\0mesh\0"
+CONTROLLER_ID = "\0controller\0"
+SKIN_SOURCE_ID = "\0skin-source\0"
+
+
+class CachedGeometry:
+    """Finished geometry and skin controller lines of a mesh.
+
+    geometry and skin are worker_pool tasks that produce the fragments."""
+
+    __slots__ = ("geometry", "skin", "warnings", "unassigned_weights", "size")
+
+    def __init__(self, geometry, skin=None, warnings=(), unassigned_weights=False):
+        self.geometry = geometry
+        self.skin = skin
+        self.warnings = list(warnings)
+        self.unassigned_weights = unassigned_weights
+        self.size = 0
+
+    def finish(self):
+        """Waits for the fragments; must be called before caching the entry."""
+        self.geometry = worker_pool.Completed(self.geometry.result())
+        self.size = self.geometry.result().size()
+        if self.skin is not None:
+            self.skin = worker_pool.Completed(self.skin.result())
+            self.size += self.skin.result().size()
+
+    def geometry_lines(self, meshid):
+        return worker_pool.Mapped(self.geometry, lambda frag: [
+            line.replace(MESH_ID, meshid) for line in frag.lines])
+
+    def skin_lines(self, contid, source_id):
+        return worker_pool.Mapped(self.skin, lambda frag: [
+            line.replace(CONTROLLER_ID, contid).replace(SKIN_SOURCE_ID, source_id)
+            for line in frag.lines])
+
+
+class GeometryCache:
+    """Least recently used cache of exported geometry, bounded by the total
+    size of the cached text. Lives as long as the addon is loaded."""
+
+    __slots__ = ("max_bytes", "entries", "size", "hits", "misses", "evictions")
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= old.size
+        if entry.size > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.size += entry.size
+        self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        while self.size > max_bytes and self.entries:
+            _, entry = self.entries.popitem(last=False)
+            self.size -= entry.size
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.evict(max_bytes)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "size": self.size,
+            "max_size": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class ContentKey:
+    """Incrementally hashes everything a cached fragment depends on."""
+
+    __slots__ = ("hasher", )
+
+    def __init__(self):
+        self.hasher = hashlib.blake2b(digest_size=32)
+        self.add_value(FRAGMENT_VERSION)
+
+    def add_value(self, value):
+        data = repr(value).encode("utf-8")
+        self.hasher.update(len(data).to_bytes(8, "little"))
+        self.hasher.update(data)
+
+    def add_array(self, arr):
+        arr = np.ascontiguousarray(arr)
+        self.add_value((arr.dtype.str, arr.shape))
+        self.hasher.update(arr.data)
+
+    def add_mesh(self, mesh):
+        """Adds the evaluated mesh data. Loop normals must be up to date;
+        they stand in for smoothing, sharp edges and custom normals."""
+        self.add_array(mesh_data.foreach_get_array(mesh.vertices, "co", np.float32, 3))
+        self.add_array(mesh_data.foreach_get_array(mesh.polygons, "loop_start", np.int32))
+        self.add_array(mesh_data.foreach_get_array(mesh.polygons, "loop_total", np.int32))
+        self.add_array(mesh_data.foreach_get_array(mesh.polygons, "material_index", np.int32))
+        self.add_array(mesh_data.foreach_get_array(mesh.loops, "vertex_index", np.int32))
+        self.add_array(mesh_data.foreach_get_array(mesh.loops, "normal", np.float32, 3))
+
+        self.add_value(len(mesh.uv_layers))
+        for layer in mesh.uv_layers:
+            self.add_array(mesh_data.foreach_get_array(layer.data, "uv", np.float32, 2))
+
+        self.add_value(len(mesh.vertex_colors))
+        if len(mesh.vertex_colors):
+            self.add_array(mesh_data.foreach_get_array(mesh.vertex_colors[0].data, "color", np.float32, 4))
+
+    def digest(self):
+        return self.hasher.digest()
+
+
+cache = GeometryCache()
@@ -0,0 +1,102 @@
+import numpy as np
+
+DEFAULT_TRANSLATION_TOLERANCE = 0.0001
+DEFAULT_ROTATION_TOLERANCE = 0.0001  # Radians
+DEFAULT_SCALE_TOLERANCE = 0.0001
+
+
+class Tolerance:
+    """Largest error a dropped key may be rebuilt with, per component."""
+
+    __slots__ = ("translation", "rotation", "scale")
+
+    def __init__(self, translation=DEFAULT_TRANSLATION_TOLERANCE,
+                 rotation=DEFAULT_ROTATION_TOLERANCE, scale=DEFAULT_SCALE_TOLERANCE):
+        self.translation = translation
+        self.rotation = rotation
+        self.scale = scale
+
+
+def matrix_to_quaternion(rotation):
+    """(N, 3, 3) rotations to (N, 4) w, x, y, z unit quaternions."""
+    m = rotation
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    # Each row is computed from the largest of w, x, y, z for stability
+    candidates = np.stack([
+        np.stack([1 + trace, m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1]], axis=-1),
+        np.stack([m[:, 2, 1] - m[:, 1, 2], 1 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2],
+                  m[:, 0, 1] + m[:, 1, 0], m[:, 0, 2] + m[:, 2, 0]], axis=-1),
+        np.stack([m[:, 0, 2] - m[:, 2, 0], m[:, 0, 1] + m[:, 1, 0],
+                  1 - m[:, 0, 0] + m[:, 1, 1] - m[:, 2, 2], m[:, 1, 2] + m[:, 2, 1]], axis=-1),
+        np.stack([m[:, 1, 0] - m[:, 0, 1], m[:, 0, 2] + m[:, 2, 0],
+                  m[:, 1, 2] + m[:, 2, 1], 1 - m[:, 0, 0] - m[:, 1, 1] + m[:, 2, 2]], axis=-1),
+    ], axis=1)
+    diagonal = np.stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], axis=-1)
+    q = candidates[np.arange(len(m)), np.argmax(diagonal, axis=1)]
+    return q / np.linalg.norm(q, axis=1)[:, None]
+
+
+def decompose(matrices):
+    """Splits (N, 4, 4) transforms into translations, rotation quaternions
+    and scales. Quaternion signs are made continuous between keys."""
+    translation = matrices[:, :3, 3]
+    basis = matrices[:, :3, :3]
+    scale = np.linalg.norm(basis, axis=1)
+    # Mirroring is kept in the scale so the rotation stays proper
+    scale[:, 0] *= np.where(np.linalg.det(basis) < 0, -1.0, 1.0)
+    safe_scale = np.where(scale != 0, scale, 1.0)
+    rotation = basis / safe_scale[:, None, :]
+    rotation[(scale == 0).any(axis=1)] = np.eye(3)
+
+    q = matrix_to_quaternion(rotation)
+    signs = np.where(np.einsum("ij,ij->i", q[1:], q[:-1]) < 0, -1.0, 1.0)
+    q[1:] *= np.cumprod(signs)[:, None]
+    return translation, q, scale
+
+
+def segment_error(times, translation, rotation, scale, start, end):
+    """Largest error of the keys between start and end when rebuilt by
+    interpolating the two, as (translation, rotation, scale)."""
+    inner = slice(start + 1, end)
+    u = ((times[inner] - times[start]) / (times[end] - times[start]))[:, None]
+
+    t = translation[start] + (translation[end] - translation[start]) * u
+    s = scale[start] + (scale[end] - scale[start]) * u
+    q = rotation[start] + (rotation[end] - rotation[start]) * u
+    q /= np.linalg.norm(q, axis=1)[:, None]
+
+    dot = np.abs(np.einsum("ij,ij->i", q, rotation[inner]))
+    return (np.linalg.norm(t - translation[inner], axis=1).max(),
+            (2 * np.arccos(np.minimum(dot, 1.0))).max(),
+            np.abs(s - scale[inner]).max())
+
+
+def reduce_keys(times, matrices, tolerance):
+    """Returns the indices of the keys to keep for a baked transform channel.
+
+    Keys that interpolating their neighbouring kept keys rebuilds within the
+    tolerance are dropped, greedily from the first key on. The first and last
+    keys are always kept, so a constant channel ends up with two keys."""
+    count = len(matrices)
+    if count <= 2:
+        return np.arange(count)
+
+    times = np.asarray(times, dtype=np.float64)
+    translation, rotation, scale = decompose(np.asarray(matrices, dtype=np.float64))
+
+    def within(start, end):
+        t, r, s = segment_error(times, translation, rotation, scale, start, end)
+        return t <= tolerance.translation and r <= tolerance.rotation and s <= tolerance.scale
+
+    if within(0, count - 1):
+        return np.array([0, count - 1])
+
+    keep = [0]
+    start = 0
+    while start < count - 1:
+        end = start + 1
+        while end + 1 < count and within(start, end + 1):
+            end += 1
+        keep.append(end)
+        start = end
+    return np.array(keep)
@@ -0,0 +1,424 @@
+import numpy as np
+
+# Influences exported per vertex
+MAX_INFLUENCES = 4
+# Influences at or below this weight are dropped
+MIN_INFLUENCE_WEIGHT = 0.001
+
+
+class LoopAttributes:
+    """Per-loop mesh attributes, gathered in bulk and ordered by polygon traversal."""
+
+    __slots__ = ("polygon_sizes", "material_indices", "vertex_indices", "positions",
+                 "normals", "tangents", "bitangents", "uvs", "color")
+
+    def __init__(self):
+        self.polygon_sizes = None
+        self.material_indices = None
+        self.vertex_indices = None
+        self.positions = None
+        self.normals = None
+        self.tangents = None
+        self.bitangents = None
+        self.uvs = []
+        self.color = None
+
+
+class SkinWeights:
+    """Dense per-vertex bone influences.
+
+    Unused slots have a bone index of -1 and a weight of 0."""
+
+    __slots__ = ("bones", "weights", "counts")
+
+    def __init__(self, bones, weights, counts):
+        self.bones = bones
+        self.weights = weights
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.counts)
+
+    def flatten(self):
+        """Returns the (bones, weights) of all used slots, vertex by vertex."""
+        used = np.arange(self.bones.shape[1]) < self.counts[:, None]
+        return self.bones[used], self.weights[used]
+
+
+class VertexBuffer:
+    """Unique export vertices and the loop -> vertex remap."""
+
+    __slots__ = ("loop_vertices", "source_loops", "positions", "normals", "tangents",
+                 "bitangents", "uvs", "color", "skin")
+
+    def __init__(self):
+        self.loop_vertices = None
+        self.source_loops = None
+        self.positions = None
+        self.normals = None
+        self.tangents = None
+        self.bitangents = None
+        self.uvs = []
+        self.color = None
+        self.skin = None
+
+    def __len__(self):
+        return len(self.source_loops)
+
+    def value_count(self):
+        """Number of attribute values stored per vertex times the vertex count."""
+        arrays = [self.positions, self.normals, self.tangents, self.bitangents, self.color]
+        return sum(a.size for a in arrays + self.uvs if a is not None)
+
+
+def foreach_get_array(collection, attr, dtype, width=1):
+    arr = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, arr)
+    if width > 1:
+        arr = arr.reshape(-1, width)
+    return arr
+
+
+def polygon_loop_order(loop_starts, loop_totals):
+    # Loop indices in the order they are visited when walking polygons
+    # front to back; this is the identity for freshly built meshes.
+    offsets = loop_starts - (np.cumsum(loop_totals) - loop_totals)
+    return np.repeat(offsets, loop_totals) + np.arange(int(loop_totals.sum()))
+
+
+def extract_loop_attributes(mesh, use_tangents, use_colors):
+    attrs = LoopAttributes()
+
+    loop_starts = foreach_get_array(mesh.polygons, "loop_start", np.int64)
+    loop_totals = foreach_get_array(mesh.polygons, "loop_total", np.int64)
+    attrs.polygon_sizes = loop_totals
+    attrs.material_indices = foreach_get_array(mesh.polygons, "material_index", np.int64)
+
+    order = polygon_loop_order(loop_starts, loop_totals)
+    if np.array_equal(order, np.arange(len(order))):
+        order = None
+
+    def loop_array(collection, attr, width):
+        arr = foreach_get_array(collection, attr, np.float32, width)
+        return arr if order is None else arr[order]
+
+    vertex_indices = foreach_get_array(mesh.loops, "vertex_index", np.int64)
+    attrs.vertex_indices = vertex_indices if order is None else vertex_indices[order]
+
+    coords = foreach_get_array(mesh.vertices, "co", np.float32, 3)
+    attrs.positions = coords[attrs.vertex_indices]
+    attrs.normals = loop_array(mesh.loops, "normal", 3)
+
+    if use_tangents:
+        attrs.tangents = loop_array(mesh.loops, "tangent", 3)
+        attrs.bitangents = loop_array(mesh.loops, "bitangent", 3)
+
+    for layer in mesh.uv_layers:
+        attrs.uvs.append(loop_array(layer.data, "uv", 2))
+
+    if use_colors:
+        # Only RGB is exported; alpha is dropped like before
+        attrs.color = loop_array(mesh.vertex_colors[0].data, "color", 4)[:, :3]
+
+    return attrs
+
+
+def group_bone_lookup(vertex_groups, bone_index):
+    """Maps vertex group indices to bone indices; -1 for non-bone groups."""
+    lookup = np.full(len(vertex_groups), -1, dtype=np.int32)
+    for group in vertex_groups:
+        bone = bone_index.get(group.name)
+        if bone is not None:
+            lookup[group.index] = bone
+    return lookup
+
+
+def extract_vertex_groups(mesh):
+    """Returns the flattened (vertex, group, weight) arrays of every
+    vertex group assignment, ordered by vertex."""
+    counts = np.empty(len(mesh.vertices), dtype=np.int64)
+    groups = []
+    weights = []
+    for i, mv in enumerate(mesh.vertices):
+        vertex_groups = mv.groups
+        counts[i] = len(vertex_groups)
+        for vg in vertex_groups:
+            groups.append(vg.group)
+            weights.append(vg.weight)
+
+    vertices = np.repeat(np.arange(len(counts)), counts)
+    return vertices, np.array(groups, dtype=np.int64), np.array(weights, dtype=np.float32)
+
+
+def slots_within_vertex(vertices, vertex_count):
+    """Position of each influence among the influences of its vertex."""
+    firsts = np.searchsorted(vertices, np.arange(vertex_count))
+    return np.arange(len(vertices)) - firsts[vertices]
+
+
+def limit_vertex_groups(vertex_count, vertices, groups, weights, limit=MAX_INFLUENCES):
+    """Keeps the limit largest assignments of each vertex, like Blender's
+    Limit Total operator. Vertices over the limit end up with their
+    assignments ordered by descending weight, as the operator leaves them."""
+    counts = np.bincount(vertices, minlength=vertex_count)
+    over_vertices = np.flatnonzero(counts > limit)
+    if not len(over_vertices):
+        return vertices, groups, weights
+
+    # Only the vertices over the limit are ranked: their weights are padded
+    # into rows and partially sorted, then the few kept ones ordered
+    firsts = np.searchsorted(vertices, over_vertices)
+    width = counts[over_vertices].max()
+    columns = np.arange(width)
+    valid = columns < counts[over_vertices][:, None]
+    entries = np.where(valid, firsts[:, None] + columns, 0)
+    padded = np.where(valid, weights[entries], -np.inf)
+
+    # Ties at the cut keep the assignments that come first
+    threshold = -np.partition(-padded, limit - 1, axis=1)[:, limit - 1:limit]
+    above = padded > threshold
+    at = padded == threshold
+    missing = limit - above.sum(axis=1, keepdims=True)
+    chosen = above | (at & (np.cumsum(at, axis=1) <= missing))
+    top = np.nonzero(chosen)[1].reshape(-1, limit)
+    top_weights = np.take_along_axis(padded, top, axis=1)
+    top = np.take_along_axis(top, np.lexsort((top, -top_weights), axis=1), axis=1)
+
+    position = slots_within_vertex(vertices, vertex_count)
+    over = counts[vertices] > limit
+    position[over] = limit
+    position[(firsts[:, None] + top).ravel()] = np.tile(np.arange(limit), len(over_vertices))
+
+    keep = position < limit
+    kept_counts = np.minimum(counts, limit)
+    kept_firsts = np.cumsum(kept_counts) - kept_counts
+    order = np.empty(int(kept_counts.sum()), dtype=np.int64)
+    order[kept_firsts[vertices[keep]] + position[keep]] = np.flatnonzero(keep)
+    return vertices[order], groups[order], weights[order]
+
+
+def normalize_vertex_groups(vertex_count, vertices, groups, weights, locked):
+    """Scales the unlocked assignments of each vertex so its weights add up
+    to one, like Blender's Normalize All operator. locked flags the vertex
+    groups whose weights must not change."""
+    free = ~locked[groups]
+    counts = np.bincount(vertices, minlength=vertex_count)
+    free_total = np.bincount(vertices, weights * free, minlength=vertex_count)
+    locked_total = np.bincount(vertices, weights * ~free, minlength=vertex_count)
+
+    remaining = np.maximum(1.0 - locked_total, 0.0)
+    scale = np.divide(remaining, free_total, out=np.ones(vertex_count), where=free_total > 0)
+    normalized = np.clip(weights * scale[vertices], 0.0, 1.0).astype(np.float32)
+    # A lone unlocked assignment becomes 1 even if it had no weight
+    normalized[counts[vertices] == 1] = 1.0
+    return vertices, groups, np.where(free, normalized, weights)
+
+
+def build_skin_weights(vertex_count, vertices, groups, weights, group_bones):
+    """Builds dense skin weights from flattened vertex group assignments.
+
+    Groups that are not bones and influences of MIN_INFLUENCE_WEIGHT or less
+    are dropped; if more than MAX_INFLUENCES remain, the largest ones are
+    kept. Influences stay in vertex group order."""
+    bones = np.full(len(groups), -1, dtype=np.int32)
+    known = groups < len(group_bones)
+    bones[known] = group_bones[groups[known]]
+
+    keep = (bones >= 0) & (weights > MIN_INFLUENCE_WEIGHT)
+    vertices, bones, weights = vertices[keep], bones[keep], weights[keep]
+
+    slots = slots_within_vertex(vertices, vertex_count)
+    if len(slots) and slots.max() >= MAX_INFLUENCES:
+        by_weight = np.lexsort((-weights, vertices))
+        rank = slots_within_vertex(vertices[by_weight], vertex_count)
+        keep = np.sort(by_weight[rank < MAX_INFLUENCES])
+        vertices, bones, weights = vertices[keep], bones[keep], weights[keep]
+        slots = slots_within_vertex(vertices, vertex_count)
+
+    skin = SkinWeights(
+        np.full((vertex_count, MAX_INFLUENCES), -1, dtype=np.int32),
+        np.zeros((vertex_count, MAX_INFLUENCES), dtype=np.float32),
+        np.bincount(vertices, minlength=vertex_count))
+    skin.bones[vertices, slots] = bones
+    skin.weights[vertices, slots] = weights
+    return skin
+
+
+# Bit pattern of -0.0, which has to match +0.0 like it does for floats
+NEGATIVE_ZERO = np.uint32(0x80000000)
+
+
+def key_layout(attrs, skin=None):
+    """Returns the (name, width) of each column group of the packed loop keys."""
+    layout = [("positions", 3), ("normals", 3)]
+    layout += [("uv", uv.shape[1]) for uv in attrs.uvs]
+    if attrs.color is not None:
+        layout.append(("color", 3))
+    if attrs.tangents is not None:
+        layout += [("tangents", 3), ("bitangents", 3)]
+    if skin is not None:
+        layout += [("bones", MAX_INFLUENCES), ("weights", MAX_INFLUENCES)]
+    return layout
+
+
+def pack_loop_keys(attrs, skin=None, chunk_size=1 << 13):
+    """Copies every per-loop attribute that takes part in deduplication into
+    one (loops, words) uint32 buffer, then drops the attribute arrays from
+    attrs to free them. Returns the buffer and a mask of the loops that
+    contain a NaN."""
+    layout = key_layout(attrs, skin)
+    loop_count = len(attrs.vertex_indices)
+    words = np.empty((loop_count, sum(width for _, width in layout)), dtype=np.uint32)
+    floats = words.view(np.float32)
+
+    uv_layer = 0
+    offset = 0
+    for name, width in layout:
+        columns = slice(offset, offset + width)
+        if name == "uv":
+            floats[:, columns] = attrs.uvs[uv_layer]
+            attrs.uvs[uv_layer] = None
+            uv_layer += 1
+        elif name == "bones":
+            for start in range(0, loop_count, chunk_size):
+                vertices = attrs.vertex_indices[start:start + chunk_size]
+                words[start:start + chunk_size, columns] = skin.bones[vertices].view(np.uint32)
+        elif name == "weights":
+            for start in range(0, loop_count, chunk_size):
+                vertices = attrs.vertex_indices[start:start + chunk_size]
+                floats[start:start + chunk_size, columns] = skin.weights[vertices]
+        else:
+            floats[:, columns] = getattr(attrs, name)
+            setattr(attrs, name, None)
+        offset += width
+    attrs.uvs = []
+
+    # NaN never compares equal, so loops containing one are never merged;
+    # the bone indices aren't floats and are left out of the check
+    float_columns = np.ones(words.shape[1], dtype=bool)
+    if skin is not None:
+        bones = words.shape[1] - 2 * MAX_INFLUENCES
+        float_columns[bones:bones + MAX_INFLUENCES] = False
+    nan_loops = np.zeros(loop_count, dtype=bool)
+    for start in range(0, loop_count, chunk_size):
+        chunk = floats[start:start + chunk_size]
+        nan_loops[start:start + chunk_size] = np.isnan(chunk[:, float_columns]).any(axis=1)
+    return words, nan_loops
+
+
+def canonical_words(words):
+    return np.where(words == NEGATIVE_ZERO, np.uint32(0), words)
+
+
+def hash_words(words, chunk_size=1 << 13):
+    # FNV-1a over 32-bit words; collisions are resolved by unique_keys.
+    # Rows are hashed in chunks small enough for the cache to hold
+    h = np.empty(len(words), dtype=np.uint64)
+    prime = np.uint64(0x100000001b3)
+    for start in range(0, len(words), chunk_size):
+        chunk = canonical_words(words[start:start + chunk_size])
+        chunk_hash = np.full(len(chunk), 0xcbf29ce484222325, dtype=np.uint64)
+        for column in chunk.T:
+            chunk_hash ^= column
+            chunk_hash *= prime
+        h[start:start + chunk_size] = chunk_hash
+    return h
+
+
+def first_occurrence_order(first, inverse):
+    inverse = inverse.reshape(-1)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse]
+
+
+def unique_keys(words, distinct=None, chunk_size=1 << 13):
+    """Returns (first loop of each unique key, loop -> unique key) with keys
+    numbered in order of first occurrence. -0.0 and +0.0 are treated as
+    equal; loops flagged in distinct each get a key of their own."""
+    hashes = hash_words(words)
+    loners = None
+    if distinct is not None and distinct.any():
+        loners = np.flatnonzero(distinct)
+        rows = np.flatnonzero(~distinct)
+        hashes = hashes[rows]
+    else:
+        rows = np.arange(len(words))
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    del hashes
+    first = rows[first]
+    inverse = inverse.reshape(-1)
+
+    # Make sure that loops sharing a hash really are equal; the few that
+    # aren't are split off and deduplicated among themselves
+    collided = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        ours = words[rows[chunk]]
+        theirs = words[first[inverse[chunk]]]
+        same = (ours == theirs).all(axis=1)
+        if not same.all():
+            # Signed zeros only differ in their bits
+            differ = ~same
+            same[differ] = (canonical_words(ours[differ]) == canonical_words(theirs[differ])).all(axis=1)
+        if not same.all():
+            collided.append(start + np.flatnonzero(~same))
+    if collided:
+        collided = np.concatenate(collided)
+        _, extra_first, extra_inverse = np.unique(
+            canonical_words(words[rows[collided]]), axis=0, return_index=True, return_inverse=True)
+        inverse[collided] = len(first) + extra_inverse.reshape(-1)
+        first = np.concatenate([first, rows[collided[extra_first]]])
+
+    if loners is None:
+        return first_occurrence_order(first, inverse)
+    loop_keys = np.empty(len(words), dtype=np.int64)
+    loop_keys[rows] = inverse
+    loop_keys[loners] = len(first) + np.arange(len(loners))
+    return first_occurrence_order(np.concatenate([first, loners]), loop_keys)
+
+
+def build_vertex_buffer(attrs, skin=None):
+    """Deduplicates the loops of attrs into export vertices. The per-loop
+    attribute arrays are dropped from attrs once packed; vertex_indices and
+    the polygon arrays are kept for build_surfaces."""
+    layout = key_layout(attrs, skin)
+    words, nan_loops = pack_loop_keys(attrs, skin)
+    buf = VertexBuffer()
+    buf.source_loops, buf.loop_vertices = unique_keys(words, nan_loops)
+
+    loops = buf.source_loops
+    floats = words.view(np.float32)
+    offset = 0
+    for name, width in layout:
+        if name == "uv":
+            buf.uvs.append(floats[loops, offset:offset + width])
+        elif name not in ("bones", "weights"):
+            setattr(buf, name, floats[loops, offset:offset + width])
+        offset += width
+    if skin is not None:
+        vertices = attrs.vertex_indices[loops]
+        buf.skin = SkinWeights(skin.bones[vertices], skin.weights[vertices], skin.counts[vertices])
+    return buf
+
+
+def build_surfaces(attrs, loop_vertices):
+    """Groups polygons by material, in order of first use.
+
+    Returns a list of (material index, polygon sizes, vertex indices) tuples;
+    polygons with less than 3 loops are dropped."""
+    materials = attrs.material_indices
+    sizes = attrs.polygon_sizes
+    if len(materials) == 0:
+        return []
+
+    _, first = np.unique(materials, return_index=True)
+    polygon_of_loop = np.repeat(np.arange(len(sizes)), sizes)
+
+    surfaces = []
+    for material in materials[np.sort(first)]:
+        polygons = (materials == material) & (sizes > 2)
+        loops = polygons[polygon_of_loop]
+        surfaces.append((int(material), sizes[polygons], loop_vertices[loops]))
+    return surfaces
@@ -1,16 +1,17 @@
 from bpy.types import Operator, PropertyGroup
-from bpy.props import StringProperty, BoolProperty, EnumProperty, PointerProperty, CollectionProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, FloatProperty, PointerProperty, CollectionProperty
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 from bpy.utils import register_class, unregister_class
 
 from math import radians, degrees
 from mathutils import Matrix
 
-from . import export_dae, properties, helpers, collada, divine
+from . import export_dae, properties, helpers, collada, conversion_cache, datablocks, divine, operators_divine, profiling
 
 import bpy
 import os
 import tempfile
+import time
 from pathlib import Path
 
 
@@ -129,6 +130,46 @@ class Divine_ImportSettings(PropertyGroup):
         obj.prop(self, "mirror_skeletons")
 
 
+# Export settings of the built-in presets; the GR2 extras flag is handled
+# separately since it is restored when switching presets
+EXPORT_PRESETS = {
+    "MODEL": {
+        "object_types": {"ARMATURE", "MESH"},
+        "use_normalize_vert_groups": True,
+        "use_triangles": True,
+        "use_active_layers": True,
+        "auto_name": "LAYER",
+        "use_exclude_ctrl_bones": False,
+        "use_anim": False,
+    },
+    "ANIMATION": {
+        "object_types": {"ARMATURE"},
+        "use_normalize_vert_groups": False,
+        "use_rest_pose": False,
+        "use_triangles": True,
+        "use_active_layers": True,
+        "auto_name": "ACTION",
+        "use_exclude_ctrl_bones": False,
+        "use_anim": True,
+    },
+    "MESHPROXY": {
+        "object_types": {"MESH"},
+        "use_normalize_vert_groups": True,
+        "use_triangles": True,
+        "use_active_layers": True,
+        "auto_name": "LAYER",
+        "use_exclude_ctrl_bones": False,
+        "use_anim": False,
+    },
+}
+
+# GR2 extras flag forced by a preset
+PRESET_EXTRAS = {
+    "ANIMATION": "DISABLED",
+    "MESHPROXY": "MESHPROXY",
+}
+
+
 class ExportTargetCollection:
     __slots__ = ("targets", "ordered_targets")
 
@@ -510,6 +551,49 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         description=("Export all actions for the first armature found in separate DAE files"),
         default=False
         )
+    use_anim_direct_sampling: BoolProperty(
+        name="Sample F-Curves Directly",
+        description=("Compute skeleton animation from the action's F-Curves instead of "
+                     "stepping through every frame. Skeletons with constraints, drivers "
+                     "or NLA tracks are always stepped through frame by frame"),
+        default=True
+        )
+    use_anim_reduce_keys: BoolProperty(
+        name="Reduce Keyframes",
+        description=("Drop baked animation keys that interpolating the surrounding keys "
+                     "rebuilds within the tolerances below"),
+        default=False
+        )
+    anim_reduce_translation: FloatProperty(
+        name="Translation Tolerance",
+        description="Largest position error of a dropped key",
+        default=0.0001,
+        min=0.0,
+        precision=5,
+        subtype="DISTANCE"
+        )
+    anim_reduce_rotation: FloatProperty(
+        name="Rotation Tolerance",
+        description="Largest rotation error of a dropped key",
+        default=0.0001,
+        min=0.0,
+        precision=5,
+        subtype="ANGLE"
+        )
+    anim_reduce_scale: FloatProperty(
+        name="Scale Tolerance",
+        description="Largest scale error of a dropped key",
+        default=0.0001,
+        min=0.0,
+        precision=5
+        )
+    use_direct_export: BoolProperty(
+        name="Export Without Copies",
+        description=("Read the evaluated objects directly instead of exporting applied copies of them. "
+                     "Falls back to copies for setups this can't reproduce, such as Apply Pose to Armature, "
+                     "scaled armatures or meshes parented to other meshes"),
+        default=False
+        )
     keep_copies: BoolProperty(
         name="(DEBUG) Keep Object Copies",
         default=False
@@ -551,20 +635,12 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
                     self.divine_settings.gr2_settings.extras = "DISABLED"
                 self.preset_applied_extra_flag = False
             return
-        elif self.selected_preset == "MODEL":
-            self.object_types = {"ARMATURE", "MESH"}
-
-            if self.yup_local_override is False:
-                self.yup_enabled = "ROTATE"
-            self.use_normalize_vert_groups = True
-            #self.use_rest_pose = True
-            self.use_triangles = True
-            self.use_active_layers = True
-            self.auto_name = "LAYER"
-
-            self.use_exclude_ctrl_bones = False
-            self.use_anim = False
+        for prop, value in EXPORT_PRESETS.get(self.selected_preset, {}).items():
+            setattr(self, prop, value)
+        if self.yup_local_override is False:
+            self.yup_enabled = "ROTATE"
 
+        if self.selected_preset == "MODEL":
             if self.preset_applied_extra_flag:
                 if self.preset_last_extra_flag != "DISABLED":
                     self.divine_settings.gr2_settings.extras = self.preset_last_extra_flag
@@ -575,18 +651,6 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
                 self.preset_applied_extra_flag = False
 
         elif self.selected_preset == "ANIMATION":
-            self.object_types = {"ARMATURE"}
-            if self.yup_local_override is False:
-                self.yup_enabled = "ROTATE"
-            self.use_normalize_vert_groups = False
-            self.use_rest_pose = False
-            self.use_triangles = True
-            self.use_active_layers = True
-            self.auto_name = "ACTION"
-
-            self.use_exclude_ctrl_bones = False
-            self.use_anim = True
-
             if (self.preset_applied_extra_flag == False):
                 if(self.preset_last_extra_flag == "DISABLED" and self.divine_settings.gr2_settings.extras != "DISABLED"):
                     self.preset_last_extra_flag = self.divine_settings.gr2_settings.extras
@@ -595,17 +659,6 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
             self.divine_settings.gr2_settings.extras = "DISABLED"
 
         elif self.selected_preset == "MESHPROXY":
-            self.object_types = {"MESH"}
-            if self.yup_local_override is False:
-                self.yup_enabled = "ROTATE"
-            self.use_normalize_vert_groups = True
-            self.use_triangles = True
-            self.use_active_layers = True
-            self.auto_name = "LAYER"
-
-            self.use_exclude_ctrl_bones = False
-            self.use_anim = False
-
             if (self.preset_applied_extra_flag == False):
                 if(self.preset_last_extra_flag == "DISABLED" and self.divine_settings.gr2_settings.extras != "DISABLED"):
                     self.preset_last_extra_flag = self.divine_settings.gr2_settings.extras
@@ -691,6 +744,14 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         if self.misc_settings_visible:
             box = layout.box()
             box.prop(self, "use_exclude_ctrl_bones")
+            box.prop(self, "use_anim_direct_sampling")
+            box.prop(self, "use_anim_reduce_keys")
+            if self.use_anim_reduce_keys:
+                col = box.column(align=True)
+                col.prop(self, "anim_reduce_translation")
+                col.prop(self, "anim_reduce_rotation")
+                col.prop(self, "anim_reduce_scale")
+            box.prop(self, "use_direct_export")
             box.prop(self, "keep_copies")
             
     @property
@@ -810,13 +871,13 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
 
 
     def copy_obj(self, context, obj, old_parent):
-        copy = obj.copy()
+        copy = self.arena.add(obj.copy())
         copy.use_fake_user = False
         helpers.trace(f" - Copy '{obj.name}' -> '{copy.name}'")
 
         data = getattr(obj, "data", None)
         if data != None:
-            copy.data = data.copy()
+            copy.data = self.arena.add(data.copy())
             copy.data.use_fake_user = False
         
         export_props = getattr(obj, "llexportprops", None)
@@ -856,13 +917,35 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
 
 
     def execute(self, context):
+        addon_prefs = get_prefs(context)
+        self.timings = profiling.StageTimings("export '{}'".format(Path(self.filepath).name),
+                                              addon_prefs.track_export_memory)
+        profile_path = None
+        if addon_prefs.profile_exports:
+            profile_path = os.path.join(tempfile.gettempdir(), "dos2de-export-{}.pstats".format(
+                time.strftime("%Y%m%d-%H%M%S")))
         try:
             helpers.current_operator = self
-            return self.really_execute(context)
+            with self.timings:
+                if profile_path is None:
+                    return self.really_execute(context)
+                with profiling.ExportProfile(profile_path):
+                    return self.really_execute(context)
         finally:
+            self.report_timings(addon_prefs, profile_path)
             helpers.current_operator = None
 
 
+    def report_timings(self, addon_prefs, profile_path):
+        text = "Export timings:\n" + "\n".join(self.timings.lines())
+        if addon_prefs.report_export_timings or addon_prefs.track_export_memory:
+            helpers.report(text, "INFO")
+        else:
+            helpers.trace("[DOS2DE-Exporter] " + text)
+        if profile_path is not None:
+            helpers.report("Export profile written to '{}'.".format(profile_path), "INFO")
+
+
     def make_copy_recursive(self, context, obj, copies, old_parent):
         copy = self.copy_obj(context, obj, old_parent)
         copies[obj.name] = copy
@@ -945,7 +1028,7 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         object_eval = obj.evaluated_get(dg)
         # JATO: The commented line does not appear to get the evaluated mesh. Maybe I'm missing something, but line below should fix
         #mesh = obj.to_mesh(preserve_all_data_layers=True, depsgraph=dg).copy()
-        mesh = bpy.data.meshes.new_from_object(object_eval)
+        mesh = self.arena.add(bpy.data.meshes.new_from_object(object_eval))
 
         # JATO: Copy over ls_properties manually. mesh.ls_properties is read-only (?) so we do this
         for ls_props in old_mesh.ls_properties.keys():
@@ -964,7 +1047,7 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
             #obj.modifiers.remove(modifier)
         
         obj.data = mesh
-        bpy.data.meshes.remove(old_mesh)
+        self.arena.remove(old_mesh)
 
 
     def reparent_object(self, copies, orig, obj):
@@ -1009,57 +1092,91 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         if self.yup_enabled == "ROTATE" and self.objects_to_export.is_root(orig):
             self.apply_yup_transform(obj)
         
+        # Vertex influences are limited and normalized by the exporter
         self.apply_modifiers(obj)
 
-        if obj.type == "MESH" and obj.vertex_groups:
-            bpy.context.view_layer.objects.active = obj
-            obj.select_set(True)
-            bpy.ops.object.mode_set(mode="WEIGHT_PAINT")
-            bpy.ops.object.vertex_group_limit_total(limit=4)
-            bpy.ops.object.mode_set(mode="OBJECT")
-            #helpers.trace("    - Limited total vertex influences to 4 for {}.".format(obj.name))
-            obj.select_set(False)
-
-            if self.use_normalize_vert_groups:
-                bpy.context.view_layer.objects.active = obj
-                obj.select_set(True)
-                bpy.ops.object.mode_set(mode="WEIGHT_PAINT")
-                bpy.ops.object.vertex_group_normalize_all()
-                bpy.ops.object.mode_set(mode="OBJECT")
-                #helpers.trace("    - Normalized vertex groups for {}.".format(obj.name))
-                obj.select_set(False)
-
 
-    def remove_copies(self, copies):
-        bpy.ops.object.select_all(action='DESELECT')
-
-        for obj in copies.values():
-            if obj is not None:
-                obj.select_set(True)
-
-        bpy.ops.object.delete(use_global=True)
+    def direct_export_blocker(self):
+        """Reason the targets can't be exported without copies, or None."""
+        if self.use_apply_pose_to_armature:
+            return "Apply Pose to Armature is enabled"
+        if self.batch_mode:
+            return "batch mode is enabled"
+
+        targets = self.objects_to_export
+        for obj in targets.ordered_targets:
+            # The helper addon renames and prepares the copies
+            if getattr(obj, "llexportprops", None) is not None:
+                return "the export helper addon is enabled"
+            parent = obj.parent if obj.parent is not None and targets.should_export(obj.parent) else None
+            if obj.type not in {"MESH", "ARMATURE"}:
+                return f"'{obj.name}' is a {obj.type.lower()} object"
+            if obj.type == "ARMATURE":
+                if parent is not None:
+                    return f"armature '{obj.name}' has an exported parent"
+                # Bones can only be moved rigidly
+                if any(abs(s - 1.0) > 1e-4 for s in obj.matrix_world.to_scale()):
+                    return f"armature '{obj.name}' is scaled"
+                continue
+
+            if parent is not None and parent.type != "ARMATURE":
+                return f"'{obj.name}' is parented to '{parent.name}'"
+            if not self.use_rest_pose and any(mod.type == "ARMATURE" and mod.show_viewport for mod in obj.modifiers):
+                return f"'{obj.name}' is deformed by a posed armature"
+            if self.use_anim and parent is None and (obj.animation_data is not None or len(obj.constraints) > 0):
+                return f"'{obj.name}' is animated"
+        return None
+
+
+    def baked_transforms(self):
+        """World transform of every target once the copies would have had
+        their transforms applied, including the y-up rotation of roots."""
+        targets = self.objects_to_export
+        baked = {}
+        for obj in targets.ordered_targets:
+            if obj.parent is not None and obj.parent in baked:
+                baked[obj] = baked[obj.parent] @ obj.parent.matrix_world.inverted_safe() @ obj.matrix_world
+                continue
+
+            loc, rot, scale = obj.matrix_world.decompose()
+            rot = rot.to_matrix()
+            if self.yup_enabled == "ROTATE":
+                rot = rot @ Matrix.Rotation(radians(-90), 3, 'X')
+            baked[obj] = Matrix.LocRotScale(loc, rot, scale)
+        return baked
+
+
+    def override_evaluation(self, objects):
+        """Sets up the original objects to evaluate like the copies would
+        after apply_modifiers. Returns what restore_evaluation needs to
+        undo it."""
+        saved = []
+
+        def override(block, attr, value):
+            saved.append((block, attr, getattr(block, attr)))
+            setattr(block, attr, value)
 
-        #Cleanup
-        for block in bpy.data.meshes:
-            if block.users == 0:
-                bpy.data.meshes.remove(block)
+        if self.use_rest_pose:
+            for arm in bpy.data.armatures:
+                override(arm, "pose_position", "REST")
 
-        for block in bpy.data.armatures:
-            if block.users == 0:
-                bpy.data.armatures.remove(block)
+        for obj in objects:
+            if obj.type != "MESH":
+                continue
+            if not self.use_mesh_modifiers:
+                for mod in obj.modifiers:
+                    if mod.type != "ARMATURE":
+                        override(mod, "show_viewport", False)
+            if not self.use_apply_shapekeys and obj.data.shape_keys:
+                override(obj, "active_shape_key_index", 0)
+                override(obj, "show_only_shape_key", True)
+        return saved
 
-        for block in bpy.data.materials:
-            if block.users == 0:
-                bpy.data.materials.remove(block)
 
-        for block in bpy.data.textures:
-            if block.users == 0:
-                bpy.data.textures.remove(block)
+    def restore_evaluation(self, saved):
+        for block, attr, value in reversed(saved):
+            setattr(block, attr, value)
 
-        for block in bpy.data.images:
-            if block.users == 0:
-                bpy.data.images.remove(block)
-    
 
     def really_execute(self, context):
         output_path = Path(self.properties.filepath)
@@ -1092,7 +1209,8 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
             bpy.ops.object.mode_set(mode="OBJECT")
 
         collector = ExportTargetCollector(self)
-        self.objects_to_export = collector.collect(context.scene.objects)
+        with self.timings.stage("collect targets"):
+            self.objects_to_export = collector.collect(context.scene.objects)
 
         for obj in self.objects_to_export.ordered_targets:
             if obj.select_get():
@@ -1104,71 +1222,115 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         
         context.scene.ls_properties.metadata_version = collada.ColladaMetadataLoader.LSLIB_METADATA_VERSION
 
-        helpers.trace(f'Copying objects:')
-        for obj in self.objects_to_export.ordered_targets:
-            if obj.parent is None or not self.objects_to_export.should_export(obj.parent):
-                self.make_copy_recursive(context, obj, copies, None)
-
-        ordered_copies = []
-        for obj in self.objects_to_export.ordered_targets:
-            ordered_copies.append((obj, copies[obj.name]))
-
-        helpers.trace(f'Preparing hierarchy:')
-        # Update parents of copied objects before performing any modifications;
-        # otherwise the transforms may not propagate to children properly
-        for (orig, obj) in ordered_copies:
-            self.update_hierarchy(context, copies, orig, obj)
-
-        helpers.trace(f'Applying transforms:')
-        for (orig, obj) in ordered_copies:
-            self.apply_all_object_transforms(context, copies, orig, obj)
-
-        keywords = self.as_keywords(ignore=("axis_forward",
-                                            "axis_up",
-                                            "global_scale",
-                                            "check_existing",
-                                            "filter_glob",
-                                            "xna_validate",
-                                            "filepath"
-                                            ))
-
-        exported_pathways = []
-
-        single_mode = self.batch_mode == False
+        direct_export = False
+        if self.use_direct_export:
+            blocker = self.direct_export_blocker()
+            if blocker is None:
+                direct_export = True
+            else:
+                helpers.report(f"Exporting copies of the objects: {blocker}.", "INFO")
 
-        if self.batch_mode:
-            if self.use_anim:
-                single_mode = True
+        # Datablocks created for the export are freed even if it fails
+        self.arena = datablocks.DatablockArena()
+        try:
+            ordered_copies = []
+            if direct_export:
+                export_objects = list(self.objects_to_export.ordered_targets)
             else:
-                if self.use_active_layers:
-                    progress_total = len(list(i for i in range(20) if context.scene.layers[i]))
-                    for i in range(20):
-                        if context.scene.layers[i]:
-                            export_list = list(filter(lambda orig, obj: obj.layers[i], ordered_copies))
-                            export_name = "{}_Layer{}".format(bpy.path.basename(bpy.context.blend_data.filepath), i)
-
-                            if self.auto_name == "LAYER" and "namedlayers" in bpy.data.scenes[context.scene.name]:
-                                namedlayers = getattr(bpy.data.scenes[context.scene.name], "namedlayers", None)
-                                if namedlayers is not None:
-                                    export_name = namedlayers.layers[i].name
-                            
-                            export_filepath = bpy.path.ensure_ext("{}\\{}".format(self.directory, export_name), self.filename_ext)
-                            print("[DOS2DE-Exporter] Batch exporting layer '{}' as '{}'.".format(i, export_filepath))
-
-                            if export_dae.save(self, context, export_list, filepath=export_filepath, **keywords) == {"FINISHED"}:
-                                exported_pathways.append(export_filepath)
-                            else:
-                                helpers.report( "[DOS2DE-Exporter] Failed to export '{}'.".format(export_filepath))
-                else:
+                helpers.trace(f'Copying objects:')
+                with self.timings.stage("copy objects"):
+                    for obj in self.objects_to_export.ordered_targets:
+                        if obj.parent is None or not self.objects_to_export.should_export(obj.parent):
+                            self.make_copy_recursive(context, obj, copies, None)
+                    if self.timings.track_memory:
+                        self.timings.record_size("object copies", self.arena.held_bytes())
+
+                for obj in self.objects_to_export.ordered_targets:
+                    ordered_copies.append((obj, copies[obj.name]))
+
+                helpers.trace(f'Preparing hierarchy:')
+                # Update parents of copied objects before performing any modifications;
+                # otherwise the transforms may not propagate to children properly
+                with self.timings.stage("update hierarchy"):
+                    for (orig, obj) in ordered_copies:
+                        self.update_hierarchy(context, copies, orig, obj)
+
+                helpers.trace(f'Applying transforms:')
+                with self.timings.stage("apply transforms"):
+                    for (orig, obj) in ordered_copies:
+                        self.apply_all_object_transforms(context, copies, orig, obj)
+                    if self.timings.track_memory:
+                        self.timings.record_size("object copies", self.arena.held_bytes())
+                export_objects = list(copies.values())
+
+            keywords = self.as_keywords(ignore=("axis_forward",
+                                                "axis_up",
+                                                "global_scale",
+                                                "check_existing",
+                                                "filter_glob",
+                                                "xna_validate",
+                                                "filepath"
+                                                ))
+
+            keywords["geometry_cache_size"] = addon_prefs.geometry_cache_size * 1024 * 1024
+            keywords["format_workers"] = addon_prefs.format_workers
+            keywords["timings"] = self.timings
+            if direct_export:
+                keywords["baked_transforms"] = self.baked_transforms()
+
+            exported_pathways = []
+
+            single_mode = self.batch_mode == False
+
+            if self.batch_mode:
+                if self.use_anim:
                     single_mode = True
-
-        if single_mode:
-            result = export_dae.save(self, context, copies.values(), filepath=str(collada_path), **keywords)
-            if result == {"FINISHED"}:
-                exported_pathways.append(str(collada_path))
-
-        if not self.keep_copies:
-            self.remove_copies(copies)
+                else:
+                    if self.use_active_layers:
+                        progress_total = len(list(i for i in range(20) if context.scene.layers[i]))
+                        for i in range(20):
+                            if context.scene.layers[i]:
+                                export_list = list(filter(lambda orig, obj: obj.layers[i], ordered_copies))
+                                export_name = "{}_Layer{}".format(bpy.path.basename(bpy.context.blend_data.filepath), i)
+
+                                if self.auto_name == "LAYER" and "namedlayers" in bpy.data.scenes[context.scene.name]:
+                                    namedlayers = getattr(bpy.data.scenes[context.scene.name], "namedlayers", None)
+                                    if namedlayers is not None:
+                                        export_name = namedlayers.layers[i].name
+                                
+                                export_filepath = bpy.path.ensure_ext("{}\\{}".format(self.directory, export_name), self.filename_ext)
+                                print("[DOS2DE-Exporter] Batch exporting layer '{}' as '{}'.".format(i, export_filepath))
+
+                                if Path(export_filepath).suffix.lower() == '.gr2':
+                                    temp = tempfile.NamedTemporaryFile(delete=False)
+                                    temp.close()
+                                    layer_collada_path, layer_gr2_path = temp.name, export_filepath
+                                else:
+                                    layer_collada_path, layer_gr2_path = export_filepath, None
+
+                                with self.timings.stage("save '{}'".format(export_name)):
+                                    layer_result = export_dae.save(self, context, export_list, filepath=layer_collada_path, **keywords)
+                                if layer_result == {"FINISHED"}:
+                                    exported_pathways.append((layer_collada_path, layer_gr2_path))
+                                else:
+                                    helpers.report( "[DOS2DE-Exporter] Failed to export '{}'.".format(export_filepath))
+                    else:
+                        single_mode = True
+
+            if single_mode:
+                saved_state = self.override_evaluation(export_objects) if direct_export else []
+                try:
+                    with self.timings.stage("save"):
+                        result = export_dae.save(self, context, export_objects, filepath=str(collada_path), **keywords)
+                finally:
+                    self.restore_evaluation(saved_state)
+                if result == {"FINISHED"}:
+                    exported_pathways.append((str(collada_path), str(output_path) if tempfile_path is not None else None))
+        finally:
+            if self.keep_copies:
+                self.arena.keep()
+            self.arena.free()
+            helpers.trace("[DOS2DE-Exporter] {} of object copies.".format(self.arena.summary()))
 
         bpy.ops.object.select_all(action='DESELECT')
         
@@ -1188,12 +1350,35 @@ class DIVINITYEXPORTER_OT_export_collada(Operator, ExportHelper):
         except Exception as e:
             print("[DOS2DE-Collada] Error setting viewport mode:\n{}".format(e))
 
-        if tempfile_path is not None:
+        # Each exported DAE that should end up as GR2 is converted to its own path
+        conversions = [(dae, gr2) for dae, gr2 in exported_pathways if gr2 is not None]
+        collada_files = [dae for dae, _ in conversions]
+        converted = True
+        if conversions:
             invoker = divine.DivineInvoker(addon_prefs, self.divine_settings)
-            for collada_file in exported_pathways:
-                if not invoker.export_gr2(str(tempfile_path), str(output_path), "dae"):
-                    return {"CANCELLED"}
-            tempfile_path.unlink()
+            invoker.cache = conversion_cache.configure(
+                conversion_cache.export_cache, addon_prefs.conversion_cache_size * 1024 * 1024)
+            game = context.scene.ls_properties.game
+            jobs = [invoker.export_job(dae, gr2, "dae", game) for dae, gr2 in conversions]
+            if addon_prefs.background_conversion and not bpy.app.background and invoker.check_lslib():
+                # The DAE files are deleted once the conversion is over
+                operators_divine.start_background_conversion(divine.BackgroundConversion(
+                    invoker, jobs, addon_prefs.conversion_workers, collada_files))
+                collada_files = []
+                helpers.report("Converting to GR2 in the background.", "INFO")
+            else:
+                with self.timings.stage("convert to GR2"):
+                    converted = invoker.convert(jobs, addon_prefs.conversion_workers)
+
+        for dae in collada_files:
+            Path(dae).unlink()
+
+        # Unused when batch exporting layers, or when the export failed
+        if tempfile_path is not None and str(tempfile_path) not in dict(conversions):
+            tempfile_path.unlink(missing_ok=True)
+
+        if not converted:
+            return {"CANCELLED"}
 
         helpers.report("Export completed successfully.", "INFO")
         return {"FINISHED"}
@@ -1240,43 +1425,74 @@ class DIVINITYEXPORTER_OT_import_collada(Operator, ImportHelper):
     def really_execute(self, context):
         directory = self.directory
 
+        # Every GR2 starts converting right away, so divine only has to start
+        # a few times; files are imported in order as their conversion is done
+        conversions = {}
         for f in self.files:
             input_path = Path(os.path.join(directory, f.name))
-            tempfile_path = None
-
             if input_path.suffix.lower() == '.gr2':
-                addon_prefs = get_prefs(context)
-                invoker = divine.DivineInvoker(addon_prefs, None)
                 temp = tempfile.NamedTemporaryFile(delete=False)
                 temp.close()
-                tempfile_path = Path(temp.name)
-                collada_path = tempfile_path
-                if not invoker.import_gr2(str(input_path), str(collada_path), "dae"):
-                    return{'CANCELLED'}
-            else:
-                collada_path = input_path
-
-            if bpy.app.version >= (3, 4, 0):
-                bpy.ops.wm.collada_import(filepath=str(collada_path), custom_normals=True, fix_orientation=True)
-            else:
-                bpy.ops.wm.collada_import(filepath=str(collada_path), fix_orientation=True)
-
-            meta_loader = collada.ColladaMetadataLoader()
-            meta_loader.load(context, str(collada_path))
-            self.fixup_bones(context)
+                conversions[f.name] = Path(temp.name)
+
+        converted = None
+        if conversions:
+            addon_prefs = get_prefs(context)
+            invoker = divine.DivineInvoker(addon_prefs, None)
+            invoker.cache = conversion_cache.configure(
+                conversion_cache.import_cache, addon_prefs.import_cache_size * 1024 * 1024)
+            jobs = [invoker.import_job(os.path.join(directory, name), str(path), "dae")
+                    for name, path in conversions.items()]
+            converted = invoker.convert_in_order(jobs, addon_prefs.conversion_workers)
+
+        imported_files = 0
+        try:
+            for f in self.files:
+                input_path = Path(os.path.join(directory, f.name))
+                tempfile_path = conversions.get(f.name)
+
+                if tempfile_path is not None:
+                    # Import whatever could be converted
+                    if not next(converted).success:
+                        continue
+                    collada_path = tempfile_path
+                elif input_path.suffix.lower() == '.gr2':
+                    continue
+                else:
+                    collada_path = input_path
 
-            if tempfile_path is not None:
-                tempfile_path.unlink()
-            
-            imported = context.selected_objects
-            collection = bpy.data.collections.new(os.path.splitext(f['name'])[0])
-            bpy.context.scene.collection.children.link(collection)
-            for f in imported:
-                for parent in f.users_collection:
-                        parent.objects.unlink(f)
-                collection.objects.link(f)
-
-            helpers.report("Import completed successfully.", "INFO")
+                if bpy.app.version >= (3, 4, 0):
+                    bpy.ops.wm.collada_import(filepath=str(collada_path), custom_normals=True, fix_orientation=True)
+                else:
+                    bpy.ops.wm.collada_import(filepath=str(collada_path), fix_orientation=True)
+
+                meta_loader = collada.ColladaMetadataLoader()
+                meta_loader.load(context, str(collada_path))
+                self.fixup_bones(context)
+
+                if tempfile_path is not None:
+                    tempfile_path.unlink()
+                
+                imported = context.selected_objects
+                collection = bpy.data.collections.new(os.path.splitext(f['name'])[0])
+                bpy.context.scene.collection.children.link(collection)
+                for f in imported:
+                    for parent in f.users_collection:
+                            parent.objects.unlink(f)
+                    collection.objects.link(f)
+
+                imported_files += 1
+                helpers.report("Import completed successfully ({} metadata profile(s) applied in {:.2f}s).".format(
+                    meta_loader.applied, meta_loader.elapsed), "INFO")
+        finally:
+            # Stops the conversions that are left if an import failed
+            if converted is not None:
+                converted.close()
+            for path in conversions.values():
+                path.unlink(missing_ok=True)
+
+        if imported_files == 0:
+            return{'CANCELLED'}
         return {'FINISHED'}
 
 
@@ -0,0 +1,121 @@
+from bpy.app.handlers import persistent
+from bpy.types import Operator
+from bpy.utils import register_class, unregister_class
+
+from pathlib import Path
+import bpy
+
+from . import helpers
+
+
+# Background conversions the progress operator is watching
+conversions = []
+
+
+def start_background_conversion(conversion):
+    conversion.start()
+    conversions.append(conversion)
+    if not DIVINITYEXPORTER_OT_gr2_conversion_progress.running:
+        bpy.ops.divinityexporter.gr2_conversion_progress('INVOKE_DEFAULT')
+
+
+class DIVINITYEXPORTER_OT_gr2_conversion_progress(Operator):
+    """Shows the progress of background GR2 conversions. Press Esc to cancel them"""
+    bl_idname = "divinityexporter.gr2_conversion_progress"
+    bl_label = "GR2 Conversion Progress"
+
+    running = False
+
+    def invoke(self, context, event):
+        type(self).running = True
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.2, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            for conversion in conversions:
+                conversion.cancel()
+            return {'RUNNING_MODAL'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        for conversion in conversions:
+            self.report_messages(conversion)
+        for conversion in [c for c in conversions if c.done()]:
+            conversions.remove(conversion)
+            self.report_messages(conversion)
+            self.report_results(conversion)
+
+        if not conversions:
+            self.finish(context)
+            return {'FINISHED'}
+
+        progress = sum(c.progress() for c in conversions) / len(conversions)
+        context.window_manager.progress_update(int(progress * 100))
+        context.workspace.status_text_set("Converting to GR2 ({:.0%}): {} (Esc to cancel)".format(
+            progress, conversions[-1].status))
+        return {'PASS_THROUGH'}
+
+    def cancel(self, context):
+        # Blender drops modal handlers when a file is loaded or the window closes
+        self.finish(context)
+
+    def finish(self, context):
+        type(self).running = False
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+    def report_messages(self, conversion):
+        for type, msg in conversion.pending_messages():
+            if type == "TRACE":
+                helpers.trace(msg)
+            else:
+                self.report({type}, msg)
+
+    def report_results(self, conversion):
+        session = conversion.session
+        if conversion.cancelled:
+            self.report({'WARNING'}, "GR2 conversion was cancelled.")
+            return
+
+        for job in session.failed():
+            if job.error is not None:
+                self.report({'ERROR'}, "{}: {}".format(Path(job.source).name, job.error))
+        if not session.failed():
+            slowest = session.slowest() if len(session.jobs) > 1 else ""
+            self.report({'INFO'}, "Converted {} file(s) to GR2 in {:.2f}s.{}".format(
+                len(session.jobs), session.elapsed, slowest))
+
+
+@persistent
+def cancel_conversions_on_load(*args):
+    # The progress operator won't be there to report on them in the new file
+    for conversion in conversions:
+        conversion.cancel()
+    conversions.clear()
+    DIVINITYEXPORTER_OT_gr2_conversion_progress.running = False
+
+
+classes = (
+    DIVINITYEXPORTER_OT_gr2_conversion_progress,
+)
+
+def register():
+    for cls in classes:
+        register_class(cls)
+    bpy.app.handlers.load_pre.append(cancel_conversions_on_load)
+
+
+def unregister():
+    if cancel_conversions_on_load in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(cancel_conversions_on_load)
+    for conversion in conversions:
+        conversion.cancel()
+    for cls in classes:
+        unregister_class(cls)
@@ -3,7 +3,7 @@ from bpy.props import StringProperty, BoolProperty, PointerProperty, CollectionP
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 from bpy.utils import register_class, unregister_class
 
-from . import operators_dae, helpers, collada, divine
+from . import operators_dae, operators_divine, helpers, collada, conversion_cache, divine
 
 import bpy
 import os
@@ -158,9 +158,19 @@ class DIVINITYEXPORTER_OT_export_gltf(Operator, ExportHelper):
 
         addon_prefs = get_prefs(context)
         invoker = divine.DivineInvoker(addon_prefs, self.divine_settings)
-        if not invoker.export_gr2(str(gltf_path), str(output_path), "glb"):
-            return {"CANCELLED"}
+        invoker.cache = conversion_cache.configure(
+            conversion_cache.export_cache, addon_prefs.conversion_cache_size * 1024 * 1024)
+        if addon_prefs.background_conversion and not bpy.app.background and invoker.check_lslib():
+            job = invoker.export_job(str(gltf_path), str(output_path), "glb", context.scene.ls_properties.game)
+            operators_divine.start_background_conversion(divine.BackgroundConversion(
+                invoker, [job], cleanup=[gltf_path]))
+            helpers.report("Converting to GR2 in the background.", "INFO")
+            return {"FINISHED"}
+
+        converted = invoker.export_gr2(str(gltf_path), str(output_path), "glb", context.scene.ls_properties.game)
         gltf_path.unlink()
+        if not converted:
+            return {"CANCELLED"}
 
         helpers.report("Export completed successfully.", "INFO")
         return {"FINISHED"}
@@ -203,22 +213,40 @@ class DIVINITYEXPORTER_OT_import_gltf(Operator, ImportHelper):
     def really_execute(self, context):
         directory = self.directory
 
+        # Every file starts converting right away, and is imported in order
+        # as soon as its conversion is done
+        gltf_paths = []
         for f in self.files:
-            input_path = Path(os.path.join(directory, f.name))
-
-            addon_prefs = get_prefs(context)
-            invoker = divine.DivineInvoker(addon_prefs, self.divine_settings)
             temp = tempfile.NamedTemporaryFile(suffix=".glb", delete=False)
             temp.close()
-            gltf_path = Path(temp.name)
-            if not invoker.import_gr2(str(input_path), str(gltf_path), "glb"):
-                return {'CANCELLED'}
+            gltf_paths.append(Path(temp.name))
 
-            bpy.ops.import_scene.gltf(filepath=str(gltf_path))
+        addon_prefs = get_prefs(context)
+        invoker = divine.DivineInvoker(addon_prefs, self.divine_settings)
+        invoker.cache = conversion_cache.configure(
+            conversion_cache.import_cache, addon_prefs.import_cache_size * 1024 * 1024)
+        jobs = [invoker.import_job(os.path.join(directory, f.name), str(gltf_path), "glb")
+                for f, gltf_path in zip(self.files, gltf_paths)]
+        converted = invoker.convert_in_order(jobs, addon_prefs.conversion_workers)
 
-            gltf_path.unlink()            
-            helpers.report("Import completed successfully.", "INFO")
+        try:
+            for job, gltf_path in zip(converted, gltf_paths):
+                if not job.success:
+                    gltf_path.unlink()
+                    continue
+
+                bpy.ops.import_scene.gltf(filepath=str(gltf_path))
+
+                gltf_path.unlink()            
+                helpers.report("Import completed successfully.", "INFO")
+        finally:
+            # Stops the conversions that are left if an import failed
+            converted.close()
+            for gltf_path in gltf_paths:
+                gltf_path.unlink(missing_ok=True)
 
+        if not any(job.success for job in jobs):
+            return {'CANCELLED'}
         return {'FINISHED'}
 
 
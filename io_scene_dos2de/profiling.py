@@ -0,0 +1,192 @@
+import cProfile
+import os
+import sys
+import time
+import tracemalloc
+
+MB = 1024 * 1024
+
+
+def process_rss():
+    """Resident memory of the process in bytes, or None if it can't be read."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage",
+                    "QuotaPagedPoolUsage", "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                    "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        psapi = ctypes.windll.psapi
+        kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+        psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None
+        return counters.WorkingSetSize
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # macOS only has the peak through getrusage
+        return None
+
+
+class Stage:
+    """One node of a timing tree. Entering it again adds to the same node."""
+
+    __slots__ = ("name", "seconds", "calls", "children", "timings", "started",
+                 "peak", "rss_delta", "sizes", "traced_start", "window_peak", "rss_start")
+
+    def __init__(self, name, timings):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.children = {}
+        self.timings = timings
+        self.started = None
+        # Memory, only filled in when the timings track it
+        self.peak = 0
+        self.rss_delta = 0
+        self.sizes = {}
+        self.traced_start = 0
+        self.window_peak = 0
+        self.rss_start = None
+
+    def __enter__(self):
+        if self.timings.track_memory:
+            self.enter_memory()
+        self.timings.stack.append(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self.started
+        self.calls += 1
+        self.timings.stack.pop()
+        if self.timings.track_memory:
+            self.exit_memory()
+
+    def enter_memory(self):
+        # The tracemalloc peak is reset for every stage; the parent keeps
+        # the highest value it saw so far, its children's peaks included
+        current, peak = tracemalloc.get_traced_memory()
+        if self.timings.stack:
+            parent = self.timings.stack[-1]
+            parent.window_peak = max(parent.window_peak, peak)
+        tracemalloc.reset_peak()
+        self.traced_start = current
+        self.window_peak = current
+        self.rss_start = process_rss()
+
+    def exit_memory(self):
+        peak = max(self.window_peak, tracemalloc.get_traced_memory()[1])
+        self.peak = max(self.peak, peak - self.traced_start)
+        if self.timings.stack:
+            parent = self.timings.stack[-1]
+            parent.window_peak = max(parent.window_peak, peak)
+        tracemalloc.reset_peak()
+        rss = process_rss()
+        if rss is not None and self.rss_start is not None:
+            self.rss_delta += rss - self.rss_start
+
+    def as_dict(self):
+        result = {
+            "name": self.name,
+            "seconds": self.seconds,
+            "calls": self.calls,
+            "children": [child.as_dict() for child in self.children.values()],
+        }
+        if self.timings.track_memory:
+            result.update(peak=self.peak, rss_delta=self.rss_delta, sizes=dict(self.sizes))
+        return result
+
+
+class StageTimings:
+    """Tree of how long each stage of an export took. A stage entered while
+    another one runs becomes its child; stages with the same name under the
+    same parent are added up. Only meant to be used from the main thread.
+
+    With track_memory, each stage also records how far the memory traced
+    by tracemalloc peaked above where it started, how much the process's
+    resident memory grew, and the sizes of the structures recorded with
+    record_size. tracemalloc only sees Python allocations; Blender's own
+    (copied meshes, evaluated meshes) only show up in the resident memory."""
+
+    __slots__ = ("root", "stack", "track_memory", "started_tracing")
+
+    def __init__(self, name, track_memory=False):
+        self.stack = []
+        self.track_memory = track_memory
+        self.started_tracing = False
+        self.root = Stage(name, self)
+
+    def __enter__(self):
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        return self.root.__enter__()
+
+    def __exit__(self, *exc):
+        self.root.__exit__(*exc)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def record_size(self, name, size):
+        """Records the size of a structure in the current stage; the largest
+        size seen is kept."""
+        stage = self.stack[-1] if self.stack else self.root
+        stage.sizes[name] = max(stage.sizes.get(name, 0), size)
+
+    def stage(self, name):
+        parent = self.stack[-1] if self.stack else self.root
+        child = parent.children.get(name)
+        if child is None:
+            child = parent.children[name] = Stage(name, self)
+        return child
+
+    def lines(self):
+        lines = []
+
+        def add(stage, depth):
+            calls = " ({} calls)".format(stage.calls) if stage.calls > 1 else ""
+            memory = ""
+            if self.track_memory:
+                memory = ", peak +{:.1f} MB, RSS {:+.1f} MB".format(stage.peak / MB, stage.rss_delta / MB)
+                if stage.sizes:
+                    memory += " [{}]".format(", ".join(
+                        "{} {:.1f} MB".format(name, size / MB) for name, size in stage.sizes.items()))
+            lines.append("{}{}: {:.3f}s{}{}".format("  " * depth, stage.name, stage.seconds, calls, memory))
+            for child in stage.children.values():
+                add(child, depth + 1)
+
+        add(self.root, 0)
+        return lines
+
+    def as_dict(self):
+        return self.root.as_dict()
+
+
+class ExportProfile:
+    """Runs cProfile while entered and writes the stats to path on exit;
+    they can be read with pstats."""
+
+    __slots__ = ("path", "profile")
+
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
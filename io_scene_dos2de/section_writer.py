@@ -0,0 +1,179 @@
+import shutil
+import tempfile
+
+# Sections growing past this size are spilled from memory to a temporary file
+DEFAULT_SPOOL_THRESHOLD = 16 * 1024 * 1024
+# Lines are encoded and written in batches of roughly this many characters
+WRITE_BATCH_SIZE = 64 * 1024
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class SectionBuffer:
+    """Spooled, UTF-8 encoded contents of a single Collada section.
+
+    Lines can also be written as tasks that produce them later (see
+    worker_pool); anything written after a task waits behind it, so the
+    section keeps the order lines were written in."""
+
+    __slots__ = ("file", "line_count", "first_line", "last_line", "pending", "pending_size",
+                 "deferred", "spool_threshold")
+
+    def __init__(self, spool_threshold):
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_threshold, mode="w+b")
+        self.spool_threshold = spool_threshold
+        self.line_count = 0
+        self.first_line = None
+        self.last_line = None
+        self.pending = []
+        self.pending_size = 0
+        self.deferred = []
+
+    def write_line(self, line):
+        if self.deferred:
+            self.deferred.append(line)
+        else:
+            self.write_now(line)
+
+    def write_task(self, task):
+        self.deferred.append(task)
+        self.settle(wait=False)
+
+    def settle(self, wait=True):
+        """Writes out deferred lines, up to the first unfinished task unless
+        wait is set."""
+        deferred = self.deferred
+        i = 0
+        while i < len(deferred):
+            item = deferred[i]
+            if isinstance(item, str):
+                self.write_now(item)
+            elif wait or item.done():
+                for line in item.result():
+                    self.write_now(line)
+            else:
+                break
+            i += 1
+        del deferred[:i]
+
+    def write_now(self, line):
+        if self.line_count == 0:
+            self.first_line = line
+        self.last_line = line
+        self.line_count += 1
+
+        self.pending.append(line)
+        self.pending_size += len(line) + 1
+        if self.pending_size >= WRITE_BATCH_SIZE:
+            self.write_pending()
+
+    def flush(self):
+        self.settle()
+        self.write_pending()
+
+    def write_pending(self):
+        if self.pending:
+            self.pending.append("")
+            self.file.write("\n".join(self.pending).encode("utf-8"))
+            self.pending = []
+            self.pending_size = 0
+
+    def append_buffer(self, other):
+        other.settle()
+        if other.line_count == 0:
+            return
+        self.flush()
+        other.copy_to(self.file)
+        if self.line_count == 0:
+            self.first_line = other.first_line
+        self.last_line = other.last_line
+        self.line_count += other.line_count
+
+    def copy_to(self, f):
+        self.flush()
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, f, COPY_BLOCK_SIZE)
+        self.file.seek(0, 2)
+
+    def memory_size(self):
+        """Bytes of the section held in memory, not counting unfinished tasks."""
+        spooled = self.file.tell()
+        # Past the threshold the spooled contents live in a file on disk
+        if self.spool_threshold > 0 and spooled > self.spool_threshold:
+            spooled = 0
+        return spooled + self.pending_size
+
+    def close(self):
+        self.file.close()
+
+
+class SectionWriter:
+    """Collects the output of each section separately and assembles them in
+    section order at the end.
+
+    Section contents are encoded as they are written and kept in memory up to
+    spool_threshold bytes per section; larger sections spill to disk."""
+
+    __slots__ = ("spool_threshold", "sections")
+
+    def __init__(self, spool_threshold=DEFAULT_SPOOL_THRESHOLD):
+        self.spool_threshold = spool_threshold
+        self.sections = {}
+
+    def __contains__(self, section):
+        return section in self.sections
+
+    def keys(self):
+        return list(self.sections.keys())
+
+    def writel(self, section, line):
+        self.buffer(section).write_line(line)
+
+    def buffer(self, section):
+        buf = self.sections.get(section)
+        if buf is None:
+            buf = SectionBuffer(self.spool_threshold)
+            self.sections[section] = buf
+        return buf
+
+    def write_lines(self, section, lines):
+        buf = self.buffer(section)
+        for line in lines:
+            buf.write_line(line)
+
+    def write_task(self, section, task):
+        """Writes the lines task.result() will return at this point of the section."""
+        self.buffer(section).write_task(task)
+
+    def line_count(self, section):
+        buf = self.sections.get(section)
+        if buf is None:
+            return 0
+        buf.settle()
+        return buf.line_count
+
+    def is_empty_element(self, section):
+        """Whether the section only consists of an opening and a closing tag."""
+        buf = self.sections[section]
+        buf.settle()
+        return buf.line_count == 2 and buf.first_line[1:] == buf.last_line[2:]
+
+    def move_section(self, dst, src):
+        """Appends the contents of src to the end of dst and drops src."""
+        buf = self.sections.pop(src)
+        self.buffer(dst).append_buffer(buf)
+        buf.close()
+
+    def remove(self, section):
+        self.sections.pop(section).close()
+
+    def write_to(self, f):
+        for section in sorted(self.sections.keys()):
+            self.sections[section].copy_to(f)
+
+    def memory_size(self):
+        return sum(buf.memory_size() for buf in self.sections.values())
+
+    def close(self):
+        for buf in self.sections.values():
+            buf.close()
+        self.sections = {}
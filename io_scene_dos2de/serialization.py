@@ -0,0 +1,59 @@
+import numpy as np
+
+# Values are formatted in chunks so the temporary Python objects needed by
+# the formatter stay bounded regardless of the payload size.
+CHUNK_SIZE = 1 << 16
+
+# 9 significant digits are enough to round-trip any float32, which is what
+# Blender stores; use 17 for values that were computed in double precision.
+FLOAT32_DIGITS = 9
+FLOAT64_DIGITS = 17
+
+
+def format_values(values, spec):
+    """Formats a flat sequence with a printf-style spec, space separated."""
+    arr = np.asarray(values).ravel()
+    count = len(arr)
+    if count == 0:
+        return ""
+
+    template = " ".join([spec] * min(count, CHUNK_SIZE))
+    if count <= CHUNK_SIZE:
+        return template % tuple(arr.tolist())
+
+    chunks = []
+    for start in range(0, count, CHUNK_SIZE):
+        chunk = arr[start:start + CHUNK_SIZE].tolist()
+        if len(chunk) < CHUNK_SIZE:
+            template = " ".join([spec] * len(chunk))
+        chunks.append(template % tuple(chunk))
+    return " ".join(chunks)
+
+
+def float_array(values, digits=FLOAT32_DIGITS):
+    """Payload of a <float_array>."""
+    return format_values(np.asarray(values, dtype=np.float64), "%.{}g".format(digits))
+
+
+def int_array(values):
+    """Payload of <p>, <vcount> and <v> elements."""
+    return format_values(np.asarray(values, dtype=np.int64), "%d")
+
+
+def matrix_array(matrices, digits=FLOAT32_DIGITS):
+    """Payload of a float4x4 array; takes (N, 4, 4) matrices, written row by row."""
+    return float_array(np.asarray(matrices, dtype=np.float64).reshape(-1, 16), digits)
+
+
+def matrix(mtx, digits=FLOAT32_DIGITS):
+    """Payload of a single <matrix> or <bind_shape_matrix>."""
+    return matrix_array([mtx], digits)
+
+
+def name_array(names):
+    """Payload of a <Name_array>."""
+    return " ".join(names)
+
+
+def repeated_name(name, count):
+    return " ".join([name] * count)
@@ -0,0 +1,140 @@
+import concurrent.futures
+import multiprocessing
+import os
+import runpy
+from concurrent.futures.process import BrokenProcessPool
+
+from . import helpers
+
+# Work smaller than this many values is done on the calling thread; sending
+# the arrays to a worker and the text back would cost more than it saves
+MIN_PARALLEL_VALUES = 50000
+
+# Sets up the workers without importing the package. Workers run it by path,
+# since the pool may spawn them at any time and sys.path is shared with every
+# other addon in the session
+WORKER_INIT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workers", "dos2de_format_worker.py")
+
+_executor = None
+_executor_workers = 0
+# Set once the pool failed; later exports don't try again
+_pool_broken = False
+
+
+def default_worker_count():
+    return max(1, min((os.cpu_count() or 1) - 1, 8))
+
+
+def mark_broken(e):
+    global _pool_broken
+    helpers.trace("Worker pool unavailable, formatting serially: {}".format(e))
+    _pool_broken = True
+    shutdown()
+
+
+def get_executor(workers):
+    """Returns the shared process pool, (re)creating it for the given size.
+
+    The pool is kept between exports since starting workers is slow."""
+    global _executor, _executor_workers
+    if _executor is not None and _executor_workers != workers:
+        shutdown()
+    if _executor is None:
+        _executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=runpy.run_path,
+            initargs=(WORKER_INIT, {
+                "ADDON_PACKAGE": __package__,
+                "ADDON_PATH": os.path.dirname(os.path.abspath(__file__)),
+            }))
+        _executor_workers = workers
+    return _executor
+
+
+def shutdown():
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        _executor_workers = 0
+
+
+class Completed:
+    """A task that was run on the calling thread."""
+
+    __slots__ = ("value", )
+
+    def __init__(self, value):
+        self.value = value
+
+    def done(self):
+        return True
+
+    def result(self):
+        return self.value
+
+
+class Task:
+    """A task running in the worker pool.
+
+    If the pool breaks, the task is run again on the calling thread, which
+    gives the same result, and the pool formats serially from then on."""
+
+    __slots__ = ("future", "fn", "args", "pool")
+
+    def __init__(self, future, fn, args, pool):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.pool = pool
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        try:
+            return self.future.result()
+        except BrokenProcessPool as e:
+            mark_broken(e)
+            self.pool.workers = 1
+            return self.fn(*self.args)
+
+
+class Mapped:
+    """Applies fn to the result of another task once it is collected."""
+
+    __slots__ = ("task", "fn")
+
+    def __init__(self, task, fn):
+        self.task = task
+        self.fn = fn
+
+    def done(self):
+        return self.task.done()
+
+    def result(self):
+        return self.fn(self.task.result())
+
+
+class FormatPool:
+    """Runs serialization work in worker processes.
+
+    With one worker, or for small inputs, everything runs serially on the
+    calling thread; the results are the same either way."""
+
+    __slots__ = ("workers", )
+
+    def __init__(self, workers):
+        self.workers = workers if workers > 0 else default_worker_count()
+        if _pool_broken:
+            self.workers = 1
+
+    def submit(self, value_count, fn, *args):
+        if self.workers > 1 and value_count >= MIN_PARALLEL_VALUES:
+            try:
+                return Task(get_executor(self.workers).submit(fn, *args), fn, args, self)
+            except (BrokenProcessPool, OSError, RuntimeError, ImportError) as e:
+                mark_broken(e)
+                self.workers = 1
+        return Completed(fn(*args))
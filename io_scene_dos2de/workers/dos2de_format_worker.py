@@ -0,0 +1,20 @@
+"""Initializer of the export worker processes.
+
+This script sits outside the addon package and only uses the standard
+library. Spawned workers run it with runpy.run_path, so they neither need
+its directory on sys.path nor run the package __init__, which needs bpy.
+
+run_path passes in ADDON_PACKAGE and ADDON_PATH, the name and directory of
+the addon package.
+"""
+
+import sys
+import types
+
+# Addon modules are imported as submodules of a stand-in package, like
+# benchmarks/common.py does outside of Blender
+package = globals()["ADDON_PACKAGE"]
+if package not in sys.modules:
+    module = types.ModuleType(package)
+    module.__path__ = [globals()["ADDON_PATH"]]
+    sys.modules[package] = module
@@ -0,0 +1,13 @@
+"""The tests run with a plain Python interpreter: the addon package is
+stood in for so its __init__, which needs bpy, isn't run. Only modules that
+don't import bpy themselves can be tested this way."""
+
+import os
+import sys
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "io_scene_dos2de" not in sys.modules:
+    package = types.ModuleType("io_scene_dos2de")
+    package.__path__ = [os.path.join(REPO_DIR, "io_scene_dos2de")]
+    sys.modules["io_scene_dos2de"] = package
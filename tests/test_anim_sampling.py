@@ -0,0 +1,226 @@
+"""Direct pose sampling: rotation conversions and the bone matrices written
+for each frame, compared with what the frame_set path computes."""
+
+import importlib
+import math
+
+import numpy as np
+import pytest
+
+anim_sampling = importlib.import_module("io_scene_dos2de.anim_sampling")
+
+QUARTER = math.pi / 2
+ROT_X = np.array([[1, 0, 0], [0, 0, -1], [0, 1, 0]], dtype=np.float64)
+ROT_Y = np.array([[0, 0, 1], [0, 1, 0], [-1, 0, 0]], dtype=np.float64)
+ROT_Z = np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]], dtype=np.float64)
+EULER_ORDERS = ["XYZ", "XZY", "YXZ", "YZX", "ZXY", "ZYX"]
+
+
+@pytest.mark.parametrize("axis, expected", [(0, ROT_X), (1, ROT_Y), (2, ROT_Z)])
+def test_euler_quarter_turns(axis, expected):
+    euler = np.zeros((1, 3))
+    euler[0, axis] = QUARTER
+    for order in EULER_ORDERS:
+        np.testing.assert_allclose(anim_sampling.euler_to_matrix(euler, order)[0], expected, atol=1e-12)
+
+
+@pytest.mark.parametrize("order, expected", [
+    # The first axis of the order is applied first
+    ("XYZ", ROT_Z @ ROT_X),
+    ("ZYX", ROT_X @ ROT_Z),
+    ("XZY", ROT_Z @ ROT_X),
+    ("ZXY", ROT_X @ ROT_Z),
+])
+def test_euler_order(order, expected):
+    euler = np.array([[QUARTER, 0.0, QUARTER]])
+    np.testing.assert_allclose(anim_sampling.euler_to_matrix(euler, order)[0], expected, atol=1e-12)
+
+
+def quaternion_product(a, b):
+    aw, ax, ay, az = a
+    bw, bx, by, bz = b
+    return (aw * bw - ax * bx - ay * by - az * bz,
+            aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw)
+
+
+@pytest.mark.parametrize("order", EULER_ORDERS)
+def test_euler_matches_quaternions(order):
+    euler = np.array([[0.3, -1.2, 2.5], [0.0, 0.0, 0.0], [3.0, 0.1, -0.7]])
+    expected = []
+    for angles in euler:
+        # Rotating by each axis in turn is the product of their quaternions
+        q = (1.0, 0.0, 0.0, 0.0)
+        for axis in order:
+            angle = angles["XYZ".index(axis)]
+            axis_q = [math.cos(angle / 2), 0.0, 0.0, 0.0]
+            axis_q[1 + "XYZ".index(axis)] = math.sin(angle / 2)
+            q = quaternion_product(axis_q, q)
+        expected.append(q)
+    np.testing.assert_allclose(anim_sampling.euler_to_matrix(euler, order),
+                               anim_sampling.quaternion_to_matrix(np.array(expected)), atol=1e-12)
+
+
+def test_quaternions():
+    half = math.sqrt(0.5)
+    q = np.array([
+        [1.0, 0.0, 0.0, 0.0],
+        [half, half, 0.0, 0.0],
+        [half, 0.0, half, 0.0],
+        [half, 0.0, 0.0, half],
+        # Not normalized, and the same rotation with the opposite sign
+        [0.0, 0.0, 0.0, 3.0],
+        [-half, 0.0, 0.0, -half],
+        # Zero quaternions are the identity, like in Blender
+        [0.0, 0.0, 0.0, 0.0],
+    ])
+    expected = [np.eye(3), ROT_X, ROT_Y, ROT_Z, ROT_Z @ ROT_Z, ROT_Z, np.eye(3)]
+    np.testing.assert_allclose(anim_sampling.quaternion_to_matrix(q), expected, atol=1e-12)
+
+
+def test_axis_angles():
+    axis_angle = np.array([
+        [QUARTER, 1.0, 0.0, 0.0],
+        [QUARTER, 0.0, 1.0, 0.0],
+        [QUARTER, 0.0, 0.0, 5.0],
+        [-QUARTER, 0.0, 0.0, -1.0],
+        [math.pi, 0.0, 0.0, 1.0],
+        # No axis, no rotation
+        [1.0, 0.0, 0.0, 0.0],
+    ])
+    expected = [ROT_X, ROT_Y, ROT_Z, ROT_Z, ROT_Z @ ROT_Z, np.eye(3)]
+    np.testing.assert_allclose(anim_sampling.axis_angle_to_matrix(axis_angle), expected, atol=1e-12)
+
+
+class Bones(list):
+    """Bone collection that can be indexed by name, like bpy_prop_collection."""
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return next(bone for bone in self if bone.name == key)
+        return list.__getitem__(self, key)
+
+
+class Bone:
+    def __init__(self, name, parent, head):
+        self.name = name
+        self.parent = parent
+        self.children = []
+        if parent is not None:
+            parent.children.append(self)
+        # Rest poses with a rotation, so the rest matrices don't commute
+        self.matrix_local = np.eye(4)
+        self.matrix_local[:3, :3] = ROT_Z if parent is None else ROT_X @ parent.matrix_local[:3, :3]
+        self.matrix_local[:3, 3] = head
+
+
+class PoseBone:
+    def __init__(self, name, rotation_mode="XYZ"):
+        self.name = name
+        self.rotation_mode = rotation_mode
+        self.location = (0.0, 0.0, 0.0)
+        self.rotation_quaternion = (1.0, 0.0, 0.0, 0.0)
+        self.rotation_euler = (0.0, 0.0, 0.0)
+        self.rotation_axis_angle = (0.0, 0.0, 1.0, 0.0)
+        self.scale = (1.0, 1.0, 1.0)
+
+
+class FCurve:
+    """An F-Curve without keyframes, which the sampler evaluates frame by frame."""
+
+    def __init__(self, bone, prop, index, fn):
+        self.data_path = 'pose.bones["{}"].{}'.format(bone, prop)
+        self.array_index = index
+        self.mute = False
+        self.keyframe_points = []
+        self.evaluate = fn
+
+
+class Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def make_armature():
+    """root -> hidden -> child -> tip, plus root -> side. The hidden bone
+    isn't exported, and child is scaled to zero on some frames."""
+    root = Bone("root", None, (0.0, 0.0, 0.0))
+    hidden = Bone("hidden", root, (0.0, 1.0, 0.0))
+    child = Bone("child", hidden, (0.5, 2.0, 0.0))
+    tip = Bone("tip", child, (0.5, 3.0, 0.25))
+    side = Bone("side", root, (1.0, 0.0, 0.0))
+    bones = Bones([root, hidden, child, tip, side])
+
+    pose_bones = Bones([PoseBone("root"), PoseBone("hidden", "QUATERNION"), PoseBone("child", "ZXY"),
+                        PoseBone("tip", "AXIS_ANGLE"), PoseBone("side")])
+    pose_bones["hidden"].rotation_quaternion = (0.9, 0.1, 0.3, -0.2)
+    pose_bones["tip"].rotation_axis_angle = (0.7, 1.0, 2.0, 0.5)
+    pose_bones["side"].scale = (1.0, 2.0, 0.5)
+
+    fcurves = [
+        FCurve("root", "location", 0, lambda frame: 0.1 * frame),
+        FCurve("root", "rotation_euler", 2, lambda frame: 0.2 * frame),
+        FCurve("hidden", "location", 1, lambda frame: -0.3 * frame),
+        FCurve("child", "rotation_euler", 0, lambda frame: 0.5 - 0.1 * frame),
+        FCurve("child", "scale", 1, lambda frame: 0.0 if frame in (2, 4) else 1.0 + 0.1 * frame),
+        FCurve("tip", "scale", 0, lambda frame: 1.0 + 0.05 * frame),
+    ]
+    obj = Namespace(
+        data=Namespace(bones=bones),
+        pose=Namespace(bones=pose_bones),
+        animation_data=Namespace(action=Namespace(fcurves=fcurves)))
+    return obj
+
+
+def rotation_matrix(pose_bone):
+    mode = pose_bone.rotation_mode
+    if mode == "QUATERNION":
+        return anim_sampling.quaternion_to_matrix(np.array([pose_bone.rotation_quaternion]))[0]
+    if mode == "AXIS_ANGLE":
+        return anim_sampling.axis_angle_to_matrix(np.array([pose_bone.rotation_axis_angle]))[0]
+    return anim_sampling.euler_to_matrix(np.array([pose_bone.rotation_euler]), mode)[0]
+
+
+def frame_set(obj, frame):
+    """Evaluates the action into the pose bones, like scene.frame_set."""
+    for fcurve in obj.animation_data.action.fcurves:
+        bone, prop = anim_sampling.parse_pose_bone_path(fcurve.data_path)
+        pose_bone = obj.pose.bones[bone]
+        values = list(getattr(pose_bone, prop))
+        values[fcurve.array_index] = fcurve.evaluate(frame)
+        setattr(pose_bone, prop, tuple(values))
+
+
+def pose_matrix(obj, bone):
+    """PoseBone.matrix for bones that fully inherit their parent's transform."""
+    pose_bone = obj.pose.bones[bone.name]
+    basis = np.eye(4)
+    basis[:3, :3] = rotation_matrix(pose_bone) * np.array(pose_bone.scale)
+    basis[:3, 3] = pose_bone.location
+    if bone.parent is None:
+        return bone.matrix_local @ basis
+    return pose_matrix(obj, bone.parent) @ np.linalg.inv(bone.parent.matrix_local) @ bone.matrix_local @ basis
+
+
+def test_bone_matrices_match_frame_set():
+    frames = np.arange(6, dtype=np.float64)
+    exported_parent = {"root": None, "child": "root", "tip": "child", "side": "root"}
+    armature_xform = np.eye(4)
+    armature_xform[:3, :3] = ROT_X * 2.0
+    armature_xform[:3, 3] = (1.0, -2.0, 3.0)
+
+    sampled = anim_sampling.PoseSampler(make_armature(), frames).bone_matrices(exported_parent, armature_xform)
+    assert set(sampled) == set(exported_parent)
+
+    # What export_animation writes per frame after scene.frame_set
+    obj = make_armature()
+    for i, frame in enumerate(frames):
+        frame_set(obj, frame)
+        for name, parent in exported_parent.items():
+            matrix = pose_matrix(obj, obj.data.bones[name])
+            if parent is None or 0.0 in obj.pose.bones[parent].scale:
+                expected = armature_xform @ matrix
+            else:
+                expected = np.linalg.inv(pose_matrix(obj, obj.data.bones[parent])) @ matrix
+            np.testing.assert_allclose(sampled[name][i], expected, atol=1e-9, err_msg="{} at {}".format(name, frame))
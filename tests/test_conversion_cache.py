@@ -0,0 +1,90 @@
+"""The conversion cache: keys of exported DAE files and its size bookkeeping."""
+
+import importlib
+import os
+
+conversion_cache = importlib.import_module("io_scene_dos2de.conversion_cache")
+divine = importlib.import_module("io_scene_dos2de.divine")
+
+DAE = """<?xml version="1.0" encoding="utf-8"?>
+<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">
+<asset>
+\t<contributor>
+\t\t<author></author>
+\t</contributor>
+\t<created>{time}</created>
+\t<modified>{time}</modified>
+\t<unit meter="1.0" name="meter"/>
+\t<up_axis>Y_UP</up_axis>
+</asset>
+<library_geometries>
+\t<geometry id="{mesh}-mesh" name="{mesh}"/>
+</library_geometries>
+</COLLADA>
+"""
+
+
+def export(tmp_path, name, time, mesh="Body"):
+    path = tmp_path / name
+    path.write_text(DAE.format(time=time, mesh=mesh), encoding="utf-8")
+    return divine.ConversionJob(path, tmp_path / (name + ".gr2"), "dae", "gr2", "dos2de", ["-e", "flip-uvs"])
+
+
+def test_consecutive_exports_share_a_key(tmp_path):
+    divine_path = tmp_path / "divine.exe"
+    divine_path.write_bytes(b"")
+    cache = conversion_cache.ConversionCache(tmp_path / "cache")
+
+    first = export(tmp_path, "first.dae", "2024-05-01T10:00:00Z")
+    second = export(tmp_path, "second.dae", "2024-05-01T10:00:07Z")
+    changed = export(tmp_path, "changed.dae", "2024-05-01T10:00:07Z", mesh="Head")
+
+    key = cache.key(first, divine_path)
+    assert cache.key(second, divine_path) == key
+    assert cache.key(changed, divine_path) != key
+
+
+def write_output(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return path
+
+
+def test_stats_list_the_directory_once(tmp_path, monkeypatch):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    (directory / "old").write_bytes(b"x" * 10)
+    cache = conversion_cache.ConversionCache(directory, max_bytes=1000)
+
+    listings = []
+    entries = conversion_cache.ConversionCache.entries
+    monkeypatch.setattr(conversion_cache.ConversionCache, "entries",
+                        lambda self: listings.append(1) or entries(self))
+
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["size"] == 10
+    cache.store("a", write_output(tmp_path, "a.gr2", 100))
+    cache.store("a", write_output(tmp_path, "a.gr2", 50))
+    cache.store("b", write_output(tmp_path, "b.gr2", 200))
+    stats = cache.stats()
+    assert (stats["entries"], stats["size"]) == (3, 260)
+    assert len(listings) == 1
+
+
+def test_stats_follow_eviction_and_clear(tmp_path):
+    cache = conversion_cache.ConversionCache(tmp_path / "cache", max_bytes=250)
+    cache.store("a", write_output(tmp_path, "a.gr2", 100))
+    os.utime(cache.entry_path("a"), ns=(0, 0))
+    cache.store("b", write_output(tmp_path, "b.gr2", 100))
+    cache.store("c", write_output(tmp_path, "c.gr2", 100))
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["size"], stats["evictions"]) == (2, 200, 1)
+    assert not cache.entry_path("a").exists()
+
+    cache.resize(150)
+    assert (cache.stats()["entries"], cache.stats()["size"]) == (1, 100)
+
+    cache.clear()
+    assert (cache.stats()["entries"], cache.stats()["size"]) == (0, 0)
+    assert list((tmp_path / "cache").iterdir()) == []
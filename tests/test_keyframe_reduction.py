@@ -0,0 +1,136 @@
+"""Reduction of baked animation keys."""
+
+import importlib
+import math
+
+import numpy as np
+
+keyframe_reduction = importlib.import_module("io_scene_dos2de.keyframe_reduction")
+
+TOLERANCE = keyframe_reduction.Tolerance()
+
+
+def transforms(translation=None, angle=None, scale=None, count=None):
+    """(N, 4, 4) transforms from per-key translations, angles about Z and scales."""
+    count = count or len(next(v for v in (translation, angle, scale) if v is not None))
+    matrices = np.tile(np.eye(4), (count, 1, 1))
+    if angle is not None:
+        c = np.cos(angle)
+        s = np.sin(angle)
+        matrices[:, 0, 0] = c
+        matrices[:, 0, 1] = -s
+        matrices[:, 1, 0] = s
+        matrices[:, 1, 1] = c
+    if scale is not None:
+        matrices[:, :3, :3] *= np.asarray(scale, dtype=np.float64)[:, None, :]
+    if translation is not None:
+        matrices[:, :3, 3] = translation
+    return matrices
+
+
+def rotation_angle(a, b):
+    """Angle of the rotation between two proper rotation matrices."""
+    cos = (np.trace(a.T @ b) - 1) / 2
+    return math.acos(min(max(cos, -1.0), 1.0))
+
+
+def assert_rebuilt_within_tolerance(times, matrices, keep):
+    """Rebuilds every dropped key from the kept keys around it, the way the
+    reduction assumes the game interpolates them."""
+    translation, rotation, scale = keyframe_reduction.decompose(matrices)
+    for start, end in zip(keep[:-1], keep[1:]):
+        for i in range(start + 1, end):
+            u = (times[i] - times[start]) / (times[end] - times[start])
+            t = translation[start] + (translation[end] - translation[start]) * u
+            s = scale[start] + (scale[end] - scale[start]) * u
+            q = rotation[start] + (rotation[end] - rotation[start]) * u
+            w, x, y, z = q / np.linalg.norm(q)
+            rebuilt = np.array([
+                [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+                [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+                [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+            ])
+            basis = matrices[i, :3, :3] / scale[i]
+
+            assert np.linalg.norm(t - matrices[i, :3, 3]) <= TOLERANCE.translation
+            assert np.abs(s - scale[i]).max() <= TOLERANCE.scale
+            assert rotation_angle(rebuilt, basis) <= TOLERANCE.rotation + 1e-9
+
+
+def test_short_channels_are_kept():
+    matrices = transforms(translation=np.zeros((2, 3)))
+    assert keyframe_reduction.reduce_keys([0, 1], matrices, TOLERANCE).tolist() == [0, 1]
+
+
+def test_constant_channel_keeps_first_and_last_key():
+    matrices = transforms(translation=np.tile([1.0, 2.0, 3.0], (30, 1)), angle=np.full(30, 0.7),
+                          scale=np.tile([1.0, 2.0, 0.5], (30, 1)))
+    assert keyframe_reduction.reduce_keys(np.arange(30), matrices, TOLERANCE).tolist() == [0, 29]
+
+
+def test_linear_translation_keeps_two_keys():
+    times = np.arange(40, dtype=np.float64)
+    matrices = transforms(translation=np.outer(times, [0.5, -1.0, 0.25]))
+    assert keyframe_reduction.reduce_keys(times, matrices, TOLERANCE).tolist() == [0, 39]
+
+
+def test_translation_corner_is_kept():
+    times = np.arange(21, dtype=np.float64)
+    translation = np.zeros((21, 3))
+    translation[:, 0] = np.minimum(times, 10)
+    keep = keyframe_reduction.reduce_keys(times, transforms(translation=translation), TOLERANCE)
+    assert keep.tolist() == [0, 10, 20]
+
+
+def test_rotation_sweep_stays_within_tolerance():
+    # Interpolating quaternions linearly doesn't keep a constant angular
+    # velocity, so a sweep needs keys in between
+    times = np.arange(61, dtype=np.float64)
+    matrices = transforms(angle=np.linspace(0.0, math.pi, 61))
+    keep = keyframe_reduction.reduce_keys(times, matrices, TOLERANCE)
+    assert keep[0] == 0 and keep[-1] == 60
+    assert 2 < len(keep) < 61
+    assert_rebuilt_within_tolerance(times, matrices, keep)
+
+
+def test_mirrored_scale():
+    count = 20
+    scale = np.tile([-1.0, 1.0, 1.0], (count, 1))
+    matrices = transforms(angle=np.full(count, 0.3), scale=scale)
+    translation, rotation, decomposed_scale = keyframe_reduction.decompose(matrices)
+    np.testing.assert_allclose(decomposed_scale, scale)
+    assert keyframe_reduction.reduce_keys(np.arange(count), matrices, TOLERANCE).tolist() == [0, count - 1]
+
+
+def test_zero_scale():
+    times = np.arange(15, dtype=np.float64)
+    scale = np.ones((15, 3))
+    scale[5:10] = 0.0
+    matrices = transforms(angle=np.full(15, 0.3), scale=scale)
+
+    translation, rotation, decomposed_scale = keyframe_reduction.decompose(matrices)
+    assert np.isfinite(rotation).all()
+    np.testing.assert_allclose(decomposed_scale, scale)
+
+    keep = keyframe_reduction.reduce_keys(times, matrices, TOLERANCE)
+    # The jumps to and from zero can't be interpolated away
+    assert {4, 5, 9, 10} <= set(keep.tolist())
+    rebuilt = np.interp(times, times[keep], scale[keep, 0])
+    assert np.abs(rebuilt - scale[:, 0]).max() <= TOLERANCE.scale
+
+
+def test_quaternion_sign_flip():
+    # A full turn crosses the point where q and -q swap, which would make
+    # a naive interpolation take the long way around
+    times = np.arange(73, dtype=np.float64)
+    matrices = transforms(angle=np.linspace(0.0, 2 * math.pi, 73))
+    _, rotation, _ = keyframe_reduction.decompose(matrices)
+    assert (np.einsum("ij,ij->i", rotation[1:], rotation[:-1]) > 0).all()
+
+    keep = keyframe_reduction.reduce_keys(times, matrices, TOLERANCE)
+    assert_rebuilt_within_tolerance(times, matrices, keep)
+
+    # Matrices don't carry the sign, so a constant half turn must not
+    # look like it alternates
+    half_turn = transforms(angle=np.full(10, math.pi))
+    assert keyframe_reduction.reduce_keys(np.arange(10), half_turn, TOLERANCE).tolist() == [0, 9]